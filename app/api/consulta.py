@@ -7,9 +7,11 @@ import pytz
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.auditoria import Auditoria
 from app.schemas.consulta import ConsultaCreate, ConsultaUpdate, ConsultaResponse
-from app.services.consulta import get_consulta, get_consultas, create_consulta, update_consulta, delete_consulta
+from app.schemas.datatables import DataTableParams
+from app.services.consulta import get_consulta, get_consultas_datatable, has_consultas, create_consulta, update_consulta, delete_consulta
 from app.services.usuario import get_users, get_user
-from app.services.paciente import get_pacientes
+from app.services.pre_geracao import pre_geracao, pre_gerar_relatorio
+from app.services.relatorio import get_estado_relatorio_consulta
 from app.core.deps import get_db
 from app.core.dependencies import get_current_user
 from app.models.relatorio import Usuario
@@ -25,19 +27,53 @@ async def read_consultas(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        consultas = await get_consultas(db)
-        if not consultas:
+        if not await has_consultas(db):
             request.session.setdefault("notifications", []).append("Criar Consultas.")
             return RedirectResponse(url="/consultas/create", status_code=status.HTTP_303_SEE_OTHER)
         else:
+            # As linhas são carregadas pelo DataTables através de /consultas/datatable
             return templates.TemplateResponse(
                 "/consulta/list_consulta.html",
-                {"request": request, "consultas": consultas, "current_user": current_user}
+                {"request": request, "current_user": current_user}
             )
     else:
         request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
 
+@router.get("/datatable")
+async def consultas_datatable(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        try:
+            params = DataTableParams.from_query(request.query_params)
+            pagina = await get_consultas_datatable(db, params)
+        except ValueError:
+            return JSONResponse(content={"status": "error", "message": "Parâmetros inválidos."}, status_code=400)
+
+        return {
+            "draw": params.draw,
+            "recordsTotal": pagina.total,
+            "recordsFiltered": pagina.filtered,
+            "next_cursor": pagina.next_cursor,
+            "prev_cursor": pagina.prev_cursor,
+            "data": [
+                {
+                    "id": consulta.id,
+                    "tipo": consulta.tipo,
+                    "paciente": consulta.paciente_nome or "",
+                    "medico": consulta.medico_nome or "",
+                    "estado_relatorio": consulta.estado_relatorio,
+                    "data_criacao": consulta.data_criacao.strftime('%d/%m/%Y %H:%M') if consulta.data_criacao else "",
+                }
+                for consulta in pagina.items
+            ],
+        }
+    else:
+        return JSONResponse(content={"status": "admin"})
+
 @router.get("/details/{consulta_id}")
 async def consulta_details(
     consulta_id: str,
@@ -56,6 +92,7 @@ async def consulta_details(
             "data_criacao": consulta.data_criacao,
             "diagnostico": consulta.diagnostico,
             "prescricoes": consulta.prescricoes,
+            "estado_relatorio": await get_estado_relatorio_consulta(db, consulta_id),
             "paciente": {
                 "nome_completo": consulta.paciente.nome_completo,
                 "data_nascimento": consulta.paciente.data_nascimento,
@@ -76,8 +113,8 @@ async def create_consulta_form(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        pacientes = await get_pacientes(db)
-        return templates.TemplateResponse("/consulta/create_consulta.html", {"request": request, "pacientes": pacientes, "current_user": current_user})
+        # Os pacientes são pesquisados à medida que se escreve (/pacientes/search)
+        return templates.TemplateResponse("/consulta/create_consulta.html", {"request": request, "current_user": current_user})
     else:
         request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
@@ -112,6 +149,7 @@ async def criar_consulta(
             db.add(db_log)
             await db.commit()
             await db.refresh(db_log)
+            pre_gerar_relatorio(created_consulta.id, current_user.id)
             
             if "notifications" not in request.session:
                 request.session["notifications"] = []
@@ -191,6 +229,8 @@ async def editing_consulta(
             db.add(db_log)
             await db.commit()
             await db.refresh(db_log)
+            # Nova edição: a pré-geração anterior é cancelada e a espera recomeça
+            pre_gerar_relatorio(updated_consulta.id, current_user.id)
             
             if "notifications" not in request.session:
                 request.session["notifications"] = []
@@ -226,6 +266,7 @@ async def deletar_consulta(
             db.add(db_log)
             await db.commit()
             await db.refresh(db_log)
+            pre_geracao.cancelar(consulta_id)
             
             return JSONResponse(content={"status": "ok"}, status_code=status.HTTP_200_OK)
         else:
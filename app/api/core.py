@@ -3,15 +3,17 @@ from fastapi import APIRouter, Depends, Request, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import selectinload
 from sqlalchemy import func, extract
-from sqlalchemy.future import select
 from collections import defaultdict
 from app.core.deps import get_db
 from app.core.dependencies import get_current_user
 from app.models.relatorio import Usuario, Paciente
-from app.models.auditoria import Auditoria
 from app.schemas.auditoria import AuditoriaResponse
+from app.services.auditoria import get_auditorias_page
+from app.services.uso import resumo_uso
+from app.core import metricas
+from typing import Optional
 from decimal import Decimal
 
 
@@ -27,14 +29,15 @@ async def dashboard(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        
-        
+        # Uso do modelo (tokens, gerações, latência) só para administradores
+        uso = await resumo_uso(db) if current_user.role == "Administrador" else None
 
         return templates.TemplateResponse(
             "core/dashboard.html",
             {
                 "request": request,
-                "current_user": current_user
+                "current_user": current_user,
+                "uso": uso,
             }
         )
     else:
@@ -49,25 +52,25 @@ async def dashboard(
 @router.get("/auditoria", response_model=list[AuditoriaResponse])
 async def list_auditoria(
     request: Request,
+    cursor: Optional[str] = None,
+    direction: str = "next",
     db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador"]:
-        query = (
-            select(Auditoria)
-            .options(
-                joinedload(Auditoria.usuario)
-            )
-        )
-        result = await db.execute(query)
-        auditorias = result.unique().scalars().all()
+        try:
+            pagina = await get_auditorias_page(db, cursor=cursor, direction=direction)
+        except ValueError:
+            request.session.setdefault("notifications", []).append("Página inválida.")
+            return RedirectResponse(url="/core/auditoria", status_code=status.HTTP_303_SEE_OTHER)
 
         
         return templates.TemplateResponse(
             "/core/list_auditoria.html",
             {
                 "request": request,
-                "auditorias": auditorias,
+                "auditorias": pagina.items,
+                "pagina": pagina,
                 "current_user": current_user,
             },
         )
@@ -80,6 +83,16 @@ async def list_auditoria(
         )
 
 
+@router.get("/metricas")
+async def ler_metricas(
+    request: Request,
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.role in ["Administrador"]:
+        return metricas.recolher()
+    else:
+        return {"status": "admin"}
+
 @router.post("/clear-notifications")
 async def clear_notifications(request: Request):
     request.session.pop("notifications", None)
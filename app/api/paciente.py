@@ -7,8 +7,8 @@ import pytz
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.auditoria import Auditoria
 from app.schemas.paciente import PacienteCreate, PacienteResponse, PacienteUpdate
-from app.services.paciente import get_paciente, get_pacientes, create_paciente, update_paciente, delete_paciente
-from app.services.usuario import get_users
+from app.schemas.datatables import DataTableParams
+from app.services.paciente import get_paciente, get_paciente_by_bi, get_paciente_by_email, get_pacientes_datatable, has_pacientes, search_pacientes, create_paciente, update_paciente, delete_paciente
 from app.core.deps import get_db
 from app.core.dependencies import get_current_user
 from app.models.relatorio import Usuario
@@ -24,19 +24,67 @@ async def read_pacientes(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        pacientes = await get_pacientes(db)
-        if not pacientes:
+        if not await has_pacientes(db):
             request.session.setdefault("notifications", []).append("Criar Pacientes.")
             return RedirectResponse(url="/pacientes/create", status_code=status.HTTP_303_SEE_OTHER)
         else:
+            # As linhas são carregadas pelo DataTables através de /pacientes/datatable
             return templates.TemplateResponse(
                 "/paciente/list_paciente.html",
-                {"request": request, "pacientes": pacientes, "current_user": current_user}
+                {"request": request, "current_user": current_user}
             )
     else:
         request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
 
+@router.get("/datatable")
+async def pacientes_datatable(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        try:
+            params = DataTableParams.from_query(request.query_params)
+            pagina = await get_pacientes_datatable(db, params)
+        except ValueError:
+            return JSONResponse(content={"status": "error", "message": "Parâmetros inválidos."}, status_code=400)
+
+        return {
+            "draw": params.draw,
+            "recordsTotal": pagina.total,
+            "recordsFiltered": pagina.filtered,
+            "next_cursor": pagina.next_cursor,
+            "prev_cursor": pagina.prev_cursor,
+            "data": [
+                {
+                    "id": paciente.id,
+                    "nome_completo": paciente.nome_completo,
+                    "data_nascimento": paciente.data_nascimento.strftime('%d/%m/%Y'),
+                    "bi": paciente.bi,
+                    "telefone": paciente.telefone,
+                }
+                for paciente in pagina.items
+            ],
+        }
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.get("/search")
+async def pesquisar_pacientes(
+    q: str = "",
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        pacientes = await search_pacientes(db, q)
+        return [
+            {"id": paciente.id, "nome_completo": paciente.nome_completo, "bi": paciente.bi}
+            for paciente in pacientes
+        ]
+    else:
+        return JSONResponse(content={"status": "admin"})
+
 @router.get("/details/{paciente_id}")
 async def paciente_details(
     paciente_id: str,
@@ -80,8 +128,7 @@ async def create_paciente_form(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        usuarios = await get_users(db)
-        return templates.TemplateResponse("/paciente/create_paciente.html", {"request": request, "usuarios": usuarios, "current_user": current_user})
+        return templates.TemplateResponse("/paciente/create_paciente.html", {"request": request, "current_user": current_user})
     else:
         request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
@@ -100,6 +147,13 @@ async def criar_paciente(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
+        if await get_paciente_by_bi(db, bi):
+            request.session.setdefault("notifications", []).append("Já existe um paciente com este BI.")
+            return RedirectResponse(url="/pacientes/create", status_code=status.HTTP_303_SEE_OTHER)
+        if correio and await get_paciente_by_email(db, correio):
+            request.session.setdefault("notifications", []).append("Já existe um paciente com este correio.")
+            return RedirectResponse(url="/pacientes/create", status_code=status.HTTP_303_SEE_OTHER)
+
         paciente_data = PacienteCreate(
             nome_completo=nome_completo,
             data_nascimento=data_nascimento,
@@ -181,6 +235,15 @@ async def editing_paciente(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
+        existente = await get_paciente_by_bi(db, bi)
+        if existente and existente.id != paciente_id:
+            request.session.setdefault("notifications", []).append("Já existe um paciente com este BI.")
+            return RedirectResponse(url=f"/pacientes/edit/{paciente_id}", status_code=status.HTTP_303_SEE_OTHER)
+        existente = await get_paciente_by_email(db, correio) if correio else None
+        if existente and existente.id != paciente_id:
+            request.session.setdefault("notifications", []).append("Já existe um paciente com este correio.")
+            return RedirectResponse(url=f"/pacientes/edit/{paciente_id}", status_code=status.HTTP_303_SEE_OTHER)
+
         paciente_data = PacienteUpdate(
             nome_completo=nome_completo,
             data_nascimento=data_nascimento,
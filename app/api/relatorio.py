@@ -1,19 +1,33 @@
-from openai import AsyncOpenAI  # Importar o cliente assíncrono da OpenAI
-from sqlalchemy.orm import selectinload
-from sqlalchemy.future import select
-from typing import List
-from fastapi.responses import JSONResponse, RedirectResponse
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi import APIRouter, Depends, Form, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.templating import Jinja2Templates
+from app.core.admissao import Sobrecarga, admissao
 from app.core.dependencies import get_current_user
 from app.core.deps import get_db
+from app.core.database import async_session
+from app.core.resiliencia import MENSAGEM_INDISPONIVEL, CircuitoAberto, PrazoExcedido
 from app.models.auditoria import Auditoria
-from app.models.relatorio import Consulta, Usuario, Paciente, Relatorio
+from app.models.relatorio import Usuario, Paciente, Relatorio
 from app.schemas.relatorio import RelatorioOut
 from app.services.paciente import get_pacientes
-from app.services.consulta import get_consultas
-from app.services.relatorio import get_relatorio, get_relatorios, delete_relatorio
+from app.services.consulta import get_consulta, get_consultas
+from app.services.backends_llm import ResultadoGeracao, tabela_rotas
+from app.services.geracao import dados_prompt, gerar_relatorio_ia_stream, gerar_secao_ia
+from app.services.secoes import SECOES, dividir_secoes
+from app.services import cache_relatorio
+from app.services.geracao_lote import get_lote, iniciar_lote, lote_em_execucao
+from app.schemas.datatables import DataTableParams
+from app.services.relatorio import get_relatorio, get_relatorio_completo, get_relatorios_datatable, guardar_relatorio, estado_relatorio, substituir_secao, delete_relatorio
+from app.services.tarefas import cancelar_relatorio, cancelar_tarefa, concluir_tarefa, enfileirar_relatorio, falhar_tarefa, get_tarefa, posicao_na_fila, reservar_tarefa
+from app.services.voos import lancar, voos
+from app.services.uso import MENSAGEM_QUOTA, dentro_da_quota
+from app.models.tarefa import CANCELADA, CONCLUIDA, FALHADA, PENDENTE, STREAM
 from app.core.config import settings
 from datetime import datetime
 import pytz
@@ -22,58 +36,187 @@ router = APIRouter()
 
 templates = Jinja2Templates(directory="app/templates")
 
-client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
-async def gerar_relatorio_openai(
-    diagnostico: str, 
-    prescricoes: str, 
-    especialidade: str, 
-    paciente_nome: str, 
-    paciente_sexo: str, 
-    paciente_idade: int,
-    medico_nome: str
-) -> str:
-    prompt = f"""
-    Geração de um relatório médico detalhado para uma consulta de {especialidade}.
-
-    **Dados do Paciente:**
-    - Nome: {paciente_nome}
-    - Sexo: {paciente_sexo}
-    - Idade: {paciente_idade} anos
-
-    **Diagnóstico:**
-    {diagnostico}
-
-    **Prescrições Médicas:**
-    {prescricoes}
-
-    **Médico Responsável:**
-    {medico_nome}
-    
-   
-    **Assinatura:** ____________________  
-    **CRM:** [Número do registro do médico]
-
-    **Elabore um relatório clínico detalhado com base nas informações acima, considerando os seguintes aspectos:**
-    1️**Resumo Clínico**: Apresente uma introdução ao caso com base no diagnóstico e prescrição.  
-    2️**Histórico Médico e Sintomas**: Explique a condição do paciente, sintomas relatados e fatores relevantes.  
-    3️**Plano de Tratamento**: Sugira abordagens terapêuticas e recomendações baseadas no diagnóstico.  
-    4️**Recomendações Médicas**: Indique cuidados necessários, mudanças no estilo de vida ou exames complementares.  
-    5️**Prognóstico**: Informe as expectativas de evolução da condição do paciente.  
-    """
+logger = logging.getLogger(__name__)
+
+# Intervalo de consulta ao estado de uma geração partilhada que corre noutro processo
+INTERVALO_ACOMPANHAMENTO_S = 1.0
+# Intervalo de verificação de que o cliente continua ligado, nos pedidos que esperam pelo modelo
+INTERVALO_LIGACAO_S = 0.5
 
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini", 
-        messages=[
-            {"role": "system", "content": "Você é um assistente médico especializado na geração de relatórios clínicos completos."},
-            {"role": "user", "content": prompt}
+MENSAGEM_CANCELADA = "A geração do relatório foi cancelada."
+STATUS_CLIENTE_DESLIGADO = 499  # Convenção do nginx: o cliente fechou a ligação antes da resposta
+
+
+def _relatorio_json(relatorio: Relatorio, com_detalhe_consulta: bool = False) -> dict:
+    consulta = relatorio.consulta
+    dados_consulta = {
+        "tipo": consulta.tipo,
+        "paciente": {
+            "nome_completo": consulta.paciente.nome_completo,
+            "data_nascimento": consulta.paciente.data_nascimento,
+            "sexo": consulta.paciente.sexo,
+        },
+        "usuario": {
+            "nome_completo": consulta.usuario.nome_completo,
+            "especialidade": consulta.usuario.especialidade,
+        },
+    }
+    if com_detalhe_consulta:
+        dados_consulta["diagnostico"] = consulta.diagnostico
+        dados_consulta["prescricoes"] = consulta.prescricoes
+    return {
+        "id": relatorio.id,
+        "conteudo": relatorio.conteudo,
+        "secoes": [
+            {"chave": secao.chave, "titulo": SECOES[secao.chave], "conteudo": secao.conteudo}
+            for secao in relatorio.secoes
         ],
-        max_tokens=800, 
-        temperature=0.7,  
+        "tokens_prompt": relatorio.tokens_prompt,
+        "tokens_resposta": relatorio.tokens_resposta,
+        "estado": estado_relatorio(relatorio),
+        "data_criacao": relatorio.data_criacao,
+        "consulta": dados_consulta,
+    }
+
+
+def _quota_excedida() -> JSONResponse:
+    return JSONResponse(
+        content={"status": "quota", "message": MENSAGEM_QUOTA},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
     )
 
-    return response.choices[0].message.content.strip()
 
+def _sobrecarga(exc: Sobrecarga) -> JSONResponse:
+    # Recusa à entrada: o cliente tenta de novo depois de Retry-After segundos
+    return JSONResponse(
+        content={"status": "sobrecarga", "message": str(exc), "retry_after": exc.espera},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(exc.espera)},
+    )
+
+
+def _evento(nome: str, dados) -> str:
+    # Um evento Server-Sent Events com os dados em JSON (uma só linha "data:")
+    return f"event: {nome}\ndata: {json.dumps(dados, default=str)}\n\n"
+
+async def _gerar_eventos(
+    tarefa_id: str, consulta_id: str, dados: dict, chave: str, em_cache: Optional[ResultadoGeracao], usuario_id: str
+):
+    if em_cache is not None:
+        # Mesmo prompt e parâmetros: o texto em cache segue de uma vez
+        resultado = em_cache
+        yield _evento("token", resultado.texto)
+    else:
+        inicio = time.perf_counter()
+        prazo = asyncio.timeout(settings.RELATORIO_PRAZO_S)
+        try:
+            async with prazo, admissao.admitir(usuario_id, verificar=False):
+                async for item in gerar_relatorio_ia_stream(**dados):
+                    if isinstance(item, ResultadoGeracao):
+                        resultado = item
+                    else:
+                        yield _evento("token", item)
+        except asyncio.CancelledError:
+            # Ninguém está a seguir a geração ou foi cancelada: a chamada ao modelo já foi
+            # interrompida; só falta libertar a tarefa (protegido de um novo cancelamento)
+            await asyncio.shield(_marcar_cancelada(tarefa_id))
+            raise
+        except Exception as exc:
+            if prazo.expired():
+                exc = PrazoExcedido()
+            if isinstance(exc, (CircuitoAberto, PrazoExcedido)):
+                mensagem = str(exc)
+            else:
+                logger.exception("Falha na geração em streaming da consulta %s", consulta_id)
+                mensagem = "Erro ao gerar o relatório."
+            async with async_session() as sessao:
+                await falhar_tarefa(sessao, tarefa_id, f"{type(exc).__name__}: {exc}")
+            yield _evento("erro", {"message": mensagem})
+            return
+        duracao_ms = int((time.perf_counter() - inicio) * 1000)
+
+    # A sessão do pedido pode já ter sido fechada: o relatório é gravado numa sessão própria.
+    # Um cancelamento a meio desfaz a transação ao fechar a sessão.
+    async with async_session() as sessao:
+        try:
+            if em_cache is None:
+                await cache_relatorio.guardar(sessao, chave, resultado, duracao_ms)
+            relatorio = await guardar_relatorio(
+                sessao, consulta_id, resultado, usuario_id, dados["especialidade"], commit=False,
+                chave_entrada=chave,
+            )
+            if not await concluir_tarefa(sessao, tarefa_id, relatorio.id):
+                await sessao.rollback()  # Cancelada noutro processo
+                yield _evento("erro", {"message": MENSAGEM_CANCELADA})
+                return
+            await sessao.commit()
+        except Exception as exc:
+            logger.exception("Falha ao gravar o relatório da consulta %s", consulta_id)
+            await sessao.rollback()
+            await falhar_tarefa(sessao, tarefa_id, f"{type(exc).__name__}: {exc}")
+            yield _evento("erro", {"message": "Erro ao gravar o relatório."})
+            return
+        relatorio = await get_relatorio_completo(sessao, relatorio.id, com_detalhe_consulta=True)
+        yield _evento("fim", _relatorio_json(relatorio, com_detalhe_consulta=True))
+
+
+class ClienteDesligado(Exception):
+    """O cliente fechou a ligação enquanto o pedido esperava pelo modelo."""
+
+
+async def _enquanto_ligado(request: Request, chamada):
+    """
+    Espera pela chamada ao modelo enquanto o cliente estiver ligado e dentro do prazo;
+    caso contrário cancela-a (o cancelamento chega ao pedido HTTP ao modelo).
+    """
+    tarefa = asyncio.create_task(chamada)
+    limite = time.monotonic() + settings.RELATORIO_PRAZO_S
+    try:
+        while True:
+            feitas, _ = await asyncio.wait({tarefa}, timeout=INTERVALO_LIGACAO_S)
+            if feitas:
+                return tarefa.result()
+            if await request.is_disconnected():
+                raise ClienteDesligado()
+            if time.monotonic() > limite:
+                raise PrazoExcedido()
+    finally:
+        if not tarefa.done():
+            tarefa.cancel()
+            await asyncio.gather(tarefa, return_exceptions=True)
+
+
+async def _admitida(usuario_id: str, chamada):
+    # Pedido já verificado à entrada: espera pela vez e ocupa uma vaga durante a chamada
+    async with admissao.admitir(usuario_id, verificar=False):
+        return await chamada
+
+
+async def _marcar_cancelada(tarefa_id: str) -> None:
+    async with async_session() as sessao:
+        await cancelar_tarefa(sessao, tarefa_id, "Cancelada: cliente desligado")
+
+
+async def _acompanhar(tarefa_id: str):
+    # Geração partilhada que não corre neste processo: segue o estado da tarefa na base de dados
+    while True:
+        async with async_session() as sessao:
+            tarefa = await get_tarefa(sessao, tarefa_id)
+            if tarefa is None or tarefa.estado == FALHADA:
+                yield _evento("erro", {"message": "Erro ao gerar o relatório."})
+                return
+            if tarefa.estado == CANCELADA:
+                yield _evento("erro", {"message": MENSAGEM_CANCELADA})
+                return
+            if tarefa.estado == CONCLUIDA:
+                relatorio = await get_relatorio_completo(sessao, tarefa.relatorio_id, com_detalhe_consulta=True)
+                if relatorio is None:
+                    yield _evento("erro", {"message": "Relatório não encontrado."})
+                    return
+                yield _evento("token", relatorio.conteudo)
+                yield _evento("fim", _relatorio_json(relatorio, com_detalhe_consulta=True))
+                return
+        await asyncio.sleep(INTERVALO_ACOMPANHAMENTO_S)
 
 
 @router.get("/all", response_model=List[RelatorioOut])
@@ -83,15 +226,47 @@ async def read_relatorios(
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        relatorios = await get_relatorios(db)
-        
+        # As linhas são carregadas pelo DataTables através de /relatorios/datatable
         return templates.TemplateResponse(
             "/relatorio/list_relatorio.html",
-            {"request": request, "relatorios": relatorios, "current_user": current_user}
+            {"request": request, "current_user": current_user}
         )
     else:
         request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.get("/datatable")
+async def relatorios_datatable(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        try:
+            params = DataTableParams.from_query(request.query_params)
+            pagina = await get_relatorios_datatable(db, params)
+        except ValueError:
+            return JSONResponse(content={"status": "error", "message": "Parâmetros inválidos."}, status_code=400)
+
+        return {
+            "draw": params.draw,
+            "recordsTotal": pagina.total,
+            "recordsFiltered": pagina.filtered,
+            "next_cursor": pagina.next_cursor,
+            "prev_cursor": pagina.prev_cursor,
+            "data": [
+                {
+                    "id": relatorio.id,
+                    "tipo": relatorio.tipo or "",
+                    "paciente": relatorio.paciente_nome or "",
+                    "estado": relatorio.estado,
+                    "data_criacao": relatorio.data_criacao.strftime('%d/%m/%Y %H:%M') if relatorio.data_criacao else "",
+                }
+                for relatorio in pagina.items
+            ],
+        }
+    else:
+        return JSONResponse(content={"status": "admin"})
     
 
     
@@ -125,39 +300,12 @@ async def get_relatorio_details(
     current_user: Usuario = Depends(get_current_user)
     ):
     if current_user.role in ["Administrador", "Funcionario"]:
-        result = await db.execute(
-            select(Relatorio)
-            .options(
-                selectinload(Relatorio.consulta)
-                .selectinload(Consulta.paciente), 
-                selectinload(Relatorio.consulta)
-                .selectinload(Consulta.usuario)  
-            )
-            .where(Relatorio.id == relatorio_id, Relatorio.deleted == False)
-        )
-
-        relatorio = result.scalars().first()
+        relatorio = await get_relatorio_completo(db, relatorio_id)
 
         if not relatorio:
             raise HTTPException(status_code=404, detail="Relatório não encontrado")
 
-        return {
-            "id": relatorio.id,
-            "conteudo": relatorio.conteudo,
-            "data_criacao": relatorio.data_criacao,
-            "consulta": {
-                "tipo": relatorio.consulta.tipo,
-                "paciente": {
-                    "nome_completo": relatorio.consulta.paciente.nome_completo,
-                    "data_nascimento": relatorio.consulta.paciente.data_nascimento,
-                    "sexo": relatorio.consulta.paciente.sexo,
-                },
-                "usuario": {
-                    "nome_completo": relatorio.consulta.usuario.nome_completo,
-                    "especialidade": relatorio.consulta.usuario.especialidade,
-                },
-            },
-        }
+        return _relatorio_json(relatorio)
     else:
         request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
@@ -166,85 +314,305 @@ async def get_relatorio_details(
 async def gerar_relatorio(
     request: Request,
     consulta_id: str, 
+    forcar: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
     ):
     
     if current_user.role in ["Administrador", "Funcionario"]:
-        consulta = await db.execute(
-            select(Consulta)
-            .options(
-                selectinload(Consulta.paciente),
-                selectinload(Consulta.usuario)
-            )
-            .where(Consulta.id == consulta_id, Consulta.deleted == False)
-        )
-        consulta = consulta.scalars().first()
+        # A geração corre na fila (app.services.tarefas); aqui só a validação e a chave
+        # de idempotência, para que pedidos repetidos partilhem a mesma tarefa
+        consulta = await get_consulta(db, consulta_id)
     
         if not consulta:
             raise HTTPException(status_code=404, detail="Consulta não encontrada")
         
-        paciente = consulta.paciente
-        usuario = consulta.usuario
-        
-        if not paciente:
+        if not consulta.paciente:
             raise HTTPException(status_code=404, detail="Paciente não encontrado")
         
-        if not usuario:
+        if not consulta.usuario:
             raise HTTPException(status_code=404, detail="Médico não encontrado")
-        
-        idade_paciente = (datetime.now() - paciente.data_nascimento).days // 365
-        
-        relatorio_gerado = await gerar_relatorio_openai(
-            diagnostico=consulta.diagnostico,
-            prescricoes=consulta.prescricoes,
-            especialidade=consulta.tipo,
-            paciente_nome=paciente.nome_completo,
-            paciente_sexo=paciente.sexo,
-            paciente_idade=idade_paciente,
-            medico_nome=usuario.nome_completo
-        )
-        
-        relatorio = Relatorio(
-            conteudo=relatorio_gerado, 
-            consulta_id=consulta.id
+
+        if not await dentro_da_quota(db, current_user):
+            return _quota_excedida()
+
+        chave = cache_relatorio.chave_cache(dados_prompt(consulta))
+        try:
+            tarefa = await enfileirar_relatorio(db, consulta_id, current_user.id, forcar=forcar, chave=chave)
+        except Sobrecarga as exc:
+            return _sobrecarga(exc)
+
+        return JSONResponse(
+            content={
+                "status": tarefa.estado,
+                "tarefa_id": tarefa.id,
+                "url": f"/relatorios/tarefas/{tarefa.id}",
+            },
+            status_code=status.HTTP_202_ACCEPTED,
         )
+    else:
+        request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
+        return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.get("/gerar-relatorio/{consulta_id}/stream")
+async def gerar_relatorio_stream(
+    request: Request,
+    consulta_id: str, 
+    forcar: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        consulta = await get_consulta(db, consulta_id)
+
+        if not consulta:
+            raise HTTPException(status_code=404, detail="Consulta não encontrada")
         
-        db.add(relatorio)
-        await db.commit()
-        await db.refresh(relatorio)
+        if not consulta.paciente:
+            raise HTTPException(status_code=404, detail="Paciente não encontrado")
         
-        db_log = Auditoria(
-                acao=f"Relatorio com data '{relatorio.data_criacao}', foi gerado.",
-                data_criacao=datetime.now(pytz.utc),
-                usuario_id=current_user.id
+        if not consulta.usuario:
+            raise HTTPException(status_code=404, detail="Médico não encontrado")
+
+        if not await dentro_da_quota(db, current_user):
+            # O EventSource não lê o corpo de um 429: a recusa segue como evento
+            return StreamingResponse(
+                iter([_evento("erro", {"message": MENSAGEM_QUOTA})]), media_type="text/event-stream"
             )
-        db.add(db_log)
-        await db.commit()
-        await db.refresh(db_log)
 
-        return {
-            "id": relatorio.id,
-            "conteudo": relatorio.conteudo,
-            "data_criacao": relatorio.data_criacao,
-            "consulta": {
-                "tipo": consulta.tipo,
-                "diagnostico": consulta.diagnostico,
-                "prescricoes": consulta.prescricoes,
-                "paciente": {
-                    "nome_completo": paciente.nome_completo,
-                    "data_nascimento": paciente.data_nascimento,
-                    "sexo": paciente.sexo,
-                },
-                "usuario": {
-                    "nome_completo": usuario.nome_completo,
-                    "especialidade": usuario.especialidade,
-                },
-            },
+        dados = dados_prompt(consulta)
+        chave = cache_relatorio.chave_cache(dados)
+        if forcar:
+            em_cache = None
+        else:
+            em_cache = await cache_relatorio.obter(db, chave)
+        if em_cache is None:
+            # Antes de reservar a tarefa: um pedido recusado não deixa nada gravado
+            try:
+                admissao.verificar(current_user.id)
+            except Sobrecarga as exc:
+                # Como na quota: o EventSource não lê o corpo de um 503
+                return StreamingResponse(
+                    iter([_evento("erro", {"message": str(exc), "retry_after": exc.espera})]),
+                    media_type="text/event-stream",
+                    headers={"Retry-After": str(exc.espera)},
+                )
+        # Pedidos iguais em simultâneo (duplo clique, dois funcionários) partilham a geração
+        tarefa, nova = await reservar_tarefa(db, consulta_id, current_user.id, chave, forcar, origem=STREAM)
+        if nova:
+            if forcar:
+                cache_relatorio.estatisticas["forcadas"] += 1
+            eventos = lancar(
+                tarefa.id,
+                _gerar_eventos(tarefa.id, consulta_id, dados, chave, em_cache, current_user.id),
+                ao_cancelar=_evento("erro", {"message": MENSAGEM_CANCELADA}),
+            ).seguir()
+        elif tarefa.id in voos:
+            eventos = voos[tarefa.id].seguir()
+        else:
+            eventos = _acompanhar(tarefa.id)  # Noutro processo, na fila ou já concluída
+        # Devolve a ligação ao pool já: a sessão do pedido só fecha quando a resposta termina
+        await db.close()
+
+        return StreamingResponse(
+            eventos,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.post("/{relatorio_id}/secoes/{chave}/regenerar")
+async def regenerar_secao(
+    request: Request,
+    relatorio_id: str,
+    chave: str,
+    instrucao: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        if chave not in SECOES:
+            raise HTTPException(status_code=404, detail="Secção desconhecida")
+
+        relatorio = await get_relatorio_completo(db, relatorio_id, com_detalhe_consulta=True)
+        if not relatorio:
+            raise HTTPException(status_code=404, detail="Relatório não encontrado")
+
+        # As outras secções seguem como contexto; só a indicada é gerada de novo
+        secoes = {secao.chave: secao.conteudo for secao in relatorio.secoes} or dividir_secoes(relatorio.conteudo)
+        if not secoes:
+            return JSONResponse(
+                content={"status": "sem_secoes", "message": "Este relatório não está dividido em secções. Gere-o de novo."},
+                status_code=status.HTTP_409_CONFLICT,
+            )
+
+        if not await dentro_da_quota(db, current_user):
+            return _quota_excedida()
+
+        try:
+            admissao.verificar(current_user.id)
+        except Sobrecarga as exc:
+            return _sobrecarga(exc)
+
+        dados = dados_prompt(relatorio.consulta)
+        usuario_id = current_user.id
+        await db.close()  # Sem ligação presa durante a chamada ao modelo
+
+        try:
+            resultado = await _enquanto_ligado(
+                request, _admitida(usuario_id, gerar_secao_ia(chave, secoes, instrucao, **dados))
+            )
+        except ClienteDesligado:
+            # Ninguém vai ler a resposta: a chamada foi cancelada e nada é gravado
+            return JSONResponse(content={"status": "cancelado"}, status_code=STATUS_CLIENTE_DESLIGADO)
+        except CircuitoAberto as exc:
+            return JSONResponse(
+                content={"status": "indisponivel", "message": str(exc)},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        except PrazoExcedido as exc:
+            return JSONResponse(
+                content={"status": "prazo", "message": str(exc)},
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            )
+        except Exception:
+            logger.exception("Falha ao regenerar a secção %s do relatório %s", chave, relatorio_id)
+            return JSONResponse(
+                content={"status": "error", "message": "Erro ao regenerar a secção."},
+                status_code=status.HTTP_502_BAD_GATEWAY,
+            )
+
+        async with async_session() as sessao:
+            if not await substituir_secao(sessao, relatorio_id, chave, resultado, usuario_id, dados["especialidade"]):
+                raise HTTPException(status_code=404, detail="Relatório não encontrado")
+            sessao.expunge_all()  # Reler com consulta, paciente e médico
+            relatorio = await get_relatorio_completo(sessao, relatorio_id, com_detalhe_consulta=True)
+            return _relatorio_json(relatorio, com_detalhe_consulta=True)
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.get("/tarefas/{tarefa_id}")
+async def estado_tarefa(
+    request: Request,
+    tarefa_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        tarefa = await get_tarefa(db, tarefa_id)
+
+        if not tarefa:
+            raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+
+        resposta = {
+            "tarefa_id": tarefa.id,
+            "status": tarefa.estado,
+            "tentativas": tarefa.tentativas,
+            "erro": tarefa.erro,
+            "data_criacao": tarefa.data_criacao,
+            "data_conclusao": tarefa.data_conclusao,
         }
+        if tarefa.estado == PENDENTE:
+            resposta["posicao"] = await posicao_na_fila(db, tarefa)
+            if tarefa.erro == MENSAGEM_INDISPONIVEL:
+                resposta["aviso"] = tarefa.erro
+        if tarefa.estado == CONCLUIDA and tarefa.relatorio_id:
+            relatorio = await get_relatorio_completo(db, tarefa.relatorio_id, com_detalhe_consulta=True)
+            if relatorio:
+                resposta["relatorio"] = _relatorio_json(relatorio, com_detalhe_consulta=True)
+        return resposta
     else:
-        request.session.setdefault("notifications", []).append("Acesso limitado nesta página.")
-        return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
+        return JSONResponse(content={"status": "admin"})
+
+@router.post("/tarefas/{tarefa_id}/cancelar")
+async def cancelar_tarefa_relatorio(
+    request: Request,
+    tarefa_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        tarefa = await get_tarefa(db, tarefa_id)
+
+        if not tarefa:
+            raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+
+        # Pedidos iguais partilham a tarefa: só quem a pediu (ou um administrador) a cancela
+        if tarefa.usuario_id != current_user.id and current_user.role != "Administrador":
+            return JSONResponse(content={"status": "admin"}, status_code=status.HTTP_403_FORBIDDEN)
+
+        if not await cancelar_relatorio(db, tarefa_id):
+            return JSONResponse(content={"status": tarefa.estado}, status_code=status.HTTP_409_CONFLICT)
+        return {"status": CANCELADA}
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.post("/gerar-lote")
+async def gerar_relatorios_em_lote(
+    request: Request,
+    limite: Optional[int] = None,
+    desatualizados: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        em_execucao = lote_em_execucao()
+        if em_execucao:
+            return JSONResponse(
+                content={"status": "em_execucao", "lote_id": em_execucao.id, "url": f"/relatorios/lotes/{em_execucao.id}"},
+                status_code=status.HTTP_409_CONFLICT,
+            )
+
+        if not await dentro_da_quota(db, current_user):
+            return _quota_excedida()
+
+        progresso = await iniciar_lote(db, current_user.id, limite, desatualizados=desatualizados)
+
+        return JSONResponse(
+            content={"status": progresso.estado, "lote_id": progresso.id, "total": progresso.total, "url": f"/relatorios/lotes/{progresso.id}"},
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.get("/lotes/{lote_id}")
+async def progresso_lote(
+    request: Request,
+    lote_id: str,
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        progresso = get_lote(lote_id)
+
+        if not progresso:
+            raise HTTPException(status_code=404, detail="Lote não encontrado")
+
+        return progresso.como_dict()
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.get("/cache/estatisticas")
+async def estatisticas_cache(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    if current_user.role in ["Administrador"]:
+        return await cache_relatorio.resumo(db)
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+@router.get("/rotas")
+async def rotas_geracao(
+    request: Request,
+    current_user: Usuario = Depends(get_current_user)
+    ):
+    # Modelo, alternativo e max_tokens de cada especialidade, com a latência e os erros recentes
+    if current_user.role in ["Administrador"]:
+        return {"rotas": tabela_rotas()}
+    else:
+        return JSONResponse(content={"status": "admin"})
 
 @router.delete("/delete/{relatorio_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def deletar_consulta(
@@ -3,7 +3,8 @@ from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.usuario import UsuarioCreate, UsuarioResponse, UsuarioUpdate
-from app.services.usuario import get_user, get_users, create_user, update_user, delete_user
+from typing import Optional
+from app.services.usuario import get_user, get_user_by_email, get_users_page, search_users, create_user, update_user, delete_user
 from app.core.deps import get_db
 from app.core.dependencies import get_current_user
 from app.models.relatorio import Usuario
@@ -16,12 +17,18 @@ templates = Jinja2Templates(directory="app/templates")
 @router.get("/all", response_model=list[UsuarioResponse])
 async def read_users(
     request: Request,
+    cursor: Optional[str] = None,
+    direction: str = "next",
     db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     if current_user.role in ["Administrador"]:  
-        users = await get_users(db)            
-        if users is None:
+        try:
+            pagina = await get_users_page(db, cursor=cursor, direction=direction)
+        except ValueError:
+            request.session.setdefault("notifications", []).append("Página inválida.")
+            return RedirectResponse(url="/users/all", status_code=status.HTTP_303_SEE_OTHER)
+        if not pagina.items and cursor is None:
             if "notifications" not in request.session:
                 request.session["notifications"] = []
             request.session["notifications"].append(f"Crear Usuarios.")        
@@ -31,7 +38,8 @@ async def read_users(
                 "/user/user_list.html", 
                 {
                     "request": request,
-                    "users": users,
+                    "users": pagina.items,
+                    "pagina": pagina,
                     "current_user": current_user,
                 }
             )
@@ -42,6 +50,22 @@ async def read_users(
         return RedirectResponse(url="/core/dashboard", status_code=status.HTTP_303_SEE_OTHER)
 
 
+@router.get("/search")
+async def pesquisar_users(
+    q: str = "",
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.role in ["Administrador", "Funcionario"]:
+        users = await search_users(db, q)
+        return [
+            {"id": user.id, "nome_completo": user.nome_completo, "especialidade": user.especialidade}
+            for user in users
+        ]
+    else:
+        return JSONResponse(content={"status": "admin"})
+
+
 @router.get("/details/{user_id}", response_model=UsuarioResponse)
 async def user_details(
     request: Request,
@@ -97,6 +121,12 @@ async def criar_user(
         request.session["notifications"].append("As senhas não coincidem.")
         return RedirectResponse(url="/users/create", status_code=status.HTTP_303_SEE_OTHER)
 
+    if await get_user_by_email(db, correio):
+        if "notifications" not in request.session:
+            request.session["notifications"] = []
+        request.session["notifications"].append("Já existe um usuário com este correio.")
+        return RedirectResponse(url="/users/create", status_code=status.HTTP_303_SEE_OTHER)
+
     user_data = UsuarioCreate(
         nome_completo=nome_completo,
         correio=correio,
@@ -154,6 +184,7 @@ async def editar_user(
     telefone: str = Form(...),  
     role: str = Form(...),  
     especialidade: str = Form(None),  
+    quota_tokens_diaria: Optional[int] = Form(None),
     senha: str = Form(None),  
     confirm_senha: str = Form(None),  
     db: AsyncSession = Depends(get_db),
@@ -171,12 +202,20 @@ async def editar_user(
         request.session["notifications"].append("As senhas não coincidem.")
         return RedirectResponse(url=f"/users/edit/{user_id}", status_code=status.HTTP_303_SEE_OTHER)
 
+    existente = await get_user_by_email(db, correio)
+    if existente and existente.id != user_id:
+        if "notifications" not in request.session:
+            request.session["notifications"] = []
+        request.session["notifications"].append("Já existe um usuário com este correio.")
+        return RedirectResponse(url=f"/users/edit/{user_id}", status_code=status.HTTP_303_SEE_OTHER)
+
     user_data = UsuarioUpdate(
         nome_completo=nome_completo,
         correio=correio,
         telefone=telefone,
         role=role,
         especialidade=especialidade,
+        quota_tokens_diaria=quota_tokens_diaria,
         senha=senha,  
     )
 
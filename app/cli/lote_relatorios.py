@@ -0,0 +1,90 @@
+"""
+Geração offline de relatórios em lote, fora do processo web.
+
+    python -m app.cli.lote_relatorios exportar  --dir lotes/2024-06 [--limite N]
+    python -m app.cli.lote_relatorios submeter  --dir lotes/2024-06 --backend openai
+    python -m app.cli.lote_relatorios importar  --dir lotes/2024-06 [--usuario admin@bot.com]
+    python -m app.cli.lote_relatorios executar  --dir lotes/2024-06 --backend local
+
+Cada passo é idempotente: exportar só acrescenta consultas novas, submeter não volta
+a enviar um lote já submetido e importar ignora consultas que já têm relatório.
+"""
+import argparse
+import asyncio
+from app.core.database import async_session
+from app.services.lote_offline import BACKENDS, descarregar, exportar, importar, ler_estado, submeter
+from app.services.usuario import get_user_by_email
+
+INTERVALO_ESTADO_S = 60
+
+
+def _backend(args):
+    nome = args.backend or ler_estado(args.dir).get("backend") or "openai"
+    return BACKENDS[nome]()
+
+
+async def _usuario_id(correio):
+    if not correio:
+        return None
+    async with async_session() as db:
+        usuario = await get_user_by_email(db, correio)
+    if not usuario:
+        raise SystemExit(f"Usuário '{correio}' não encontrado")
+    return usuario.id
+
+
+async def _exportar(args):
+    async with async_session() as db:
+        novos = await exportar(db, args.dir, args.limite)
+    print(f"{novos} pedidos exportados")
+
+
+async def _submeter(args):
+    lote_id = await submeter(args.dir, _backend(args))
+    print(f"Lote submetido: {lote_id}")
+
+
+async def _importar(args, esperar=False):
+    backend = _backend(args)
+    while not await descarregar(args.dir, backend):
+        if not esperar:
+            print("O lote ainda está em execução")
+            return
+        await asyncio.sleep(INTERVALO_ESTADO_S)
+    usuario_id = await _usuario_id(args.usuario)
+    async with async_session() as db:
+        resumo = await importar(db, args.dir, usuario_id)
+    print(f"{resumo['importados']} importados, {resumo['ignorados']} já existentes, {resumo['falhados']} falhados")
+
+
+async def _executar(args):
+    # Retoma depois de uma interrupção: um lote já submetido só falta acompanhar e importar
+    if ler_estado(args.dir).get("lote_id"):
+        print("Lote já submetido: a retomar")
+    else:
+        await _exportar(args)
+        await _submeter(args)
+    await _importar(args, esperar=True)
+
+
+COMANDOS = {
+    "exportar": _exportar,
+    "submeter": _submeter,
+    "importar": _importar,
+    "executar": _executar,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geração de relatórios em lote via ficheiros JSONL")
+    parser.add_argument("comando", choices=COMANDOS)
+    parser.add_argument("--dir", required=True, help="Diretório do lote (entrada, saída e estado)")
+    parser.add_argument("--backend", choices=BACKENDS, help="Por omissão, o já registado no estado ou openai")
+    parser.add_argument("--limite", type=int, help="Máximo de consultas a exportar")
+    parser.add_argument("--usuario", help="Correio do usuário a registar na auditoria")
+    args = parser.parse_args()
+    asyncio.run(COMANDOS[args.comando](args))
+
+
+if __name__ == "__main__":
+    main()
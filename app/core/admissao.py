@@ -0,0 +1,175 @@
+import asyncio
+import math
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from app.core import metricas
+from app.core.config import settings
+from app.core.resiliencia import JanelaLatencias
+
+MENSAGEM_SOBRECARGA = (
+    "Há muitos relatórios a ser gerados neste momento. Tente novamente dentro de alguns instantes."
+)
+
+# Peso da última duração na média móvel do tempo de geração
+PESO_SERVICO = 0.2
+
+
+class Sobrecarga(Exception):
+    """Pedido recusado à entrada: a espera prevista passa do alvo ou a fila está cheia."""
+
+    def __init__(self, motivo: str, espera: float):
+        super().__init__(MENSAGEM_SOBRECARGA)
+        self.motivo = motivo  # "fila", "usuario" ou "espera"
+        self.espera = max(1, math.ceil(espera))  # Segundos para o Retry-After
+
+
+class ControladorAdmissao:
+    """
+    Controlo de admissão das gerações deste processo: no máximo `concorrencia` em curso,
+    as restantes numa fila limitada a `max_fila`. A vez é dada por rotação entre usuários
+    (cada um com no máximo `max_por_usuario` pedidos em curso ou à espera), para que quem
+    pede muitos relatórios não atrase os outros. Um pedido cuja espera prevista passe de
+    `espera_alvo` segundos é recusado logo, em vez de ocupar o processo à espera.
+
+    :param concorrencia: Gerações em simultâneo.
+    :param max_fila: Pedidos à espera de vez.
+    :param max_por_usuario: Pedidos de um usuário, em curso ou à espera.
+    :param espera_alvo: Espera máxima prevista (s) para aceitar um pedido.
+    :param servico_inicial: Duração prevista de uma geração (s) antes de haver medições.
+    """
+
+    def __init__(
+        self,
+        concorrencia: int = settings.ADMISSAO_CONCORRENCIA,
+        max_fila: int = settings.ADMISSAO_MAX_FILA,
+        max_por_usuario: int = settings.ADMISSAO_MAX_POR_USUARIO,
+        espera_alvo: float = settings.ADMISSAO_ESPERA_ALVO_S,
+        servico_inicial: float = settings.ADMISSAO_SERVICO_INICIAL_S,
+    ):
+        self.concorrencia = concorrencia
+        self.max_fila = max_fila
+        self.max_por_usuario = max_por_usuario
+        self.espera_alvo = espera_alvo
+        self.servico_medio = servico_inicial
+        self.em_curso = 0
+        self.esperas = JanelaLatencias()
+        self._por_usuario: Counter = Counter()  # Em curso ou à espera, por usuário
+        self._a_espera: Dict[Optional[str], Deque[asyncio.Future]] = {}
+        self._vez: Deque[Optional[str]] = deque()  # Usuários com pedidos à espera, por rotação
+        self.contadores = {
+            "admitidos": 0,
+            "recusados_fila": 0,
+            "recusados_usuario": 0,
+            "recusados_espera": 0,
+        }
+
+    def na_fila(self) -> int:
+        return sum(len(fila) for fila in self._a_espera.values())
+
+    def espera_prevista(self, a_frente: int = 0) -> float:
+        """Segundos até um novo pedido ter vez, com `a_frente` pedidos que ainda não chegaram aqui."""
+        posicao = self.na_fila() + a_frente
+        livres = self.concorrencia - self.em_curso
+        if posicao < livres:
+            return 0.0
+        return (posicao - livres + 1) / self.concorrencia * self.servico_medio
+
+    def verificar(self, usuario_id: Optional[str], a_frente: int = 0) -> None:
+        """Recusa já (Sobrecarga) o pedido que não seria servido dentro do alvo."""
+        if self.na_fila() + a_frente >= self.max_fila:
+            self.contadores["recusados_fila"] += 1
+            raise Sobrecarga("fila", self.espera_prevista(a_frente))
+        if usuario_id and self._por_usuario[usuario_id] >= self.max_por_usuario:
+            self.contadores["recusados_usuario"] += 1
+            raise Sobrecarga("usuario", self.servico_medio)
+        espera = self.espera_prevista(a_frente)
+        if espera > self.espera_alvo:
+            self.contadores["recusados_espera"] += 1
+            raise Sobrecarga("espera", espera - self.espera_alvo)
+
+    @asynccontextmanager
+    async def admitir(self, usuario_id: Optional[str], verificar: bool = True):
+        """
+        Espera pela vez e ocupa uma vaga durante o bloco. Com verificar=False o pedido já
+        foi aceite antes (fila de tarefas, streaming) e só espera.
+        """
+        if verificar:
+            self.verificar(usuario_id)
+        chegada = time.monotonic()
+        self._por_usuario[usuario_id] += 1
+        try:
+            if self.em_curso < self.concorrencia and not self._vez:
+                self.em_curso += 1
+            else:
+                await self._esperar_vez(usuario_id)
+            self.esperas.registar(time.monotonic() - chegada)
+            self.contadores["admitidos"] += 1
+            inicio = time.monotonic()
+            try:
+                yield
+            finally:
+                duracao = time.monotonic() - inicio
+                self.servico_medio += PESO_SERVICO * (duracao - self.servico_medio)
+                self._passar_vez()
+        finally:
+            self._por_usuario[usuario_id] -= 1
+            if not self._por_usuario[usuario_id]:
+                del self._por_usuario[usuario_id]
+
+    async def _esperar_vez(self, usuario_id: Optional[str]) -> None:
+        vez = asyncio.get_running_loop().create_future()
+        self._a_espera.setdefault(usuario_id, deque()).append(vez)
+        if usuario_id not in self._vez:
+            self._vez.append(usuario_id)
+        try:
+            await vez
+        except asyncio.CancelledError:
+            if vez.done() and not vez.cancelled():
+                self._passar_vez()  # A vaga já era deste pedido: passa ao seguinte
+            else:
+                self._desistir(usuario_id, vez)
+            raise
+
+    def _desistir(self, usuario_id: Optional[str], vez: asyncio.Future) -> None:
+        fila = self._a_espera.get(usuario_id)
+        if fila and vez in fila:
+            fila.remove(vez)
+            if not fila:
+                del self._a_espera[usuario_id]
+                self._vez.remove(usuario_id)
+
+    def _passar_vez(self) -> None:
+        # A vaga que fica livre passa ao primeiro pedido do próximo usuário na rotação
+        while self._vez:
+            usuario_id = self._vez.popleft()
+            fila = self._a_espera[usuario_id]
+            vez = fila.popleft()
+            if fila:
+                self._vez.append(usuario_id)
+            else:
+                del self._a_espera[usuario_id]
+            if not vez.done():
+                vez.set_result(None)
+                return
+        self.em_curso -= 1
+
+    def metricas(self) -> dict:
+        return {
+            **self.contadores,
+            "em_curso": self.em_curso,
+            "concorrencia": self.concorrencia,
+            "na_fila": self.na_fila(),
+            "max_fila": self.max_fila,
+            "usuarios_a_espera": len(self._vez),
+            "servico_medio_s": round(self.servico_medio, 2),
+            "espera_prevista_s": round(self.espera_prevista(), 2),
+            "espera_p50_s": self.esperas.percentil(50),
+            "espera_p95_s": self.esperas.percentil(95),
+        }
+
+
+# Gerações deste processo (streaming, fila de tarefas e secções)
+admissao = ControladorAdmissao()
+metricas.registar("admissao", admissao.metricas)
@@ -0,0 +1,118 @@
+# app/core/blind_index.py
+import hashlib
+import hmac
+import unicodedata
+from typing import Iterable, List, Optional, Set
+from app.core.config import settings
+
+# Os campos cifrados não podem ser pesquisados diretamente. Um índice cego é um
+# HMAC do valor normalizado, guardado numa coluna própria com índice B-tree:
+# permite comparações exatas sem decifrar e sem expor o valor em claro.
+_chave = hashlib.sha256(f"blind-index:{settings.BLIND_INDEX_KEY}".encode()).digest()
+
+
+def blind_index(valor: Optional[str], contexto: str) -> Optional[str]:
+    """
+    Calcula o índice cego de um valor já normalizado. O contexto (ex.: "usuarios.correio")
+    separa os índices de colunas diferentes, para que o mesmo valor não coincida entre elas.
+    """
+    if valor is None:
+        return None
+    mensagem = f"{contexto}\x00{valor}".encode("utf-8")
+    return hmac.new(_chave, mensagem, hashlib.sha256).hexdigest()
+
+
+def normalizar_email(correio: str) -> str:
+    return correio.strip().casefold()
+
+
+def normalizar_bi(bi: str) -> str:
+    return "".join(bi.split()).upper()
+
+
+def indice_correio_usuario(correio: Optional[str]) -> Optional[str]:
+    return blind_index(normalizar_email(correio), "usuarios.correio") if correio else None
+
+
+def indice_correio_paciente(correio: Optional[str]) -> Optional[str]:
+    return blind_index(normalizar_email(correio), "pacientes.correio") if correio else None
+
+
+def indice_bi_paciente(bi: Optional[str]) -> Optional[str]:
+    return blind_index(normalizar_bi(bi), "pacientes.bi") if bi else None
+
+
+def indice_telefone_paciente(telefone: Optional[str]) -> Optional[str]:
+    digitos = "".join(c for c in telefone if c.isdigit()) if telefone else ""
+    return blind_index(digitos, "pacientes.telefone") if digitos else None
+
+
+def indice_tipo_consulta(tipo: Optional[str]) -> Optional[str]:
+    return blind_index(normalizar_texto(tipo), "consultas.tipo") if tipo else None
+
+
+# --- Pesquisa parcial por trigramas -------------------------------------------------
+# Cada palavra do texto é normalizada e decomposta em trigramas ("  ana " -> "  a", " an",
+# "ana", "na "); cada trigrama é guardado como índice cego. Uma pesquisa procura os
+# registros que contêm todos os trigramas do termo pesquisado.
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Minúsculas, sem acentos e com os espaços normalizados ("João  Silva" -> "joao silva").
+    """
+    decomposto = unicodedata.normalize("NFKD", texto)
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acentos.casefold().split())
+
+
+def _palavras(texto: str) -> List[str]:
+    return [p for p in (
+        "".join(c for c in palavra if c.isalnum())
+        for palavra in normalizar_texto(texto).split()
+    ) if p]
+
+
+def trigramas_indice(texto: str) -> Set[str]:
+    """
+    Trigramas a indexar para um texto, incluindo os de início e fim de palavra.
+    """
+    trigramas = set()
+    for palavra in _palavras(texto):
+        marcada = f"  {palavra} "
+        trigramas.update(marcada[i:i + 3] for i in range(len(marcada) - 2))
+    return trigramas
+
+
+def trigramas_pesquisa(texto: str) -> Set[str]:
+    """
+    Trigramas que um registro tem de conter para corresponder à pesquisa. Termos com
+    três ou mais letras procuram-se em qualquer posição; termos mais curtos só no início
+    de uma palavra (pesquisa à medida que se escreve).
+    """
+    trigramas = set()
+    for palavra in _palavras(texto):
+        if len(palavra) >= 3:
+            trigramas.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+        else:
+            marcada = f"  {palavra}"
+            trigramas.update(marcada[i:i + 3] for i in range(len(marcada) - 2))
+    return trigramas
+
+
+def corresponde_pesquisa(texto: str, pesquisa: str) -> bool:
+    """
+    Verificação final, em claro, dos candidatos devolvidos pelo índice (elimina falsos positivos).
+    """
+    palavras_texto = _palavras(texto)
+    normalizado = " ".join(palavras_texto)
+    for termo in _palavras(pesquisa):
+        if len(termo) >= 3:
+            if termo not in normalizado:
+                return False
+        elif not any(p.startswith(termo) for p in palavras_texto):
+            return False
+    return True
+
+
+def tokens_pesquisa(trigramas: Iterable[str], entidade: str) -> List[str]:
+    return [blind_index(t, f"pesquisa.{entidade}")[:32] for t in trigramas]
@@ -0,0 +1,98 @@
+# app/core/cifra.py
+import asyncio
+import base64
+import hashlib
+import os
+from typing import List, Optional, Sequence
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy_utils import StringEncryptedType
+
+# Prefixo dos valores no formato AES-GCM; os valores sem prefixo estão no formato
+# antigo do StringEncryptedType (AES-CBC em base64, que nunca contém ":").
+PREFIXO = "g1:"
+TAMANHO_NONCE = 12
+
+# A partir deste número de valores a decifragem em lote corre numa thread,
+# para não bloquear o event loop.
+LIMIAR_THREAD = 256
+
+
+class AesGcmEncryptedType(StringEncryptedType):
+    """
+    Substituto compatível do StringEncryptedType com AES-GCM (AEAD, acelerado por
+    AES-NI através do OpenSSL) e chave derivada uma só vez por instância.
+
+    O StringEncryptedType deriva a chave (SHA-256) e cria um novo Cipher para cada
+    valor; aqui o objeto AESGCM é criado uma vez e reutilizado. Os valores antigos
+    continuam a ser lidos pelo motor original até serem migrados.
+
+    A cifra é aleatória (nonce por valor): comparações de igualdade em SQL sobre
+    estas colunas não funcionam; usar os índices cegos (app.core.blind_index).
+    """
+    cache_ok = True
+
+    def __init__(self, type_in=None, key=None, **kwargs):
+        super().__init__(type_in, key, **kwargs)
+        self._aead_cache = None
+
+    def _aead(self) -> AESGCM:
+        chave = self._key() if callable(self._key) else self._key
+        cache = self._aead_cache
+        if cache is None or cache[0] != chave:
+            material = chave.encode() if isinstance(chave, str) else chave
+            cache = (chave, AESGCM(hashlib.sha256(b"aes-gcm:" + material).digest()))
+            self._aead_cache = cache
+        return cache[1]
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self.cifrar(str(value))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.decifrar(value)
+
+    def cifrar(self, texto: str) -> str:
+        nonce = os.urandom(TAMANHO_NONCE)
+        cifrado = self._aead().encrypt(nonce, texto.encode("utf-8"), None)
+        return PREFIXO + base64.b64encode(nonce + cifrado).decode("ascii")
+
+    def decifrar(self, valor: str) -> str:
+        if not valor.startswith(PREFIXO):
+            return self.decifrar_legado(valor)
+        dados = base64.b64decode(valor[len(PREFIXO):])
+        return self._aead().decrypt(dados[:TAMANHO_NONCE], dados[TAMANHO_NONCE:], None).decode("utf-8")
+
+    def decifrar_legado(self, valor: str) -> str:
+        # Formato antigo: delega no motor original do StringEncryptedType
+        return super().process_result_value(valor, None)
+
+    @staticmethod
+    def is_legado(valor: Optional[str]) -> bool:
+        return valor is not None and not valor.startswith(PREFIXO)
+
+    def decifrar_lote(self, valores: Sequence[Optional[str]]) -> List[Optional[str]]:
+        """
+        Decifra uma sequência de valores (ex.: uma coluna de um resultado) com o mesmo contexto AESGCM.
+        """
+        aead = self._aead()
+        resultado = []
+        for valor in valores:
+            if valor is None:
+                resultado.append(None)
+            elif valor.startswith(PREFIXO):
+                dados = base64.b64decode(valor[len(PREFIXO):])
+                resultado.append(aead.decrypt(dados[:TAMANHO_NONCE], dados[TAMANHO_NONCE:], None).decode("utf-8"))
+            else:
+                resultado.append(self.decifrar_legado(valor))
+        return resultado
+
+    async def decifrar_lote_async(self, valores: Sequence[Optional[str]]) -> List[Optional[str]]:
+        """
+        Como `decifrar_lote`, mas os resultados grandes são decifrados fora do event loop.
+        """
+        if len(valores) < LIMIAR_THREAD:
+            return self.decifrar_lote(valores)
+        return await asyncio.to_thread(self.decifrar_lote, valores)
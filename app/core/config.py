@@ -4,6 +4,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _mapa(valor: str) -> dict:
+    # "Cardiologia=local, Pediatria=openai" -> {"Cardiologia": "local", "Pediatria": "openai"}
+    pares = (item.split("=", 1) for item in (valor or "").split(",") if "=" in item)
+    return {chave.strip(): nome.strip() for chave, nome in pares}
+
+
 class Settings:
     PROJECT_NAME: str = os.getenv("PROJECT_NAME")
     
@@ -14,14 +21,111 @@ class Settings:
     DB_USER: str = os.getenv("DB_USER")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD")
     DB_DATABASE: str = os.getenv("DB_DATABASE")
+    # Pool de ligações (por processo)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
 
     # Outras configurações  
     ALGORITHM: str = os.getenv("ALGORITHM")  # Algoritmo de codificação JWT
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))  # Default para 30 minutos se não definido
     DB_SECRET_KEY: str = os.getenv("DB_SECRET_KEY")
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
+    # Chave dos índices cegos (HMAC); por omissão derivada da DB_SECRET_KEY
+    BLIND_INDEX_KEY: str = os.getenv("BLIND_INDEX_KEY", os.getenv("DB_SECRET_KEY"))
     
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+    # Servidor compatível com a API da OpenAI (ex.: o servidor falso dos benchmarks); por omissão a OpenAI
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL")
+    OPENAI_MODELO: str = os.getenv("OPENAI_MODELO", "gpt-4o-mini")
+    OPENAI_CONCORRENCIA: int = int(os.getenv("OPENAI_CONCORRENCIA", 16))
+
+    # Backend de geração: "openai", "local" (servidor compatível em CPU) ou "llamacpp" (no processo),
+    # opcionalmente com o modelo ("openai:gpt-4o") e o alternativo depois de ">" ("openai:gpt-4o>local").
+    # Rotas por especialidade: "Cardiologia=openai:gpt-4o>openai, Pediatria=local>openai"
+    LLM_BACKEND_PADRAO: str = os.getenv("LLM_BACKEND_PADRAO", "openai")
+    LLM_BACKEND_POR_ESPECIALIDADE: dict = _mapa(os.getenv("LLM_BACKEND_POR_ESPECIALIDADE"))
+    # Alternativo das rotas que não indicam o seu (vazio = sem alternativo)
+    LLM_BACKEND_ALTERNATIVO: str = os.getenv("LLM_BACKEND_ALTERNATIVO") or None
+    # O principal de uma rota é evitado (os pedidos vão primeiro ao alternativo) quando, nas
+    # chamadas recentes, o p95 da latência (s) ou a taxa de erros passam destes limites;
+    # mínimo de chamadas para decidir e fração de pedidos que testa na mesma o principal
+    LLM_ROTA_LATENCIA_MAX_S: float = float(os.getenv("LLM_ROTA_LATENCIA_MAX_S", 30))
+    LLM_ROTA_TAXA_ERROS_MAX: float = float(os.getenv("LLM_ROTA_TAXA_ERROS_MAX", 0.5))
+    LLM_ROTA_MIN_AMOSTRAS: int = int(os.getenv("LLM_ROTA_MIN_AMOSTRAS", 10))
+    LLM_ROTA_SONDAGEM: float = float(os.getenv("LLM_ROTA_SONDAGEM", 0.05))
+    LLM_LOCAL_URL: str = os.getenv("LLM_LOCAL_URL", "http://localhost:8080/v1")
+    LLM_LOCAL_MODELO: str = os.getenv("LLM_LOCAL_MODELO", "llama-3.1-8b-instruct")
+    LLM_LOCAL_API_KEY: str = os.getenv("LLM_LOCAL_API_KEY", "local")
+    LLM_LOCAL_CONCORRENCIA: int = int(os.getenv("LLM_LOCAL_CONCORRENCIA", 2))
+    LLM_LOCAL_CAMINHO_MODELO: str = os.getenv("LLM_LOCAL_CAMINHO_MODELO")
+    # Limites da conta OpenAI (pedidos e tokens por minuto)
+    OPENAI_RPM: int = int(os.getenv("OPENAI_RPM", 500))
+    OPENAI_TPM: int = int(os.getenv("OPENAI_TPM", 200000))
+
+    # Orçamento de tokens: tokenizador (tiktoken, opcional), tokens para o texto livre
+    # da consulta (diagnóstico + prescrições) e resposta máxima por especialidade
+    TOKENIZADOR: str = os.getenv("TOKENIZADOR", "o200k_base")
+    PROMPT_ORCAMENTO_TOKENS: int = int(os.getenv("PROMPT_ORCAMENTO_TOKENS", 2000))
+    RELATORIO_MAX_TOKENS: int = int(os.getenv("RELATORIO_MAX_TOKENS", 800))
+    RELATORIO_MAX_TOKENS_POR_ESPECIALIDADE: dict = {
+        especialidade: int(valor)
+        for especialidade, valor in _mapa(os.getenv("RELATORIO_MAX_TOKENS_POR_ESPECIALIDADE")).items()
+    }
+
+    # Quota diária de tokens (prompt + resposta) por usuário; 0 = sem limite.
+    # Usuario.quota_tokens_diaria, quando preenchida, substitui este valor
+    QUOTA_TOKENS_DIARIA: int = int(os.getenv("QUOTA_TOKENS_DIARIA", 0))
+
+    # Latência de cauda nas chamadas ao modelo: prazos (s), repetições com jitter,
+    # pedido de cobertura acima do percentil e disjuntor por backend
+    LLM_TIMEOUT_S: float = float(os.getenv("LLM_TIMEOUT_S", 60))
+    LLM_TIMEOUT_PRIMEIRO_TOKEN_S: float = float(os.getenv("LLM_TIMEOUT_PRIMEIRO_TOKEN_S", 15))
+    LLM_TENTATIVAS: int = int(os.getenv("LLM_TENTATIVAS", 3))
+    LLM_ESPERA_BASE_S: float = float(os.getenv("LLM_ESPERA_BASE_S", 0.5))
+    LLM_ESPERA_MAX_S: float = float(os.getenv("LLM_ESPERA_MAX_S", 8))
+    LLM_HEDGE_ATIVO: bool = os.getenv("LLM_HEDGE_ATIVO", "false").lower() == "true"
+    LLM_HEDGE_PERCENTIL: float = float(os.getenv("LLM_HEDGE_PERCENTIL", 95))
+    LLM_HEDGE_MIN_AMOSTRAS: int = int(os.getenv("LLM_HEDGE_MIN_AMOSTRAS", 20))
+    CB_LIMIAR_FALHAS: int = int(os.getenv("CB_LIMIAR_FALHAS", 5))
+    CB_TEMPO_ABERTO_S: float = float(os.getenv("CB_TEMPO_ABERTO_S", 30))
+
+    # Prazo de um pedido de geração, do início da geração ao relatório gravado (s), e espera
+    # antes de cancelar uma geração em streaming que ninguém está a seguir
+    RELATORIO_PRAZO_S: float = float(os.getenv("RELATORIO_PRAZO_S", 300))
+    STREAM_GRACA_S: float = float(os.getenv("STREAM_GRACA_S", 5))
+
+    # Reescrever em AES-GCM, no arranque, os valores cifrados no formato antigo
+    MIGRAR_CIFRA_NO_ARRANQUE: bool = os.getenv("MIGRAR_CIFRA_NO_ARRANQUE", "false").lower() == "true"
+
+    # Paginação das listagens (registros por página)
+    PAGE_SIZE: int = int(os.getenv("PAGE_SIZE", 50))
+
+    # Fila de geração de relatórios: workers em paralelo e tentativas por tarefa
+    RELATORIO_WORKERS: int = int(os.getenv("RELATORIO_WORKERS", 4))
+    RELATORIO_MAX_TENTATIVAS: int = int(os.getenv("RELATORIO_MAX_TENTATIVAS", 3))
+
+    # Cache dos textos gerados: validade (horas) e número máximo de entradas (LRU)
+    CACHE_RELATORIO_TTL_HORAS: int = int(os.getenv("CACHE_RELATORIO_TTL_HORAS", 168))
+    CACHE_RELATORIO_MAX_ENTRADAS: int = int(os.getenv("CACHE_RELATORIO_MAX_ENTRADAS", 10000))
+
+    # Geração em lote: chamadas ao modelo em paralelo e relatórios por INSERT
+    LOTE_CONCORRENCIA: int = int(os.getenv("LOTE_CONCORRENCIA", 8))
+    LOTE_TAMANHO_ESCRITA: int = int(os.getenv("LOTE_TAMANHO_ESCRITA", 20))
+
+    # Pré-geração ao gravar uma consulta (aquece a cache antes de o médico abrir o relatório):
+    # espera sem novas edições, gerações especulativas em paralelo
+    PRE_GERACAO_ATIVA: bool = os.getenv("PRE_GERACAO_ATIVA", "false").lower() == "true"
+    PRE_GERACAO_ATRASO_S: float = float(os.getenv("PRE_GERACAO_ATRASO_S", 20))
+    PRE_GERACAO_CONCORRENCIA: int = int(os.getenv("PRE_GERACAO_CONCORRENCIA", 1))
+
+    # Controlo de admissão das gerações, por processo: chamadas ao modelo em simultâneo,
+    # pedidos à espera de vez, pedidos por usuário (em curso ou à espera), espera prevista
+    # acima da qual o pedido é recusado com 503 (s) e duração prevista antes de medições (s)
+    ADMISSAO_CONCORRENCIA: int = int(os.getenv("ADMISSAO_CONCORRENCIA", 8))
+    ADMISSAO_MAX_FILA: int = int(os.getenv("ADMISSAO_MAX_FILA", 32))
+    ADMISSAO_MAX_POR_USUARIO: int = int(os.getenv("ADMISSAO_MAX_POR_USUARIO", 3))
+    ADMISSAO_ESPERA_ALVO_S: float = float(os.getenv("ADMISSAO_ESPERA_ALVO_S", 30))
+    ADMISSAO_SERVICO_INICIAL_S: float = float(os.getenv("ADMISSAO_SERVICO_INICIAL_S", 15))
     
 
     @property
@@ -15,6 +15,8 @@ engine = create_async_engine(
     DATABASE_URL, 
     echo=True,
     future=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
 )
 
 async_session = sessionmaker(
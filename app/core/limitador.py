@@ -0,0 +1,38 @@
+import asyncio
+import time
+from app.core.config import settings
+
+
+class TokenBucket:
+    """
+    Balde de fichas assíncrono: até `por_minuto` unidades por minuto, repostas de forma
+    contínua. Quem pede mais do que há espera, por ordem de chegada.
+    """
+
+    def __init__(self, por_minuto: float):
+        self.capacidade = float(por_minuto)
+        self.taxa = self.capacidade / 60  # Fichas por segundo
+        self._fichas = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _repor(self) -> None:
+        agora = time.monotonic()
+        self._fichas = min(self.capacidade, self._fichas + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    async def adquirir(self, quantidade: float = 1) -> None:
+        # Um pedido maior do que o balde esvazia-o por completo em vez de esperar para sempre
+        quantidade = min(quantidade, self.capacidade)
+        async with self._lock:
+            while True:
+                self._repor()
+                if self._fichas >= quantidade:
+                    self._fichas -= quantidade
+                    return
+                await asyncio.sleep((quantidade - self._fichas) / self.taxa)
+
+
+# Limites da conta OpenAI, partilhados por todas as gerações deste processo
+pedidos_por_minuto = TokenBucket(settings.OPENAI_RPM)
+tokens_por_minuto = TokenBucket(settings.OPENAI_TPM)
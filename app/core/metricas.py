@@ -0,0 +1,30 @@
+from typing import Callable, Dict
+from app.core.config import settings
+from app.core.database import engine
+
+# Fontes de métricas do processo, expostas em /core/metricas
+_fontes: Dict[str, Callable[[], dict]] = {}
+
+
+def registar(nome: str, fonte: Callable[[], dict]) -> None:
+    _fontes[nome] = fonte
+
+
+def recolher() -> dict:
+    return {nome: fonte() for nome, fonte in _fontes.items()}
+
+
+def estado_pool() -> dict:
+    pool = engine.pool
+    capacidade = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    em_uso = pool.checkedout()
+    return {
+        "tamanho": pool.size(),
+        "capacidade": capacidade,
+        "em_uso": em_uso,
+        "overflow": pool.overflow(),
+        "saturado": em_uso >= capacidade,
+    }
+
+
+registar("pool", estado_pool)
@@ -0,0 +1,112 @@
+import random
+import time
+from collections import deque
+from typing import Optional
+
+# Estados do disjuntor
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+MENSAGEM_INDISPONIVEL = (
+    "O serviço de geração de relatórios está temporariamente indisponível. "
+    "Tente novamente dentro de alguns instantes."
+)
+
+
+MENSAGEM_PRAZO = "A geração do relatório excedeu o tempo máximo. Tente novamente."
+
+
+class PrazoExcedido(Exception):
+    """O pedido de geração passou do prazo total (RELATORIO_PRAZO_S)."""
+
+    def __init__(self):
+        super().__init__(MENSAGEM_PRAZO)
+
+
+class CircuitoAberto(Exception):
+    """O disjuntor está aberto: a chamada é recusada sem tentar o serviço."""
+
+    def __init__(self, nome: str, espera: float):
+        super().__init__(MENSAGEM_INDISPONIVEL)
+        self.nome = nome
+        self.espera = espera  # Segundos até à próxima tentativa de teste
+
+
+class DisjuntorCircuito:
+    """
+    Circuit breaker: depois de `limiar_falhas` falhas seguidas abre durante `tempo_aberto`
+    segundos e recusa as chamadas de imediato. Passado esse tempo deixa passar uma
+    chamada de teste (meio aberto): sucesso fecha-o, falha volta a abri-lo.
+    """
+
+    def __init__(self, nome: str, limiar_falhas: int, tempo_aberto: float):
+        self.nome = nome
+        self.limiar_falhas = limiar_falhas
+        self.tempo_aberto = tempo_aberto
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.aberturas = 0
+        self.rejeicoes = 0
+        self._aberto_ate = 0.0
+        self._teste_em_curso = False
+
+    def espera(self) -> float:
+        return max(0.0, self._aberto_ate - time.monotonic())
+
+    def disponivel(self) -> bool:
+        """Indica se uma chamada seria aceite agora, sem a registar."""
+        if self.estado == ABERTO:
+            return self.espera() == 0
+        return not (self.estado == MEIO_ABERTO and self._teste_em_curso)
+
+    def verificar(self) -> None:
+        if self.estado == ABERTO and self.espera() == 0:
+            self.estado = MEIO_ABERTO
+            self._teste_em_curso = False
+        if self.estado == ABERTO or (self.estado == MEIO_ABERTO and self._teste_em_curso):
+            self.rejeicoes += 1
+            raise CircuitoAberto(self.nome, self.espera() or self.tempo_aberto)
+        if self.estado == MEIO_ABERTO:
+            self._teste_em_curso = True
+
+    def sucesso(self) -> None:
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self._teste_em_curso = False
+
+    def libertar(self) -> None:
+        """A chamada foi cancelada sem resultado: liberta a vaga de teste, se a tinha."""
+        self._teste_em_curso = False
+
+    def falha(self) -> None:
+        self.falhas_seguidas += 1
+        if self.estado == MEIO_ABERTO or self.falhas_seguidas >= self.limiar_falhas:
+            self.estado = ABERTO
+            self.aberturas += 1
+            self._aberto_ate = time.monotonic() + self.tempo_aberto
+            self._teste_em_curso = False
+
+
+class JanelaLatencias:
+    """Últimas `tamanho` latências (segundos) para percentis em tempo real."""
+
+    def __init__(self, tamanho: int = 200):
+        self._valores = deque(maxlen=tamanho)
+
+    def __len__(self) -> int:
+        return len(self._valores)
+
+    def registar(self, segundos: float) -> None:
+        self._valores.append(segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        if not self._valores:
+            return None
+        ordenados = sorted(self._valores)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def espera_com_jitter(tentativa: int, base: float, maximo: float) -> float:
+    """Backoff exponencial com "full jitter": aleatório entre 0 e base·2^tentativa (limitado)."""
+    return random.uniform(0, min(maximo, base * 2 ** tentativa))
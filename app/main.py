@@ -15,6 +15,11 @@ from app.api.relatorio import router as relatorio_router
 
 
 from app.services.usuario import get_user_by_email, create_user, get_user_by_email
+from app.services.indices import preencher_indices_cegos, preencher_indice_pesquisa
+from app.services.migracao_cifra import migrar_cifra_legada
+from app.services.tarefas import fila_relatorios
+from app.services.pre_geracao import pre_geracao
+from app.services.backends_llm import aquecer_backends
 from app.schemas.usuario import UsuarioCreate
 from app.core.config import settings
 
@@ -81,6 +86,11 @@ app = get_app()
 @app.on_event("startup")
 async def on_startup():
     async with async_session() as db:
+        await preencher_indices_cegos(db)
+        await preencher_indice_pesquisa(db)
+        if settings.MIGRAR_CIFRA_NO_ARRANQUE:
+            await migrar_cifra_legada(db)
+        
         admin_email = "admin@bot.com"
         if not await get_user_by_email(db, admin_email):
             admin_user = UsuarioCreate(
@@ -90,11 +100,17 @@ async def on_startup():
                 role="Administrador"
             )
             await create_user(db, admin_user)  
+
+    # Backends de geração prontos antes do primeiro pedido; depois os workers da fila
+    await aquecer_backends()
+    await fila_relatorios.iniciar()
              
     
             
 @app.on_event("shutdown")
 async def shutdown():
+    await pre_geracao.parar()
+    await fila_relatorios.parar()
     await async_session.close_all()
 
 if __name__ == "__main__":
@@ -1,2 +1,6 @@
 from .relatorio import Usuario
-from .auditoria import Auditoria
\ No newline at end of file
+from .auditoria import Auditoria
+from .pesquisa import IndicePesquisa
+from .tarefa import TarefaRelatorio
+from .cache import CacheRelatorio
+from .uso import UsoDiario
\ No newline at end of file
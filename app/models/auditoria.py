@@ -1,12 +1,13 @@
 import pytz
 from datetime import datetime
 from nanoid import generate
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
 class Auditoria(Base):
     __tablename__ = "auditoria"
+    __table_args__ = (Index("ix_auditoria_data_criacao_id", "data_criacao", "id"),)
 
     id = Column(String(40), primary_key=True, default=generate)
     acao = Column(String(200), nullable=False) 
@@ -0,0 +1,31 @@
+import pytz
+from datetime import datetime
+from sqlalchemy import Column, Date, DateTime, Index, Integer, String, Text
+from app.core.database import Base
+from app.core.config import settings
+from app.core.cifra import AesGcmEncryptedType
+
+key = settings.DB_SECRET_KEY
+
+
+class CacheRelatorio(Base):
+    """
+    Textos gerados pelo modelo, endereçados pelo conteúdo do prompt: a chave é o HMAC
+    das mensagens e dos parâmetros do modelo, e o texto fica cifrado como os restantes
+    dados clínicos.
+    """
+    __tablename__ = "cache_relatorio"
+    __table_args__ = (Index("ix_cache_relatorio_data_ultimo_acesso", "data_ultimo_acesso"),)
+
+    chave = Column(String(64), primary_key=True)
+    conteudo = Column(AesGcmEncryptedType(Text, key), nullable=False)
+    modelo = Column(String(100), nullable=False)
+    duracao_ms = Column(Integer, nullable=False, default=0)  # Tempo da geração original
+    acessos = Column(Integer, nullable=False, default=0)
+    data_criacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
+    data_ultimo_acesso = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
+    # Pré-geração ainda não entregue: dia em que o uso ficou gravado sem usuário e o custo
+    # a cobrar a quem receber o texto primeiro (pre_gerada_em passa a nulo nessa altura)
+    pre_gerada_em = Column(Date, nullable=True)
+    tokens_prompt = Column(Integer, nullable=True)
+    tokens_resposta = Column(Integer, nullable=True)
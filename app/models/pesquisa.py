@@ -0,0 +1,18 @@
+from sqlalchemy import BigInteger, Column, String, Index
+from app.core.database import Base
+
+class IndicePesquisa(Base):
+    """
+    Índice de trigramas cifrados (HMAC) dos nomes de pacientes e usuários, para a
+    pesquisa parcial por nome sem decifrar a tabela inteira.
+    """
+    __tablename__ = "indice_pesquisa"
+    __table_args__ = (
+        Index("ix_indice_pesquisa_entidade_token", "entidade", "token", "entidade_id"),
+        Index("ix_indice_pesquisa_entidade_id", "entidade", "entidade_id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    entidade = Column(String(20), nullable=False)  # "paciente" ou "usuario"
+    entidade_id = Column(String(40), nullable=False)
+    token = Column(String(32), nullable=False)
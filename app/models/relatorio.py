@@ -1,67 +1,136 @@
 import pytz
 from datetime import datetime
 from nanoid import generate
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, Float, Time
-from sqlalchemy_utils import StringEncryptedType
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Text, Float, Time, UniqueConstraint
+from sqlalchemy.orm import deferred, relationship, validates
 from app.core.database import Base
 from app.core.config import settings
+from app.core.blind_index import indice_bi_paciente, indice_correio_paciente, indice_correio_usuario, indice_telefone_paciente, indice_tipo_consulta
+from app.core.cifra import AesGcmEncryptedType
 
 key = settings.DB_SECRET_KEY
 
+# Colunas Text pesadas que só são carregadas (e decifradas) nas vistas de detalhe e
+# nos formulários de edição: as consultas que as usam pedem undefer_group(GRUPO_DETALHE).
+# Com raiseload, um acesso sem undefer lança um erro em vez de fazer uma consulta implícita.
+GRUPO_DETALHE = "detalhe"
+
 class Usuario(Base):
     __tablename__ = "usuarios"
+    __table_args__ = (Index("ix_usuarios_data_criacao_id", "data_criacao", "id"),)
     
     id = Column(String(40), primary_key=True, default=generate)
-    nome_completo = Column(StringEncryptedType(String(200), key), nullable=False)
-    correio = Column(StringEncryptedType(String(200), key), unique=True, index=True, nullable=False)
-    senha = Column(StringEncryptedType(String(200), key), nullable=False)
-    telefone = Column(StringEncryptedType(String(200), key), nullable=True)
+    nome_completo = Column(AesGcmEncryptedType(String(200), key), nullable=False)
+    correio = Column(AesGcmEncryptedType(String(200), key), nullable=False)
+    correio_bidx = Column(String(64), unique=True, index=True, nullable=True)  # Índice cego do correio
+    senha = Column(AesGcmEncryptedType(String(200), key), nullable=False)
+    telefone = Column(AesGcmEncryptedType(String(200), key), nullable=True)
     role = Column(String(100), nullable=False) #"funcionario", "administrador"
-    especialidade = Column(StringEncryptedType(String(100), key), nullable=True) 
+    especialidade = Column(AesGcmEncryptedType(String(100), key), nullable=True) 
+    quota_tokens_diaria = Column(Integer, nullable=True)  # Nulo: QUOTA_TOKENS_DIARIA; 0: sem limite
     deleted = Column(Boolean, default=False)
     data_criacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
     data_atualizacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc))
        
     auditorias = relationship("Auditoria", back_populates="usuario")
     consultas = relationship("Consulta", back_populates="usuario")
+
+    @validates("correio")
+    def _indexar_correio(self, key, value):
+        self.correio_bidx = indice_correio_usuario(value)
+        return value
     
 class Paciente(Base):
     __tablename__ = 'pacientes'
+    __table_args__ = (Index('ix_pacientes_data_criacao_id', 'data_criacao', 'id'),)
     
     id = Column(String(40), primary_key=True, default=generate)
-    nome_completo = Column(StringEncryptedType(String(200), key), nullable=False)
+    nome_completo = Column(AesGcmEncryptedType(String(200), key), nullable=False)
     data_nascimento = Column(DateTime, nullable=False)
-    bi = Column(StringEncryptedType(String(200), key), unique=True, nullable=False)
-    sexo = Column(StringEncryptedType(String(200), key), unique=True, nullable=False)
-    correio = Column(StringEncryptedType(String(200), key), unique=True, index=True, nullable=True)
-    telefone = Column(StringEncryptedType(String(200), key), nullable=False)
-    endereco = Column(StringEncryptedType(Text, key), nullable=False)
+    bi = Column(AesGcmEncryptedType(String(200), key), nullable=False)
+    bi_bidx = Column(String(64), unique=True, index=True, nullable=True)  # Índice cego do BI
+    sexo = Column(AesGcmEncryptedType(String(200), key), unique=True, nullable=False)
+    correio = Column(AesGcmEncryptedType(String(200), key), nullable=True)
+    correio_bidx = Column(String(64), unique=True, index=True, nullable=True)  # Índice cego do correio
+    telefone = Column(AesGcmEncryptedType(String(200), key), nullable=False)
+    telefone_bidx = Column(String(64), index=True, nullable=True)  # Índice cego do telefone
+    endereco = deferred(Column(AesGcmEncryptedType(Text, key), nullable=False), group=GRUPO_DETALHE, raiseload=True)
     deleted = Column(Boolean, default=False)
     data_criacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
     data_atualizacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc))
 
     consultas = relationship("Consulta", back_populates="paciente")
+
+    @validates("bi")
+    def _indexar_bi(self, key, value):
+        self.bi_bidx = indice_bi_paciente(value)
+        return value
+
+    @validates("correio")
+    def _indexar_correio(self, key, value):
+        self.correio_bidx = indice_correio_paciente(value)
+        return value
+
+    @validates("telefone")
+    def _indexar_telefone(self, key, value):
+        self.telefone_bidx = indice_telefone_paciente(value)
+        return value
     
 class Relatorio(Base):
     __tablename__ = 'relatorios'
+    __table_args__ = (
+        Index('ix_relatorios_data_criacao_id', 'data_criacao', 'id'),
+        Index('ix_relatorios_consulta_chave_entrada', 'consulta_id', 'chave_entrada'),
+    )
     
     id = Column(String(40), primary_key=True, default=generate)
-    conteudo = Column(StringEncryptedType(Text, key), nullable=False)  # Relatório gerado pelo modelo de IA
+    conteudo = deferred(Column(AesGcmEncryptedType(Text, key), nullable=False), group=GRUPO_DETALHE, raiseload=True)  # Relatório gerado pelo modelo de IA
+    tokens_prompt = Column(Integer, nullable=True)  # Uso reportado pelo modelo (nulo se veio da cache, salvo texto pré-gerado)
+    tokens_resposta = Column(Integer, nullable=True)
+    modelo = Column(String(100), nullable=True)
+    backend = Column(String(20), nullable=True)  # "openai", "local", ..., "cache" ou "lote"
+    latencia_ms = Column(Integer, nullable=True)
+    # Impressão digital (chave da cache) dos dados da consulta de onde foi gerado; nula
+    # nos relatórios anteriores a este registo
+    chave_entrada = Column(String(64), nullable=True)
     deleted = Column(Boolean, default=False)
     data_criacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
     data_atualizacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc))
 
     consulta_id = Column(String(40), ForeignKey("consultas.id"), nullable=True)
     consulta = relationship("Consulta", back_populates="relatorios")
+    # Secções do relatório; `conteudo` guarda o texto completo montado a partir delas
+    secoes = relationship(
+        "SecaoRelatorio", back_populates="relatorio", order_by="SecaoRelatorio.ordem", cascade="all, delete-orphan"
+    )
+
+
+class SecaoRelatorio(Base):
+    """Uma secção do relatório (Resumo Clínico, Prognóstico, ...), regenerável sozinha."""
+    __tablename__ = 'secoes_relatorio'
+    __table_args__ = (UniqueConstraint('relatorio_id', 'chave', name='uq_secoes_relatorio_chave'),)
+
+    id = Column(String(40), primary_key=True, default=generate)
+    chave = Column(String(30), nullable=False)  # Ex.: "resumo_clinico" (ver app.services.secoes)
+    ordem = Column(Integer, nullable=False)
+    conteudo = Column(AesGcmEncryptedType(Text, key), nullable=False)
+    data_atualizacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc))
+
+    relatorio_id = Column(String(40), ForeignKey("relatorios.id"), nullable=False)
+    relatorio = relationship("Relatorio", back_populates="secoes")
     
 class Consulta(Base):
     __tablename__ = 'consultas'
+    __table_args__ = (Index('ix_consultas_data_criacao_id', 'data_criacao', 'id'),)
     
     id = Column(String(40), primary_key=True, default=generate)
-    diagnostico = Column(StringEncryptedType(Text, key), nullable=True)
-    prescricoes = Column(StringEncryptedType(Text, key), nullable=True)
-    tipo = Column(StringEncryptedType(String(100), key), nullable=False)  # Tipo da consulta (Ex: "Cardiologia", "Pediatria") -> especialidade do Usuario
+    diagnostico = deferred(Column(AesGcmEncryptedType(Text, key), nullable=True), group=GRUPO_DETALHE, raiseload=True)
+    prescricoes = deferred(Column(AesGcmEncryptedType(Text, key), nullable=True), group=GRUPO_DETALHE, raiseload=True)
+    tipo = Column(AesGcmEncryptedType(String(100), key), nullable=False)  # Tipo da consulta (Ex: "Cardiologia", "Pediatria") -> especialidade do Usuario
+    tipo_bidx = Column(String(64), index=True, nullable=True)  # Índice cego do tipo
+    # Impressão digital dos dados atuais, calculada ao gravar e ao gerar: um relatório
+    # com outra chave_entrada está desatualizado
+    chave_entrada = Column(String(64), nullable=True)
     deleted = Column(Boolean, default=False)
     data_criacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
     data_atualizacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc), onupdate=lambda: datetime.now(pytz.utc))
@@ -75,5 +144,10 @@ class Consulta(Base):
     
     relatorios = relationship("Relatorio", back_populates="consulta")
 
+    @validates("tipo")
+    def _indexar_tipo(self, key, value):
+        self.tipo_bidx = indice_tipo_consulta(value)
+        return value
+
 
     
@@ -0,0 +1,51 @@
+import pytz
+from datetime import datetime
+from nanoid import generate
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+
+# Estados de uma tarefa de geração
+PENDENTE = "pendente"
+EM_EXECUCAO = "em_execucao"
+CONCLUIDA = "concluida"
+FALHADA = "falhada"
+CANCELADA = "cancelada"  # Pelo usuário, ou ninguém estava à espera do resultado
+
+# Origem: a fila de workers ou um pedido em streaming, que gera no próprio pedido
+FILA = "fila"
+STREAM = "stream"
+
+
+class TarefaRelatorio(Base):
+    """
+    Pedido de geração de um relatório por IA. A tabela é a fila durável: as tarefas
+    pendentes (ou interrompidas a meio) são retomadas pelos workers no arranque.
+
+    chave_ativa é a chave de idempotência: igual a chave_entrada enquanto a tarefa está
+    pendente ou em execução e nula depois. A restrição única impede, mesmo entre
+    processos, duas gerações em curso da mesma consulta com os mesmos dados.
+    """
+    __tablename__ = "tarefas_relatorio"
+    __table_args__ = (
+        Index("ix_tarefas_relatorio_estado_data_criacao", "estado", "data_criacao"),
+        UniqueConstraint("consulta_id", "chave_ativa", name="uq_tarefas_relatorio_chave_ativa"),
+    )
+
+    id = Column(String(40), primary_key=True, default=generate)
+    estado = Column(String(20), nullable=False, default=PENDENTE)
+    tentativas = Column(Integer, nullable=False, default=0)
+    forcar = Column(Boolean, nullable=False, default=False)  # Ignorar a cache de textos gerados
+    origem = Column(String(10), nullable=False, default=FILA)
+    chave_entrada = Column(String(64), nullable=True, index=True)  # Chave da cache: prompt e parâmetros
+    chave_ativa = Column(String(64), nullable=True)
+    erro = Column(String(500), nullable=True)  # Só o tipo e a mensagem da exceção, sem dados clínicos
+    data_criacao = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc))
+    data_inicio = Column(DateTime(timezone=True), nullable=True)
+    data_conclusao = Column(DateTime(timezone=True), nullable=True)
+
+    consulta_id = Column(String(40), ForeignKey("consultas.id"), nullable=False)
+    usuario_id = Column(String(40), ForeignKey("usuarios.id"), nullable=False)  # Quem pediu a geração
+    relatorio_id = Column(String(40), ForeignKey("relatorios.id"), nullable=True)
+
+    relatorio = relationship("Relatorio")
@@ -0,0 +1,27 @@
+from nanoid import generate
+from sqlalchemy import BigInteger, Column, Date, ForeignKey, Integer, String, UniqueConstraint
+from app.core.database import Base
+from app.core.config import settings
+from app.core.cifra import AesGcmEncryptedType
+
+key = settings.DB_SECRET_KEY
+
+
+class UsoDiario(Base):
+    """
+    Uso do modelo pré-agregado por dia (UTC), usuário e especialidade. O painel e as
+    quotas diárias leem esta tabela pequena em vez de somar os relatórios.
+    """
+    __tablename__ = "uso_diario"
+    __table_args__ = (UniqueConstraint("dia", "usuario_id", "especialidade_bidx", name="uq_uso_diario"),)
+
+    id = Column(String(40), primary_key=True, default=generate)
+    dia = Column(Date, nullable=False, index=True)
+    usuario_id = Column(String(40), ForeignKey("usuarios.id"), nullable=True)  # Nulo nos lotes offline sem usuário
+    especialidade = Column(AesGcmEncryptedType(String(100), key), nullable=True)
+    especialidade_bidx = Column(String(64), nullable=False, default="")  # Índice cego do tipo da consulta
+    geracoes = Column(Integer, nullable=False, default=0)  # Chamadas ao modelo
+    geracoes_cache = Column(Integer, nullable=False, default=0)  # Relatórios servidos pela cache
+    tokens_prompt = Column(BigInteger, nullable=False, default=0)
+    tokens_resposta = Column(BigInteger, nullable=False, default=0)
+    latencia_ms = Column(BigInteger, nullable=False, default=0)  # Soma; a média é latencia_ms / geracoes
@@ -0,0 +1,43 @@
+from pydantic import BaseModel
+from typing import Optional
+
+# Número máximo de linhas que o DataTables pode pedir de uma vez
+MAX_LENGTH = 100
+
+
+class DataTableParams(BaseModel):
+    draw: int = 0
+    start: int = 0
+    length: int = 10
+    search: str = ""
+    order_column: Optional[str] = None
+    order_dir: str = "desc"
+    cursor: Optional[str] = None
+    direction: str = "next"
+
+    @classmethod
+    def from_query(cls, query_params) -> "DataTableParams":
+        """
+        Lê os parâmetros do protocolo server-side do DataTables
+        (ex.: "search[value]", "order[0][column]", "columns[2][data]").
+        Lança ValueError se algum valor numérico for inválido.
+        """
+        length = int(query_params.get("length", 10))
+        if length < 1 or length > MAX_LENGTH:
+            length = MAX_LENGTH
+
+        order_index = query_params.get("order[0][column]")
+        order_column = None
+        if order_index is not None:
+            order_column = query_params.get(f"columns[{int(order_index)}][data]")
+
+        return cls(
+            draw=int(query_params.get("draw", 0)),
+            start=max(int(query_params.get("start", 0)), 0),
+            length=length,
+            search=query_params.get("search[value]", "").strip(),
+            order_column=order_column,
+            order_dir="asc" if query_params.get("order[0][dir]") == "asc" else "desc",
+            cursor=query_params.get("cursor") or None,
+            direction="prev" if query_params.get("direction") == "prev" else "next",
+        )
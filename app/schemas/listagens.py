@@ -0,0 +1,40 @@
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+# Linhas das listas: só as colunas mostradas, sem estado ORM (tuplas imutáveis, sem __dict__)
+
+
+class PacienteLinha(NamedTuple):
+    id: str
+    nome_completo: str
+    data_nascimento: date
+    bi: str
+    telefone: str
+    data_criacao: datetime
+
+
+class ConsultaLinha(NamedTuple):
+    id: str
+    tipo: str
+    paciente_nome: Optional[str]
+    medico_nome: Optional[str]
+    estado_relatorio: str  # "atual", "desatualizado", "desconhecido" ou "sem_relatorio"
+    data_criacao: datetime
+
+
+class RelatorioLinha(NamedTuple):
+    id: str
+    tipo: Optional[str]
+    paciente_nome: Optional[str]
+    medico_nome: Optional[str]
+    estado: str  # "atual", "desatualizado" ou "desconhecido"
+    data_criacao: datetime
+
+
+class UsuarioLinha(NamedTuple):
+    id: str
+    nome_completo: str
+    correio: str
+    telefone: str
+    especialidade: Optional[str]
+    data_criacao: datetime
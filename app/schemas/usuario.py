@@ -19,6 +19,7 @@ class UsuarioUpdate(BaseModel):
     telefone: Optional[str] = Field(None, max_length=200)
     role: Optional[str] = Field(None, max_length=100)
     especialidade: Optional[str] = Field(..., max_length=100)
+    quota_tokens_diaria: Optional[int] = Field(None, ge=0)
 
 class UsuarioResponse(UsuarioBase):
     id: str
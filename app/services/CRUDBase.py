@@ -1,12 +1,99 @@
-from typing import Optional, TypeVar, Generic, Type, List
+import base64
+import json
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Tuple, TypeVar, Generic, Type, List
+from sqlalchemy import Text, and_, or_, func, type_coerce
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload, joinedload
 from app.core.database import Base
+from app.core.cifra import AesGcmEncryptedType
+from app.schemas.datatables import DataTableParams
 
 # Tipo genérico para os modelos
 T = TypeVar('T', bound='Base')
 
+
+class Page(NamedTuple):
+    """Página de resultados com cursores opacos para a página seguinte e anterior."""
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+class DataTablePage(NamedTuple):
+    """Janela de resultados para o processamento server-side do DataTables."""
+    items: List[Any]
+    total: int
+    filtered: int
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+class Projection:
+    """
+    Leitura apenas das colunas mostradas numa lista, devolvidas como DTOs compactos
+    (NamedTuple) em vez de objetos ORM: sem identity map nem relações carregadas.
+
+    As colunas cifradas são lidas em bruto e decifradas em lote no fim, coluna a coluna.
+
+    :param row_type: NamedTuple cujos campos são as colunas da lista (inclui id e data_criacao).
+    :param columns: Mapa campo do DTO -> coluna SQL.
+    :param joins: Pares (entidade, condição) para LEFT OUTER JOIN.
+    """
+
+    def __init__(self, row_type, columns: dict, joins: Tuple = ()):
+        self.row_type = row_type
+        self.columns = columns
+        self.joins = joins
+        self._encrypted = {
+            field: column.expression.type
+            for field, column in columns.items()
+            if isinstance(column.expression.type, AesGcmEncryptedType)
+        }
+
+    def select(self, model):
+        exprs = []
+        for field in self.row_type._fields:
+            column = self.columns[field]
+            if field in self._encrypted:
+                exprs.append(type_coerce(column, Text).label(field))
+            else:
+                exprs.append(column.label(field))
+        stmt = select(*exprs).select_from(model)
+        for target, onclause in self.joins:
+            stmt = stmt.outerjoin(target, onclause)
+        return stmt
+
+    async def materialize(self, rows) -> List[Any]:
+        if not rows:
+            return []
+        columns = [list(values) for values in zip(*rows)]
+        for index, field in enumerate(self.row_type._fields):
+            if field in self._encrypted:
+                columns[index] = await self._encrypted[field].decifrar_lote_async(columns[index])
+        return [self.row_type._make(values) for values in zip(*columns)]
+
+
+def encode_cursor(data_criacao: datetime, id: str) -> str:
+    """
+    Codifica a chave (data_criacao, id) de um registro num cursor opaco para URLs.
+    """
+    raw = json.dumps([data_criacao.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Descodifica um cursor gerado por `encode_cursor`. Lança ValueError se for inválido.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data_criacao, id = json.loads(raw)
+        return datetime.fromisoformat(data_criacao), str(id)
+    except (TypeError, ValueError) as ex:
+        raise ValueError("Cursor inválido") from ex
+
 class CRUDBase(Generic[T]):
     def __init__(self, model: Type[T]):
         self.model = model
@@ -33,32 +120,27 @@ class CRUDBase(Generic[T]):
         self,
         db: AsyncSession,
         skip: int = 0,
-        limit: int = 100,
+        limit: Optional[int] = 100,
         load_relationships: Optional[List[str]] = None,
-        relationship_style: str = "selectin"
+        relationship_style: str = "selectin",
+        projection: Optional[Projection] = None,
     ) -> List[T]:
         """
         Retorna uma lista de registros com paginação de forma assíncrona.
         
         :param db: Sesión asíncrona de SQLAlchemy.
         :param skip: Número de registros a omitir (paginación).
-        :param limit: Número máximo de registros a retornar.
+        :param limit: Número máximo de registros a retornar (None: sin límite).
         :param load_relationships: Lista de nombres de relaciones a cargar.
         :param relationship_style: Estilo de carga de relaciones ("selectin" o "joined").
+        :param projection: Proyección a DTOs en lugar de objetos del modelo.
         :return: Lista de registros del modelo.
         """
         # Construir la consulta base
-        stmt = select(self.model).where(self.model.deleted == False)
+        stmt = self._select_active(projection)
         
         # Cargar relaciones si se especifican
-        if load_relationships:
-            for rel in load_relationships:
-                if relationship_style == "selectin":
-                    stmt = stmt.options(selectinload(getattr(self.model, rel)))
-                elif relationship_style == "joined":
-                    stmt = stmt.options(joinedload(getattr(self.model, rel)))
-                else:
-                    raise ValueError("relationship_style debe ser 'selectin' o 'joined'")
+        stmt = self._load_relationships(stmt, load_relationships, relationship_style)
         
         # Aplicar paginación
         stmt = stmt.offset(skip).limit(limit)
@@ -67,7 +149,186 @@ class CRUDBase(Generic[T]):
         result = await db.execute(stmt)
         
         # Retornar los resultados
-        return result.unique().scalars().all()
+        return await self._materialize(result, projection)
+
+    async def get_page(
+        self,
+        db: AsyncSession,
+        cursor: Optional[str] = None,
+        direction: str = "next",
+        limit: int = 50,
+        load_relationships: Optional[List[str]] = None,
+        relationship_style: str = "selectin",
+        options: Optional[List[Any]] = None,
+        filters: Optional[List[Any]] = None,
+        projection: Optional[Projection] = None,
+    ) -> Page:
+        """
+        Retorna uma página de registros com paginação por cursor (keyset) sobre
+        (data_criacao, id), do mais recente para o mais antigo.
+
+        Ao contrário de `get_all`, o custo de cada página não depende da sua
+        posição na tabela: a consulta parte sempre do índice (data_criacao, id).
+
+        :param cursor: Cursor opaco devolvido numa página anterior (None para a primeira).
+        :param direction: "next" para avançar a partir do cursor, "prev" para recuar.
+        :param limit: Número máximo de registros na página.
+        :param options: Opções adicionais do SQLAlchemy (ex.: selectinload encadeados).
+        :param filters: Condições adicionais (cláusulas WHERE).
+        :param projection: Projeção para DTOs em vez de objetos do modelo.
+        :return: Page com os registros e os cursores vizinhos.
+        """
+        if direction not in ("next", "prev"):
+            raise ValueError("direction deve ser 'next' ou 'prev'")
+
+        data_criacao_col, id_col = self.model.data_criacao, self.model.id
+        stmt = self._select_active(projection)
+        stmt = self._load_relationships(stmt, load_relationships, relationship_style)
+        if options:
+            stmt = stmt.options(*options)
+        if filters:
+            stmt = stmt.where(*filters)
+
+        backwards = cursor is not None and direction == "prev"
+        if cursor is not None:
+            data_criacao, id = decode_cursor(cursor)
+            if backwards:
+                stmt = stmt.where(or_(
+                    data_criacao_col > data_criacao,
+                    and_(data_criacao_col == data_criacao, id_col > id),
+                ))
+            else:
+                stmt = stmt.where(or_(
+                    data_criacao_col < data_criacao,
+                    and_(data_criacao_col == data_criacao, id_col < id),
+                ))
+
+        if backwards:
+            stmt = stmt.order_by(data_criacao_col.asc(), id_col.asc())
+        else:
+            stmt = stmt.order_by(data_criacao_col.desc(), id_col.desc())
+
+        # Pedir um registro a mais para saber se existe outra página
+        result = await db.execute(stmt.limit(limit + 1))
+        rows = await self._materialize(result, projection)
+        has_more = len(rows) > limit
+        items = rows[:limit]
+
+        if backwards:
+            items.reverse()
+            next_cursor = encode_cursor(items[-1].data_criacao, items[-1].id) if items else None
+            prev_cursor = encode_cursor(items[0].data_criacao, items[0].id) if items and has_more else None
+        else:
+            next_cursor = encode_cursor(items[-1].data_criacao, items[-1].id) if items and has_more else None
+            prev_cursor = encode_cursor(items[0].data_criacao, items[0].id) if items and cursor else None
+
+        return Page(items=items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+    async def count(self, db: AsyncSession, filters: Optional[List[Any]] = None) -> int:
+        """
+        Conta os registros ativos, opcionalmente filtrados.
+        """
+        stmt = select(func.count()).select_from(self.model)
+        if hasattr(self.model, "deleted"):
+            stmt = stmt.where(self.model.deleted == False)
+        if filters:
+            stmt = stmt.where(*filters)
+        result = await db.execute(stmt)
+        return result.scalar_one()
+
+    async def exists(self, db: AsyncSession) -> bool:
+        """
+        Indica se existe pelo menos um registro ativo (sem contar a tabela inteira).
+        """
+        result = await db.execute(self._select_active().with_only_columns(self.model.id).limit(1))
+        return result.first() is not None
+
+    async def get_datatable(
+        self,
+        db: AsyncSession,
+        params: DataTableParams,
+        sortable: dict,
+        filters: Optional[List[Any]] = None,
+        load_relationships: Optional[List[str]] = None,
+        options: Optional[List[Any]] = None,
+        projection: Optional[Projection] = None,
+    ) -> DataTablePage:
+        """
+        Retorna a janela pedida pelo DataTables (draw/start/length/search/order),
+        com a ordenação e a filtragem feitas em SQL.
+
+        Na ordem por omissão (data_criacao descendente) a página é lida por cursor
+        sempre que o cliente o envia; nas restantes ordens usa-se OFFSET.
+
+        :param params: Parâmetros enviados pelo DataTables.
+        :param sortable: Mapa nome da coluna DataTables -> coluna SQL ordenável.
+        :param filters: Condições da pesquisa (cláusulas WHERE).
+        :param projection: Projeção para DTOs em vez de objetos do modelo.
+        :return: DataTablePage com os registros, totais e cursores vizinhos.
+        """
+        total = await self.count(db)
+        filtered = await self.count(db, filters) if filters else total
+
+        data_criacao_col, id_col = self.model.data_criacao, self.model.id
+        order_col = sortable.get(params.order_column, data_criacao_col)
+        default_order = order_col is data_criacao_col and params.order_dir == "desc"
+
+        if default_order and (params.cursor or params.start == 0):
+            page = await self.get_page(
+                db, cursor=params.cursor, direction=params.direction, limit=params.length,
+                load_relationships=load_relationships, options=options, filters=filters,
+                projection=projection,
+            )
+            return DataTablePage(page.items, total, filtered, page.next_cursor, page.prev_cursor)
+
+        stmt = self._select_active(projection)
+        stmt = self._load_relationships(stmt, load_relationships, "selectin")
+        if options:
+            stmt = stmt.options(*options)
+        if filters:
+            stmt = stmt.where(*filters)
+        if params.order_dir == "asc":
+            stmt = stmt.order_by(order_col.asc(), id_col.asc())
+        else:
+            stmt = stmt.order_by(order_col.desc(), id_col.desc())
+
+        result = await db.execute(stmt.offset(params.start).limit(params.length))
+        items = await self._materialize(result, projection)
+
+        # Devolver cursores para que a navegação seguinte já não precise de OFFSET
+        next_cursor = prev_cursor = None
+        if default_order and items:
+            if params.start + len(items) < filtered:
+                next_cursor = encode_cursor(items[-1].data_criacao, items[-1].id)
+            if params.start > 0:
+                prev_cursor = encode_cursor(items[0].data_criacao, items[0].id)
+
+        return DataTablePage(items, total, filtered, next_cursor, prev_cursor)
+
+    def _select_active(self, projection: Optional[Projection] = None):
+        """
+        Consulta base que ignora os registros removidos (soft delete), quando o modelo os suporta.
+        """
+        stmt = projection.select(self.model) if projection else select(self.model)
+        if hasattr(self.model, "deleted"):
+            stmt = stmt.where(self.model.deleted == False)
+        return stmt
+
+    async def _materialize(self, result, projection: Optional[Projection]) -> List[Any]:
+        if projection:
+            return await projection.materialize(result.all())
+        return list(result.unique().scalars().all())
+
+    def _load_relationships(self, stmt, load_relationships: Optional[List[str]], relationship_style: str):
+        if load_relationships:
+            for rel in load_relationships:
+                if relationship_style == "selectin":
+                    stmt = stmt.options(selectinload(getattr(self.model, rel)))
+                elif relationship_style == "joined":
+                    stmt = stmt.options(joinedload(getattr(self.model, rel)))
+                else:
+                    raise ValueError("relationship_style debe ser 'selectin' o 'joined'")
+        return stmt
 
     async def update(self, db: AsyncSession, id: str, obj_in: dict) -> T:
         """
@@ -0,0 +1,16 @@
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.auditoria import Auditoria
+from app.services.CRUDBase import CRUDBase, Page
+from app.core.config import settings
+
+crud_auditoria = CRUDBase(Auditoria)
+
+
+async def get_auditorias_page(
+    db: AsyncSession, cursor: Optional[str] = None, direction: str = "next", limit: int = settings.PAGE_SIZE
+) -> Page:
+    return await crud_auditoria.get_page(
+        db, cursor=cursor, direction=direction, limit=limit,
+        load_relationships=["usuario"]
+    )
@@ -0,0 +1,616 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from datetime import date
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Union
+import openai
+from openai import AsyncOpenAI  # Importar o cliente assíncrono da OpenAI
+from app.core import metricas
+from app.core.blind_index import normalizar_texto
+from app.core.config import settings
+from app.core.resiliencia import CircuitoAberto, DisjuntorCircuito, JanelaLatencias, espera_com_jitter
+
+logger = logging.getLogger(__name__)
+
+# Resultados (sucesso/falha) das últimas chamadas de cada backend, para a taxa de erros
+JANELA_RESULTADOS = 50
+
+
+def _tentativas() -> int:
+    # Pelo menos uma chamada: com LLM_TENTATIVAS <= 0 gerar devolveria None
+    return max(1, settings.LLM_TENTATIVAS)
+
+
+class ResultadoGeracao(NamedTuple):
+    """
+    Texto gerado e a contabilidade da chamada (tokens None quando o backend não os indica).
+    Os tokens incluem os das chamadas de cobertura (hedge) cuja resposta foi descartada.
+    """
+    texto: str
+    modelo: str
+    backend: str
+    tokens_prompt: Optional[int] = None
+    tokens_resposta: Optional[int] = None
+    latencia_ms: Optional[int] = None  # Do pedido ao fim da resposta, com repetições
+    pre_gerado_em: Optional[date] = None  # Texto pré-gerado entregue pela primeira vez (custo a transferir)
+
+
+class BackendGeracao:
+    """
+    Backend de geração de relatórios. Cada backend limita as suas chamadas em curso
+    (um modelo local em CPU aguenta poucas; a OpenAI muitas) e aplica a mesma política
+    de latência de cauda: prazo por tentativa, repetições com jitter para erros
+    transitórios, pedido de cobertura (hedge) opcional acima do percentil configurado
+    e um disjuntor que recusa de imediato enquanto o serviço está em baixo.
+
+    :param nome: Nome do backend na configuração ("openai" ou, com outro modelo, "openai:gpt-4o").
+    :param modelo: Modelo usado nas chamadas.
+    :param concorrencia: Máximo de gerações em simultâneo neste backend.
+    """
+
+    def __init__(self, nome: str, modelo: str, concorrencia: int):
+        self.nome = nome
+        self.tipo = nome.partition(":")[0]  # Gravado nos relatórios; o modelo segue à parte
+        self.modelo = modelo
+        self.concorrencia = concorrencia
+        self._semaforo = asyncio.Semaphore(concorrencia)
+        self.disjuntor = DisjuntorCircuito(nome, settings.CB_LIMIAR_FALHAS, settings.CB_TEMPO_ABERTO_S)
+        self.latencias = JanelaLatencias()
+        self.resultados = deque(maxlen=JANELA_RESULTADOS)
+        self.em_curso = 0
+        self.contadores = {
+            "chamadas": 0,
+            "sucessos": 0,
+            "falhas": 0,
+            "repeticoes": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedges_vencedores": 0,
+            "hedges_sem_vaga": 0,
+            "tokens_hedge": 0,  # Gastos em chamadas duplicadas cuja resposta não foi usada (já somados ao uso)
+        }
+
+    async def gerar(self, mensagens: list, **parametros) -> ResultadoGeracao:
+        self.disjuntor.verificar()  # Falha rápida antes de esperar por uma vaga
+        async with self._semaforo:
+            self.em_curso += 1
+            self.contadores["chamadas"] += 1
+            pedido = time.perf_counter()
+            try:
+                for tentativa in range(_tentativas()):
+                    if tentativa:
+                        self.disjuntor.verificar()
+                    inicio = time.perf_counter()
+                    try:
+                        resultado = await asyncio.wait_for(
+                            self._gerar_com_hedge(mensagens, parametros), settings.LLM_TIMEOUT_S
+                        )
+                    except asyncio.CancelledError:
+                        self.disjuntor.libertar()
+                        raise
+                    except Exception as exc:
+                        await self._falhou(exc, tentativa)
+                        continue
+                    self.latencias.registar(time.perf_counter() - inicio)
+                    self.disjuntor.sucesso()
+                    self.contadores["sucessos"] += 1
+                    self.resultados.append(True)
+                    return resultado._replace(latencia_ms=int((time.perf_counter() - pedido) * 1000))
+            finally:
+                self.em_curso -= 1
+
+    async def gerar_stream(self, mensagens: list, **parametros) -> AsyncIterator[Union[str, ResultadoGeracao]]:
+        """
+        Fragmentos de texto à medida que chegam; o último item é o ResultadoGeracao.
+        Só se repete enquanto não chegou o primeiro fragmento (depois já foi mostrado).
+        """
+        self.disjuntor.verificar()
+        async with self._semaforo:
+            self.em_curso += 1
+            self.contadores["chamadas"] += 1
+            pedido = time.perf_counter()
+            try:
+                for tentativa in range(_tentativas()):
+                    if tentativa:
+                        self.disjuntor.verificar()
+                    itens = self._gerar_stream(mensagens, **parametros).__aiter__()
+                    try:
+                        primeiro = await asyncio.wait_for(itens.__anext__(), settings.LLM_TIMEOUT_PRIMEIRO_TOKEN_S)
+                    except asyncio.CancelledError:
+                        self.disjuntor.libertar()
+                        raise
+                    except Exception as exc:
+                        await itens.aclose()
+                        await self._falhou(exc, tentativa)
+                        continue
+                    break
+
+                try:
+                    yield primeiro
+                    while True:
+                        try:
+                            item = await asyncio.wait_for(itens.__anext__(), settings.LLM_TIMEOUT_S)
+                        except StopAsyncIteration:
+                            break
+                        if isinstance(item, ResultadoGeracao):
+                            item = item._replace(latencia_ms=int((time.perf_counter() - pedido) * 1000))
+                        yield item
+                except asyncio.CancelledError:
+                    self.disjuntor.libertar()
+                    raise
+                except Exception:
+                    self.disjuntor.falha()
+                    self.contadores["falhas"] += 1
+                    self.resultados.append(False)
+                    raise
+                finally:
+                    await itens.aclose()
+                self.latencias.registar(time.perf_counter() - pedido)
+                self.disjuntor.sucesso()
+                self.contadores["sucessos"] += 1
+                self.resultados.append(True)
+            finally:
+                self.em_curso -= 1
+
+    async def aquecer(self) -> None:
+        """Prepara o backend no arranque (ligações, modelo em memória)."""
+
+    def taxa_erros(self) -> Optional[float]:
+        """Fração das últimas chamadas que falharam (depois das repetições)."""
+        if not self.resultados:
+            return None
+        return 1 - sum(self.resultados) / len(self.resultados)
+
+    def metricas(self) -> dict:
+        taxa_erros = self.taxa_erros()
+        return {
+            **self.contadores,
+            "modelo": self.modelo,
+            "taxa_erros": round(taxa_erros, 3) if taxa_erros is not None else None,
+            "em_curso": self.em_curso,
+            "concorrencia": self.concorrencia,
+            "circuito": self.disjuntor.estado,
+            "circuito_aberturas": self.disjuntor.aberturas,
+            "circuito_rejeicoes": self.disjuntor.rejeicoes,
+            "latencia_p50_s": self.latencias.percentil(50),
+            "latencia_p95_s": self.latencias.percentil(95),
+        }
+
+    def _retentavel(self, exc: Exception) -> bool:
+        return isinstance(exc, asyncio.TimeoutError)
+
+    async def _falhou(self, exc: Exception, tentativa: int) -> None:
+        """Regista a falha de uma tentativa; volta a lançar a exceção se não houver nova tentativa."""
+        if isinstance(exc, asyncio.TimeoutError):
+            self.contadores["timeouts"] += 1
+        if not self._retentavel(exc):
+            # Erro do pedido (400/401/403...): não fecha nem abre o disjuntor, nem repõe a
+            # contagem de falhas seguidas; só liberta a chamada de teste, se era esta
+            self.disjuntor.libertar()
+            self.contadores["falhas"] += 1
+            self.resultados.append(False)
+            raise exc
+        self.disjuntor.falha()
+        if tentativa + 1 >= _tentativas():
+            self.contadores["falhas"] += 1
+            self.resultados.append(False)
+            raise exc
+        self.contadores["repeticoes"] += 1
+        await asyncio.sleep(espera_com_jitter(tentativa, settings.LLM_ESPERA_BASE_S, settings.LLM_ESPERA_MAX_S))
+
+    def _limiar_hedge(self) -> Optional[float]:
+        if not settings.LLM_HEDGE_ATIVO or len(self.latencias) < settings.LLM_HEDGE_MIN_AMOSTRAS:
+            return None
+        return self.latencias.percentil(settings.LLM_HEDGE_PERCENTIL)
+
+    async def _gerar_com_hedge(self, mensagens: list, parametros: dict) -> ResultadoGeracao:
+        """
+        Se a chamada passar do percentil configurado e houver uma vaga livre no backend,
+        lança uma segunda igual e fica com a primeira que terminar bem; a outra é cancelada.
+        """
+        limiar = self._limiar_hedge()
+        if limiar is None:
+            return await self._gerar(mensagens, **parametros)
+
+        primeira = asyncio.create_task(self._gerar(mensagens, **parametros))
+        pendentes = {primeira}
+        try:
+            feitas, _ = await asyncio.wait(pendentes, timeout=limiar)
+            if not feitas:
+                cobertura = await self._lancar_hedge(mensagens, parametros)
+                if cobertura is not None:
+                    pendentes.add(cobertura)
+            erro = None
+            while pendentes:
+                feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                sucessos = [tarefa for tarefa in feitas if tarefa.exception() is None]
+                if sucessos:
+                    resultado = sucessos[0].result()
+                    if sucessos[0] is not primeira:
+                        self.contadores["hedges_vencedores"] += 1
+                    descartados = [tarefa.result() for tarefa in sucessos[1:]]
+                    if pendentes:
+                        # A chamada cancelada não indica o uso: conta-se pelo menos o prompt, igual
+                        descartados.append(resultado._replace(tokens_resposta=None))
+                    return self._com_custo_hedge(resultado, descartados)
+                erro = feitas.pop().exception()
+            raise erro
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+
+    async def _lancar_hedge(self, mensagens: list, parametros: dict) -> Optional[asyncio.Task]:
+        # A cobertura ocupa uma vaga própria até terminar (mesmo depois de cancelada), para
+        # o backend não passar da sua concorrência; sem vaga livre não se lança
+        if self._semaforo.locked():
+            self.contadores["hedges_sem_vaga"] += 1
+            return None
+        await self._semaforo.acquire()  # Há vaga: não espera
+        self.em_curso += 1
+        self.contadores["hedges"] += 1
+        cobertura = asyncio.create_task(self._gerar(mensagens, **parametros))
+        cobertura.add_done_callback(self._libertar_hedge)
+        return cobertura
+
+    def _libertar_hedge(self, _cobertura: asyncio.Task) -> None:
+        self.em_curso -= 1
+        self._semaforo.release()
+
+    def _com_custo_hedge(self, resultado: ResultadoGeracao, descartados: List[ResultadoGeracao]) -> ResultadoGeracao:
+        # Os tokens das chamadas cuja resposta não foi usada somam-se aos do resultado, para
+        # contarem no relatório, no uso diário e na quota de quem pediu
+        if not descartados:
+            return resultado
+        prompt = sum(descartado.tokens_prompt or 0 for descartado in descartados)
+        resposta = sum(descartado.tokens_resposta or 0 for descartado in descartados)
+        self.contadores["tokens_hedge"] += prompt + resposta
+        if resultado.tokens_prompt is None:
+            return resultado  # O backend não indica o uso
+        return resultado._replace(
+            tokens_prompt=resultado.tokens_prompt + prompt,
+            tokens_resposta=(resultado.tokens_resposta or 0) + resposta,
+        )
+
+    async def _gerar(self, mensagens: list, **parametros) -> ResultadoGeracao:
+        raise NotImplementedError
+
+    async def _gerar_stream(self, mensagens: list, **parametros) -> AsyncIterator[Union[str, ResultadoGeracao]]:
+        # Por omissão, sem streaming: o texto completo num só fragmento
+        resultado = await self._gerar(mensagens, **parametros)
+        yield resultado.texto
+        yield resultado
+
+
+class BackendCompativelOpenAI(BackendGeracao):
+    """
+    API de chat completions: a própria OpenAI ou um servidor local compatível
+    (llama.cpp server, Ollama, vLLM) a servir um modelo em CPU.
+    """
+
+    def __init__(self, nome: str, modelo: str, concorrencia: int, base_url: Optional[str], api_key: Optional[str]):
+        super().__init__(nome, modelo, concorrencia)
+        # Sem repetições no cliente: a política de repetição é a de BackendGeracao
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=settings.LLM_TIMEOUT_S, max_retries=0)
+
+    def _retentavel(self, exc: Exception) -> bool:
+        if isinstance(exc, (asyncio.TimeoutError, openai.APIConnectionError)):  # Inclui APITimeoutError
+            return True
+        if isinstance(exc, openai.APIStatusError):
+            return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+        return False
+
+    async def _gerar(self, mensagens: list, **parametros) -> ResultadoGeracao:
+        response = await self.client.chat.completions.create(
+            model=self.modelo,
+            messages=mensagens,
+            **parametros,
+        )
+        uso = response.usage
+        return ResultadoGeracao(
+            texto=response.choices[0].message.content.strip(),
+            modelo=response.model or self.modelo,
+            backend=self.tipo,
+            tokens_prompt=uso.prompt_tokens if uso else None,
+            tokens_resposta=uso.completion_tokens if uso else None,
+        )
+
+    async def _gerar_stream(self, mensagens: list, **parametros) -> AsyncIterator[Union[str, ResultadoGeracao]]:
+        stream = await self.client.chat.completions.create(
+            model=self.modelo,
+            messages=mensagens,
+            stream=True,
+            stream_options={"include_usage": True},  # Uso no último fragmento
+            **parametros,
+        )
+        partes, uso = [], None
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    uso = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    partes.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Cancelado ou abandonado a meio: fecha a ligação HTTP para o servidor parar de gerar
+            await stream.close()
+        yield ResultadoGeracao(
+            texto="".join(partes).strip(),
+            modelo=self.modelo,
+            backend=self.tipo,
+            tokens_prompt=uso.prompt_tokens if uso else None,
+            tokens_resposta=uso.completion_tokens if uso else None,
+        )
+
+    async def aquecer(self) -> None:
+        # Uma geração de um token: abre as ligações e, num servidor local, carrega o modelo
+        await self._gerar([{"role": "user", "content": "ok"}], max_tokens=1)
+
+
+class BackendLlamaCpp(BackendGeracao):
+    """
+    Modelo GGUF em CPU dentro do próprio processo (llama-cpp-python, dependência
+    opcional). As chamadas correm numa thread para não bloquear o event loop.
+    """
+
+    def __init__(self, nome: str, caminho_modelo: str, concorrencia: int):
+        super().__init__(nome, caminho_modelo.rsplit("/", 1)[-1], concorrencia)
+        self.caminho_modelo = caminho_modelo
+        self._llama = None
+
+    def _carregar(self):
+        if self._llama is None:
+            try:
+                from llama_cpp import Llama
+            except ImportError as exc:
+                raise RuntimeError("O backend 'llamacpp' requer o pacote llama-cpp-python") from exc
+            self._llama = Llama(model_path=self.caminho_modelo, n_ctx=4096, verbose=False)
+        return self._llama
+
+    async def _gerar(self, mensagens: list, **parametros) -> ResultadoGeracao:
+        def executar():
+            return self._carregar().create_chat_completion(messages=mensagens, **parametros)
+        response = await asyncio.to_thread(executar)
+        uso = response.get("usage") or {}
+        return ResultadoGeracao(
+            texto=response["choices"][0]["message"]["content"].strip(),
+            modelo=self.modelo,
+            backend=self.tipo,
+            tokens_prompt=uso.get("prompt_tokens"),
+            tokens_resposta=uso.get("completion_tokens"),
+        )
+
+    async def aquecer(self) -> None:
+        await asyncio.to_thread(self._carregar)
+
+
+def _criar_backend(nome: str) -> BackendGeracao:
+    # "openai" usa o modelo configurado; "openai:gpt-4o" o indicado, com disjuntor e estatísticas próprios
+    tipo, _, modelo = nome.partition(":")
+    if tipo == "openai":
+        return BackendCompativelOpenAI(
+            nome, modelo or settings.OPENAI_MODELO, settings.OPENAI_CONCORRENCIA,
+            base_url=settings.OPENAI_BASE_URL, api_key=settings.OPENAI_API_KEY,
+        )
+    if tipo == "local":
+        return BackendCompativelOpenAI(
+            nome, modelo or settings.LLM_LOCAL_MODELO, settings.LLM_LOCAL_CONCORRENCIA,
+            base_url=settings.LLM_LOCAL_URL, api_key=settings.LLM_LOCAL_API_KEY,
+        )
+    if tipo == "llamacpp":
+        # Uma instância Llama não é thread-safe: uma geração de cada vez
+        return BackendLlamaCpp(nome, modelo or settings.LLM_LOCAL_CAMINHO_MODELO, 1)
+    raise ValueError(f"Backend de geração desconhecido: '{nome}'")
+
+
+_backends: Dict[str, BackendGeracao] = {}
+
+
+def obter_backend(nome: str) -> BackendGeracao:
+    if nome not in _backends:
+        _backends[nome] = _criar_backend(nome)
+    return _backends[nome]
+
+
+class Rota(NamedTuple):
+    """Backend principal, alternativo e resposta máxima dos relatórios de uma especialidade."""
+    especialidade: str
+    primario: str
+    alternativo: Optional[str]
+    max_tokens: int
+
+
+# Rota das especialidades sem rota própria
+ROTA_PADRAO = "*"
+
+
+def _ler_rota(valor: str) -> Tuple[str, Optional[str]]:
+    # "openai:gpt-4o>local" -> ("openai:gpt-4o", "local")
+    primario, _, alternativo = valor.partition(">")
+    return primario.strip(), alternativo.strip() or None
+
+
+def _criar_rotas() -> Dict[str, Rota]:
+    primario, alternativo = _ler_rota(settings.LLM_BACKEND_PADRAO)
+    alternativo = alternativo or settings.LLM_BACKEND_ALTERNATIVO
+    rotas = {ROTA_PADRAO: Rota(ROTA_PADRAO, primario, alternativo, settings.RELATORIO_MAX_TOKENS)}
+    # Chaves normalizadas (sem acentos nem maiúsculas), como o tipo da consulta é comparado
+    backends = {normalizar_texto(e): v for e, v in settings.LLM_BACKEND_POR_ESPECIALIDADE.items()}
+    max_tokens = {normalizar_texto(e): v for e, v in settings.RELATORIO_MAX_TOKENS_POR_ESPECIALIDADE.items()}
+    nomes = {
+        normalizar_texto(especialidade): especialidade
+        for especialidade in [*settings.LLM_BACKEND_POR_ESPECIALIDADE, *settings.RELATORIO_MAX_TOKENS_POR_ESPECIALIDADE]
+    }
+    for chave, especialidade in nomes.items():
+        proprio, proprio_alternativo = _ler_rota(backends[chave]) if chave in backends else (primario, None)
+        recurso = proprio_alternativo or alternativo
+        rotas[chave] = Rota(
+            especialidade,
+            proprio,
+            recurso if recurso != proprio else None,
+            max_tokens.get(chave, settings.RELATORIO_MAX_TOKENS),
+        )
+    return rotas
+
+
+_rotas = _criar_rotas()
+
+# Contadores de cada rota: quem serviu os pedidos e porque o principal foi evitado
+_estatisticas_rotas: Dict[str, Dict[str, int]] = {}
+
+
+def _estatisticas_rota(rota: Rota) -> Dict[str, int]:
+    if rota.especialidade not in _estatisticas_rotas:
+        _estatisticas_rotas[rota.especialidade] = {
+            "pedidos": 0,
+            "servidos_primario": 0,
+            "servidos_alternativo": 0,
+            "desvios_circuito": 0,
+            "desvios_erros": 0,
+            "desvios_latencia": 0,
+            "recursos": 0,  # Falhou no primeiro backend tentado e passou ao outro
+            "falhas": 0,
+        }
+    return _estatisticas_rotas[rota.especialidade]
+
+
+def rota_para(especialidade: Optional[str]) -> Rota:
+    return _rotas.get(normalizar_texto(especialidade or ""), _rotas[ROTA_PADRAO])
+
+
+def motivo_desvio(backend: BackendGeracao) -> Optional[str]:
+    """
+    Porque o backend deve ser evitado agora, pelas estatísticas recentes ("circuito",
+    "erros" ou "latencia"); None se está saudável ou ainda não há amostras suficientes.
+    """
+    if not backend.disjuntor.disponivel():
+        return "circuito"
+    if len(backend.resultados) >= settings.LLM_ROTA_MIN_AMOSTRAS and backend.taxa_erros() > settings.LLM_ROTA_TAXA_ERROS_MAX:
+        return "erros"
+    if len(backend.latencias) >= settings.LLM_ROTA_MIN_AMOSTRAS and backend.latencias.percentil(95) > settings.LLM_ROTA_LATENCIA_MAX_S:
+        return "latencia"
+    return None
+
+
+def backends_para(especialidade: Optional[str]) -> List[BackendGeracao]:
+    """
+    Backends a tentar, por ordem. O principal passa para trás do alternativo quando está
+    lento, a falhar ou com o disjuntor aberto (e o alternativo não); uma pequena parte
+    dos pedidos vai na mesma ao principal, para as suas estatísticas se renovarem.
+    """
+    rota = rota_para(especialidade)
+    primario = obter_backend(rota.primario)
+    if not rota.alternativo:
+        return [primario]
+    alternativo = obter_backend(rota.alternativo)
+    motivo = motivo_desvio(primario)
+    if motivo and motivo_desvio(alternativo) is None and random.random() >= settings.LLM_ROTA_SONDAGEM:
+        _estatisticas_rota(rota)[f"desvios_{motivo}"] += 1
+        return [alternativo, primario]
+    return [primario, alternativo]
+
+
+def backend_para(especialidade: Optional[str]) -> BackendGeracao:
+    """Backend principal da rota da especialidade (tipo da consulta)."""
+    return obter_backend(rota_para(especialidade).primario)
+
+
+def rota_disponivel(especialidade: Optional[str]) -> bool:
+    """Algum backend da rota aceitaria uma chamada agora."""
+    rota = rota_para(especialidade)
+    nomes = [rota.primario] + ([rota.alternativo] if rota.alternativo else [])
+    return any(obter_backend(nome).disjuntor.disponivel() for nome in nomes)
+
+
+def _registar_recurso(backend: BackendGeracao, exc: Exception, seguinte: BackendGeracao) -> None:
+    # Disjuntor aberto é esperado (sondagem ao principal): sem aviso no log
+    if not isinstance(exc, CircuitoAberto):
+        logger.warning("Backend '%s' falhou (%s); a tentar '%s'", backend.nome, exc, seguinte.nome)
+
+
+def _servido(rota: Rota, backend: BackendGeracao) -> None:
+    estatisticas = _estatisticas_rota(rota)
+    estatisticas["servidos_primario" if backend.nome == rota.primario else "servidos_alternativo"] += 1
+
+
+async def gerar_na_rota(especialidade: Optional[str], mensagens: list, **parametros) -> ResultadoGeracao:
+    """Gera no backend escolhido pela rota; se falhar (já com as repetições), tenta o outro."""
+    rota = rota_para(especialidade)
+    estatisticas = _estatisticas_rota(rota)
+    estatisticas["pedidos"] += 1
+    candidatos = backends_para(especialidade)
+    for posicao, backend in enumerate(candidatos):
+        try:
+            resultado = await backend.gerar(mensagens, **parametros)
+        except Exception as exc:
+            if posicao + 1 == len(candidatos):
+                estatisticas["falhas"] += 1
+                raise
+            estatisticas["recursos"] += 1
+            _registar_recurso(backend, exc, candidatos[posicao + 1])
+            continue
+        _servido(rota, backend)
+        return resultado
+
+
+async def gerar_stream_na_rota(
+    especialidade: Optional[str], mensagens: list, **parametros
+) -> AsyncIterator[Union[str, ResultadoGeracao]]:
+    """
+    Como gerar_na_rota, em streaming. Só passa ao outro backend enquanto não chegou
+    nenhum fragmento (depois o texto já foi mostrado).
+    """
+    rota = rota_para(especialidade)
+    estatisticas = _estatisticas_rota(rota)
+    estatisticas["pedidos"] += 1
+    candidatos = backends_para(especialidade)
+    for posicao, backend in enumerate(candidatos):
+        emitidos = False
+        try:
+            async for item in backend.gerar_stream(mensagens, **parametros):
+                emitidos = True
+                yield item
+        except Exception as exc:
+            if emitidos or posicao + 1 == len(candidatos):
+                estatisticas["falhas"] += 1
+                raise
+            estatisticas["recursos"] += 1
+            _registar_recurso(backend, exc, candidatos[posicao + 1])
+            continue
+        _servido(rota, backend)
+        return
+
+
+def tabela_rotas() -> List[dict]:
+    """Configuração de cada rota com o estado atual dos seus backends (página de administração)."""
+    tabela = []
+    for rota in _rotas.values():
+        backends = {}
+        for nome in [rota.primario] + ([rota.alternativo] if rota.alternativo else []):
+            backend = obter_backend(nome)
+            backends[nome] = {**backend.metricas(), "desvio": motivo_desvio(backend)}
+        tabela.append({
+            **rota._asdict(),
+            "backends": backends,
+            "estatisticas": _estatisticas_rotas.get(rota.especialidade, {}),
+        })
+    return tabela
+
+
+def backends_configurados() -> Dict[str, BackendGeracao]:
+    nomes = {nome for rota in _rotas.values() for nome in (rota.primario, rota.alternativo) if nome}
+    return {nome: obter_backend(nome) for nome in sorted(nomes)}
+
+
+metricas.registar("backends", lambda: {nome: backend.metricas() for nome, backend in _backends.items()})
+metricas.registar("rotas", lambda: dict(_estatisticas_rotas))
+
+
+async def aquecer_backends() -> None:
+    # Falhas no aquecimento não impedem o arranque: o backend tenta de novo no primeiro pedido
+    for backend in backends_configurados().values():
+        try:
+            await backend.aquecer()
+        except Exception:
+            logger.warning("Aquecimento do backend '%s' falhou", backend.nome, exc_info=True)
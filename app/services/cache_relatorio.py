@@ -0,0 +1,161 @@
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+import pytz
+from sqlalchemy import delete, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.core.blind_index import blind_index
+from app.core.config import settings
+from app.core.database import async_session
+from app.core import metricas
+from app.models.cache import CacheRelatorio
+from app.services.backends_llm import ResultadoGeracao
+from app.services.geracao import GeradorRelatorio, montar_mensagens, parametros_cache
+
+# Contadores do processo (reiniciam com a aplicação)
+estatisticas = {
+    "hits": 0,
+    "misses": 0,
+    "forcadas": 0,
+    "segundos_poupados": 0.0,
+    "caracteres_servidos": 0,
+}
+metricas.registar("cache_relatorio", lambda: dict(estatisticas))
+
+
+def chave_cache(dados: dict, parametros: Optional[dict] = None) -> str:
+    """
+    Chave da cache: HMAC (chave dos índices cegos) das mensagens exatas enviadas ao
+    modelo e dos parâmetros. Um hash simples permitiria confirmar um prompt adivinhado.
+    """
+    canonico = json.dumps(
+        {"mensagens": montar_mensagens(**dados), "parametros": parametros or parametros_cache(dados)},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return blind_index(canonico, "cache.relatorio")
+
+
+def _limite_validade() -> datetime:
+    return datetime.now(pytz.utc) - timedelta(hours=settings.CACHE_RELATORIO_TTL_HORAS)
+
+
+async def obter(db: AsyncSession, chave: str, entregar: bool = True) -> Optional[ResultadoGeracao]:
+    """
+    Texto em cache para a chave. Com entregar=True o texto vai ser servido: se foi
+    pré-gerado e ainda ninguém o recebeu, o resultado leva o custo da pré-geração, para
+    ser cobrado a quem o pediu (só a um pedido, mesmo com vários em simultâneo).
+    """
+    result = await db.execute(
+        select(CacheRelatorio)
+        .where(CacheRelatorio.chave == chave, CacheRelatorio.data_criacao >= _limite_validade())
+    )
+    entrada = result.scalars().first()
+    if not entrada:
+        estatisticas["misses"] += 1
+        return None
+    estatisticas["hits"] += 1
+    estatisticas["segundos_poupados"] += entrada.duracao_ms / 1000
+    estatisticas["caracteres_servidos"] += len(entrada.conteudo)
+    resultado = ResultadoGeracao(texto=entrada.conteudo, modelo=entrada.modelo, backend="cache")
+    pre_gerada_em = entrada.pre_gerada_em  # Lido antes do UPDATE, que o sincroniza na sessão
+    if entregar and pre_gerada_em is not None:
+        reclamada = await db.execute(
+            update(CacheRelatorio)
+            .where(CacheRelatorio.chave == chave, CacheRelatorio.pre_gerada_em.isnot(None))
+            .values(pre_gerada_em=None)
+        )
+        if reclamada.rowcount == 1:
+            resultado = resultado._replace(
+                tokens_prompt=entrada.tokens_prompt,
+                tokens_resposta=entrada.tokens_resposta,
+                pre_gerado_em=pre_gerada_em,
+            )
+    await db.execute(
+        update(CacheRelatorio)
+        .where(CacheRelatorio.chave == chave)
+        .values(data_ultimo_acesso=datetime.now(pytz.utc), acessos=CacheRelatorio.acessos + 1)
+    )
+    await db.commit()
+    return resultado
+
+
+async def guardar(
+    db: AsyncSession, chave: str, resultado: ResultadoGeracao, duracao_ms: int, pre_gerada: bool = False
+) -> None:
+    agora = datetime.now(pytz.utc)
+    await db.merge(CacheRelatorio(
+        chave=chave,
+        conteudo=resultado.texto,
+        modelo=resultado.modelo,
+        duracao_ms=duracao_ms,
+        acessos=0,
+        data_criacao=agora,
+        data_ultimo_acesso=agora,
+        pre_gerada_em=agora.date() if pre_gerada else None,
+        tokens_prompt=resultado.tokens_prompt if pre_gerada else None,
+        tokens_resposta=resultado.tokens_resposta if pre_gerada else None,
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Outra geração dos mesmos dados gravou a chave entretanto (merge lê e depois insere):
+        # a entrada dela serve, e o relatório já gerado não deve falhar por isso
+        await db.rollback()
+        return
+    await _expulsar(db)
+
+
+async def _expulsar(db: AsyncSession) -> None:
+    # Entradas expiradas (TTL) e, acima do limite, as menos usadas recentemente (LRU)
+    await db.execute(delete(CacheRelatorio).where(CacheRelatorio.data_criacao < _limite_validade()))
+    # Por chave, com desempate na chave: apagar por data levaria todos os empatados no corte
+    excedentes = await db.execute(
+        select(CacheRelatorio.chave)
+        .order_by(CacheRelatorio.data_ultimo_acesso.desc(), CacheRelatorio.chave.desc())
+        .offset(settings.CACHE_RELATORIO_MAX_ENTRADAS)
+    )
+    chaves = list(excedentes.scalars().all())
+    if chaves:
+        await db.execute(delete(CacheRelatorio).where(CacheRelatorio.chave.in_(chaves)))
+    await db.commit()
+
+
+async def gerar_com_cache(
+    dados: dict, gerar: GeradorRelatorio, forcar: bool = False, session_factory=async_session
+) -> ResultadoGeracao:
+    """
+    Devolve o texto em cache para estes dados de prompt ou gera-o e guarda-o.
+    Com forcar=True a cache é ignorada na leitura, mas o novo texto substitui a entrada.
+
+    A leitura e a escrita usam sessões curtas: nenhuma ligação do pool fica presa
+    enquanto o modelo gera.
+    """
+    chave = chave_cache(dados)
+    if forcar:
+        estatisticas["forcadas"] += 1
+    else:
+        async with session_factory() as db:
+            em_cache = await obter(db, chave)
+        if em_cache is not None:
+            return em_cache
+    inicio = time.perf_counter()
+    resultado = await gerar(**dados)
+    async with session_factory() as db:
+        await guardar(db, chave, resultado, int((time.perf_counter() - inicio) * 1000))
+    return resultado
+
+
+async def resumo(db: AsyncSession) -> dict:
+    result = await db.execute(select(func.count(CacheRelatorio.chave)))
+    pedidos = estatisticas["hits"] + estatisticas["misses"]
+    return {
+        **estatisticas,
+        "segundos_poupados": round(estatisticas["segundos_poupados"], 1),
+        "taxa_acerto": round(estatisticas["hits"] / pedidos, 3) if pedidos else None,
+        "entradas": result.scalar_one(),
+        "max_entradas": settings.CACHE_RELATORIO_MAX_ENTRADAS,
+        "ttl_horas": settings.CACHE_RELATORIO_TTL_HORAS,
+    }
@@ -1,13 +1,42 @@
 from datetime import datetime
 import pytz
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, undefer_group
 from sqlalchemy.future import select
 from typing import List, Optional
-from app.models.relatorio import Consulta
-from app.services.CRUDBase import CRUDBase
+from app.models.relatorio import GRUPO_DETALHE, Consulta, Paciente, Usuario
+from app.services.CRUDBase import CRUDBase, DataTablePage, Projection
 from app.schemas.consulta import ConsultaCreate, ConsultaUpdate
+from app.schemas.datatables import DataTableParams
+from app.schemas.listagens import ConsultaLinha
+from app.core.blind_index import indice_tipo_consulta
+from app.services.pesquisa import ENTIDADE_PACIENTE, ENTIDADE_USUARIO, ids_correspondentes
+from app.services.cache_relatorio import chave_cache
+from app.services.geracao import dados_prompt
+from app.services.relatorio import ESTADO_RELATORIO_CONSULTA
+
+# Colunas da lista que podem ser ordenadas em SQL (os campos cifrados não têm ordem útil)
+COLUNAS_ORDENAVEIS = {
+    "data_criacao": Consulta.data_criacao,
+}
+
+# Projeção da lista: nomes do paciente e do médico por junção, sem carregar as entidades
+LINHA_CONSULTA = Projection(
+    ConsultaLinha,
+    {
+        "id": Consulta.id,
+        "tipo": Consulta.tipo,
+        "paciente_nome": Paciente.nome_completo,
+        "medico_nome": Usuario.nome_completo,
+        "estado_relatorio": ESTADO_RELATORIO_CONSULTA,
+        "data_criacao": Consulta.data_criacao,
+    },
+    joins=(
+        (Paciente, Consulta.paciente_id == Paciente.id),
+        (Usuario, Consulta.usuario_id == Usuario.id),
+    ),
+)
 
 class CRUDConsulta(CRUDBase[Consulta]):
     async def get_by_id(self, db: AsyncSession, consulta_id: str) -> Optional[Consulta]:
@@ -24,7 +53,8 @@ async def get_consulta(db: AsyncSession, consulta_id: str) -> Optional[Consulta]
     result = await db.execute(
         select(Consulta)
         .options(
-            selectinload(Consulta.paciente),
+            undefer_group(GRUPO_DETALHE),  # Diagnóstico e prescrições (detalhe e edição)
+            selectinload(Consulta.paciente).undefer_group(GRUPO_DETALHE),
             selectinload(Consulta.usuario)
             )  # Carregar o paciente associado à consulta
         .where(Consulta.id == consulta_id, Consulta.deleted == False)
@@ -32,16 +62,42 @@ async def get_consulta(db: AsyncSession, consulta_id: str) -> Optional[Consulta]
     return result.scalars().first()
 
 
-async def get_consultas(db: AsyncSession) -> List[Consulta]:
-    result = await db.execute(
-        select(Consulta)
-        .options(
-            selectinload(Consulta.paciente),
-            selectinload(Consulta.usuario)
-            )  # Carregar o paciente associado a cada consulta
-        .where(Consulta.deleted == False)
+async def get_consultas(db: AsyncSession) -> List[ConsultaLinha]:
+    return await crud_consulta.get_all(db, limit=None, projection=LINHA_CONSULTA)
+
+
+async def has_consultas(db: AsyncSession) -> bool:
+    return await crud_consulta.exists(db)
+
+
+def _filtros_pesquisa(pesquisa: str) -> list:
+    # Tipo exato pelo índice cego; nomes do paciente e do médico pelo índice de trigramas
+    if not pesquisa:
+        return []
+    condicoes = [Consulta.tipo_bidx == indice_tipo_consulta(pesquisa)]
+    ids_pacientes = ids_correspondentes(ENTIDADE_PACIENTE, pesquisa)
+    if ids_pacientes is not None:
+        condicoes.append(Consulta.paciente_id.in_(ids_pacientes))
+    ids_usuarios = ids_correspondentes(ENTIDADE_USUARIO, pesquisa)
+    if ids_usuarios is not None:
+        condicoes.append(Consulta.usuario_id.in_(ids_usuarios))
+    return [or_(*condicoes)]
+
+
+async def get_consultas_datatable(db: AsyncSession, params: DataTableParams) -> DataTablePage:
+    return await crud_consulta.get_datatable(
+        db, params, COLUNAS_ORDENAVEIS, filters=_filtros_pesquisa(params.search),
+        projection=LINHA_CONSULTA,
     )
-    return result.unique().scalars().all()
+
+
+async def _registar_entradas(db: AsyncSession, consulta: Consulta) -> None:
+    # Impressão digital dos dados que o prompt usaria agora; paciente e médico podem ter mudado
+    db.expire(consulta, ["paciente", "usuario"])
+    consulta = await get_consulta(db, consulta.id)
+    if consulta and consulta.paciente and consulta.usuario:
+        consulta.chave_entrada = chave_cache(dados_prompt(consulta))
+        await db.commit()
 
 
 async def create_consulta(db: AsyncSession, consulta_data: ConsultaCreate) -> Consulta:
@@ -59,6 +115,7 @@ async def create_consulta(db: AsyncSession, consulta_data: ConsultaCreate) -> Co
     db.add(consulta)
     await db.commit()
     await db.refresh(consulta)
+    await _registar_entradas(db, consulta)
 
     return consulta
 
@@ -74,6 +131,7 @@ async def update_consulta(
 
     await db.commit()
     await db.refresh(consulta)
+    await _registar_entradas(db, consulta)
 
     return consulta
 
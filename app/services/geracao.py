@@ -0,0 +1,156 @@
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+from app.core.config import settings
+from app.models.relatorio import Consulta
+from app.services.backends_llm import ResultadoGeracao, backend_para, gerar_na_rota, gerar_stream_na_rota, rota_para
+from app.services.secoes import SECOES, montar_texto
+from app.services.tokens import contar_tokens, repartir_orcamento
+
+# Parâmetros de geração comuns a todos os backends (o modelo e max_tokens são os da
+# rota da especialidade); fazem parte da chave da cache de relatórios
+PARAMETROS_GERACAO = {
+    "temperature": 0.7,
+}
+
+# Assinatura de um gerador de relatórios: recebe os dados do prompt, devolve o resultado.
+# A fila de geração recebe o gerador por parâmetro (ex.: um LLM falso nos testes).
+GeradorRelatorio = Callable[..., Awaitable[ResultadoGeracao]]
+# Variante em streaming: fragmentos de texto à medida que chegam e, no fim, o resultado
+GeradorRelatorioStream = Callable[..., AsyncIterator[Union[str, ResultadoGeracao]]]
+
+
+INSTRUCAO_SISTEMA = "Você é um assistente médico especializado na geração de relatórios clínicos completos."
+FORMATO_SECOES = "\n    ".join(f"### {titulo}" for titulo in SECOES.values())
+
+
+def dados_prompt(consulta: Consulta) -> dict:
+    """
+    Extrai da consulta (com paciente, usuário e o grupo de detalhe carregados) os
+    campos em claro que entram no prompt.
+    """
+    paciente = consulta.paciente
+    usuario = consulta.usuario
+    # Texto livre de qualquer tamanho: compactado/cortado ao orçamento configurado
+    texto_livre = repartir_orcamento(
+        {"diagnostico": consulta.diagnostico, "prescricoes": consulta.prescricoes},
+        settings.PROMPT_ORCAMENTO_TOKENS,
+    )
+    return {
+        **texto_livre,
+        "especialidade": consulta.tipo,
+        "paciente_nome": paciente.nome_completo,
+        "paciente_sexo": paciente.sexo,
+        "paciente_idade": (datetime.now() - paciente.data_nascimento).days // 365,
+        "medico_nome": usuario.nome_completo,
+    }
+
+
+def montar_mensagens(
+    diagnostico: str, 
+    prescricoes: str, 
+    especialidade: str, 
+    paciente_nome: str, 
+    paciente_sexo: str, 
+    paciente_idade: int,
+    medico_nome: str
+) -> list:
+    prompt = f"""
+    Geração de um relatório médico detalhado para uma consulta de {especialidade}.
+
+    **Dados do Paciente:**
+    - Nome: {paciente_nome}
+    - Sexo: {paciente_sexo}
+    - Idade: {paciente_idade} anos
+
+    **Diagnóstico:**
+    {diagnostico}
+
+    **Prescrições Médicas:**
+    {prescricoes}
+
+    **Médico Responsável:**
+    {medico_nome}
+    
+   
+    **Assinatura:** ____________________  
+    **CRM:** [Número do registro do médico]
+
+    **Elabore um relatório clínico detalhado com base nas informações acima, considerando os seguintes aspectos:**
+    1️**Resumo Clínico**: Apresente uma introdução ao caso com base no diagnóstico e prescrição.  
+    2️**Histórico Médico e Sintomas**: Explique a condição do paciente, sintomas relatados e fatores relevantes.  
+    3️**Plano de Tratamento**: Sugira abordagens terapêuticas e recomendações baseadas no diagnóstico.  
+    4️**Recomendações Médicas**: Indique cuidados necessários, mudanças no estilo de vida ou exames complementares.  
+    5️**Prognóstico**: Informe as expectativas de evolução da condição do paciente.  
+
+    **Formato da resposta:** exatamente estas cinco secções, por esta ordem, cada uma
+    começada por uma linha de título própria:
+    {FORMATO_SECOES}
+    """
+    return [
+        {"role": "system", "content": INSTRUCAO_SISTEMA},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def montar_mensagens_secao(chave: str, secoes: dict, instrucao: Optional[str] = None, **dados) -> list:
+    """
+    Prompt para reescrever uma só secção: os dados da consulta e as outras secções
+    como contexto, pedindo apenas o texto da secção indicada.
+    """
+    mensagens = montar_mensagens(**dados)
+    contexto = montar_texto({outra: texto for outra, texto in secoes.items() if outra != chave})
+    pedido = (
+        f"Relatório atual (sem a secção a reescrever):\n\n{contexto}\n\n"
+        f"Reescreva apenas a secção \"{SECOES[chave]}\", coerente com as restantes. "
+        "Responda só com o texto da secção, sem a linha de título."
+    )
+    if instrucao:
+        pedido += f"\nIndicações do médico: {instrucao}"
+    return mensagens + [{"role": "user", "content": pedido}]
+
+
+def max_tokens_para(especialidade: Optional[str]) -> int:
+    return rota_para(especialidade).max_tokens
+
+
+def parametros_geracao(especialidade: Optional[str]) -> dict:
+    return {"max_tokens": max_tokens_para(especialidade), **PARAMETROS_GERACAO}
+
+
+def estimar_tokens(mensagens: list, max_tokens: int = settings.RELATORIO_MAX_TOKENS) -> int:
+    """
+    Tokens do prompt (tokenizador local ou estimativa) mais a resposta máxima, para
+    reservar capacidade no limite de tokens por minuto.
+    """
+    return sum(contar_tokens(m["content"]) for m in mensagens) + max_tokens
+
+
+def parametros_cache(dados: dict) -> dict:
+    # Modelo principal da rota mais os parâmetros de geração: um texto do alternativo fica
+    # guardado com a mesma chave (é a resposta servida a este pedido)
+    return {"model": backend_para(dados["especialidade"]).modelo, **parametros_geracao(dados["especialidade"])}
+
+
+async def gerar_relatorio_ia(**dados) -> ResultadoGeracao:
+    return await gerar_na_rota(
+        dados["especialidade"], montar_mensagens(**dados), **parametros_geracao(dados["especialidade"])
+    )
+
+
+def max_tokens_secao(especialidade: Optional[str]) -> int:
+    # Uma secção é ~1/5 do relatório; margem para secções mais longas que a média
+    return max(100, 2 * max_tokens_para(especialidade) // len(SECOES))
+
+
+async def gerar_secao_ia(chave: str, secoes: dict, instrucao: Optional[str] = None, **dados) -> ResultadoGeracao:
+    parametros = {**PARAMETROS_GERACAO, "max_tokens": max_tokens_secao(dados["especialidade"])}
+    return await gerar_na_rota(
+        dados["especialidade"], montar_mensagens_secao(chave, secoes, instrucao, **dados), **parametros
+    )
+
+
+async def gerar_relatorio_ia_stream(**dados) -> AsyncIterator[Union[str, ResultadoGeracao]]:
+    async for item in gerar_stream_na_rota(
+        dados["especialidade"], montar_mensagens(**dados), **parametros_geracao(dados["especialidade"])
+    ):
+        yield item
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import pytz
+from nanoid import generate
+from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload, undefer_group
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.limitador import pedidos_por_minuto, tokens_por_minuto
+from app.models.auditoria import Auditoria
+from app.models.relatorio import GRUPO_DETALHE, Consulta, Relatorio
+from app.services.backends_llm import ResultadoGeracao
+from app.services.cache_relatorio import chave_cache, gerar_com_cache
+from app.services.geracao import GeradorRelatorio, dados_prompt, estimar_tokens, gerar_relatorio_ia, max_tokens_para, montar_mensagens
+from app.services.relatorio import novo_relatorio, registar_entradas
+from app.services.uso import acumular_uso
+
+logger = logging.getLogger(__name__)
+
+# Consultas carregadas (e decifradas) de cada vez
+TAMANHO_LEITURA = 100
+
+
+@dataclass
+class ProgressoLote:
+    id: str
+    usuario_id: str
+    total: int
+    concluidos: int = 0
+    falhados: int = 0
+    estado: str = "em_execucao"
+    data_inicio: datetime = field(default_factory=lambda: datetime.now(pytz.utc))
+    data_conclusao: Optional[datetime] = None
+
+    def como_dict(self) -> dict:
+        return {
+            "lote_id": self.id,
+            "status": self.estado,
+            "total": self.total,
+            "concluidos": self.concluidos,
+            "falhados": self.falhados,
+            "data_inicio": self.data_inicio,
+            "data_conclusao": self.data_conclusao,
+        }
+
+
+# Lotes deste processo (o progresso não sobrevive a um reinício; repetir o lote retoma
+# as consultas que ainda não têm relatório ou cujo relatório continua desatualizado)
+lotes: Dict[str, ProgressoLote] = {}
+_execucoes: Dict[str, asyncio.Task] = {}
+
+
+async def consultas_sem_relatorio(db: AsyncSession, limite: Optional[int] = None) -> List[str]:
+    result = await db.execute(
+        select(Consulta.id)
+        .where(
+            Consulta.deleted == False,
+            Consulta.paciente_id.isnot(None),
+            Consulta.usuario_id.isnot(None),
+            ~Consulta.relatorios.any(Relatorio.deleted == False),
+        )
+        .order_by(Consulta.data_criacao)
+        .limit(limite)
+    )
+    return list(result.scalars().all())
+
+
+async def consultas_desatualizadas(db: AsyncSession, limite: Optional[int] = None) -> List[str]:
+    """Consultas editadas depois do último relatório: nenhum relatório tem a impressão digital atual."""
+    result = await db.execute(
+        select(Consulta.id)
+        .where(
+            Consulta.deleted == False,
+            Consulta.paciente_id.isnot(None),
+            Consulta.usuario_id.isnot(None),
+            Consulta.chave_entrada.isnot(None),
+            Consulta.relatorios.any(Relatorio.deleted == False),
+            ~Consulta.relatorios.any(and_(
+                Relatorio.deleted == False, Relatorio.chave_entrada == Consulta.chave_entrada
+            )),
+        )
+        .order_by(Consulta.data_criacao)
+        .limit(limite)
+    )
+    return list(result.scalars().all())
+
+
+async def carregar_dados_prompt(db: AsyncSession, consulta_ids: List[str]) -> List[Tuple[str, dict]]:
+    result = await db.execute(
+        select(Consulta)
+        .options(
+            undefer_group(GRUPO_DETALHE),  # Diagnóstico e prescrições entram no prompt
+            selectinload(Consulta.paciente),
+            selectinload(Consulta.usuario),
+        )
+        .where(Consulta.id.in_(consulta_ids), Consulta.deleted == False)
+    )
+    return [(c.id, dados_prompt(c)) for c in result.scalars().all() if c.paciente and c.usuario]
+
+
+async def gerar_em_lote(
+    progresso: ProgressoLote,
+    consulta_ids: List[str],
+    gerar: GeradorRelatorio = gerar_relatorio_ia,
+    session_factory=async_session,
+    concorrencia: int = settings.LOTE_CONCORRENCIA,
+    tamanho_escrita: int = settings.LOTE_TAMANHO_ESCRITA,
+) -> ProgressoLote:
+    """
+    Gera os relatórios das consultas indicadas: no máximo `concorrencia` chamadas ao
+    modelo em simultâneo, dentro dos limites de pedidos e tokens por minuto. Os
+    relatórios são inseridos em grupos de `tamanho_escrita` e o lote deixa um único
+    registo de auditoria.
+    """
+    semaforo = asyncio.Semaphore(concorrencia)
+    escrita = asyncio.Lock()
+    por_escrever: List[Tuple[str, dict, ResultadoGeracao]] = []
+
+    async def escrever(tudo: bool = False) -> None:
+        async with escrita:
+            if not por_escrever or (len(por_escrever) < tamanho_escrita and not tudo):
+                return
+            grupo = por_escrever[:]
+            por_escrever.clear()
+            por_especialidade = defaultdict(list)
+            for _, dados, resultado in grupo:
+                por_especialidade[dados["especialidade"]].append(resultado)
+            async with session_factory() as db:
+                for consulta_id, dados, resultado in grupo:
+                    chave = chave_cache(dados)
+                    db.add(novo_relatorio(consulta_id, resultado, chave))
+                    await registar_entradas(db, consulta_id, chave)
+                for especialidade, resultados in por_especialidade.items():
+                    await acumular_uso(db, progresso.usuario_id, especialidade, resultados)
+                await db.commit()
+
+    async def gerar_um(consulta_id: str, dados: dict) -> None:
+        async with semaforo:
+            await pedidos_por_minuto.adquirir()
+            await tokens_por_minuto.adquirir(
+                estimar_tokens(montar_mensagens(**dados), max_tokens_para(dados["especialidade"]))
+            )
+            try:
+                resultado = await gerar_com_cache(dados, gerar, session_factory=session_factory)
+            except Exception:
+                logger.exception("Falha na geração em lote da consulta %s", consulta_id)
+                progresso.falhados += 1
+                return
+        por_escrever.append((consulta_id, dados, resultado))
+        progresso.concluidos += 1
+        await escrever()
+
+    try:
+        for inicio in range(0, len(consulta_ids), TAMANHO_LEITURA):
+            grupo_ids = consulta_ids[inicio:inicio + TAMANHO_LEITURA]
+            async with session_factory() as db:
+                dados = await carregar_dados_prompt(db, grupo_ids)
+            progresso.falhados += len(grupo_ids) - len(dados)  # Removidas entretanto
+            await asyncio.gather(*(gerar_um(consulta_id, d) for consulta_id, d in dados))
+        await escrever(tudo=True)
+        progresso.estado = "concluido"
+    except Exception:
+        logger.exception("Lote de geração %s interrompido", progresso.id)
+        progresso.estado = "falhado"
+    finally:
+        progresso.data_conclusao = datetime.now(pytz.utc)
+        async with session_factory() as db:
+            db.add(Auditoria(
+                acao=f"Geração em lote: {progresso.concluidos} relatórios gerados, {progresso.falhados} falhados.",
+                data_criacao=datetime.now(pytz.utc),
+                usuario_id=progresso.usuario_id
+            ))
+            await db.commit()
+    return progresso
+
+
+def lote_em_execucao() -> Optional[ProgressoLote]:
+    return next((p for p in lotes.values() if p.estado == "em_execucao"), None)
+
+
+async def iniciar_lote(
+    db: AsyncSession, usuario_id: str, limite: Optional[int] = None, desatualizados: bool = False
+) -> ProgressoLote:
+    # Consultas sem relatório ou, com desatualizados=True, só as que mudaram desde o último
+    if desatualizados:
+        consulta_ids = await consultas_desatualizadas(db, limite)
+    else:
+        consulta_ids = await consultas_sem_relatorio(db, limite)
+    progresso = ProgressoLote(id=generate(), usuario_id=usuario_id, total=len(consulta_ids))
+    lotes[progresso.id] = progresso
+    execucao = asyncio.create_task(gerar_em_lote(progresso, consulta_ids))
+    _execucoes[progresso.id] = execucao
+    execucao.add_done_callback(lambda _: _execucoes.pop(progresso.id, None))
+    return progresso
+
+
+def get_lote(lote_id: str) -> Optional[ProgressoLote]:
+    return lotes.get(lote_id)
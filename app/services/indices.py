@@ -0,0 +1,73 @@
+from sqlalchemy import and_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models.relatorio import Consulta, Paciente, Usuario
+from app.models.pesquisa import IndicePesquisa
+from app.services.pesquisa import ENTIDADE_PACIENTE, ENTIDADE_USUARIO, indexar_nome
+from app.core.blind_index import (
+    indice_bi_paciente, indice_correio_paciente, indice_correio_usuario, indice_telefone_paciente, indice_tipo_consulta
+)
+
+# (modelo, coluna cifrada, coluna do índice cego, função de indexação)
+INDICES_CEGOS = [
+    (Usuario, "correio", "correio_bidx", indice_correio_usuario),
+    (Paciente, "bi", "bi_bidx", indice_bi_paciente),
+    (Paciente, "correio", "correio_bidx", indice_correio_paciente),
+    (Paciente, "telefone", "telefone_bidx", indice_telefone_paciente),
+    (Consulta, "tipo", "tipo_bidx", indice_tipo_consulta),
+]
+
+
+async def preencher_indices_cegos(db: AsyncSession, tamanho_lote: int = 500) -> int:
+    """
+    Migração de dados: calcula os índices cegos dos registros criados antes de existirem
+    essas colunas. É idempotente e processa em lotes; devolve o número de registros atualizados.
+    """
+    total = 0
+    for model, campo, campo_bidx, indexar in INDICES_CEGOS:
+        pendente = and_(getattr(model, campo_bidx).is_(None), getattr(model, campo).isnot(None))
+        # Cursor pelo id: um valor sem índice (correio vazio, telefone sem dígitos) continua
+        # com o índice a NULL e voltaria a ser selecionado em cada lote
+        ultimo_id = ""
+        while True:
+            result = await db.execute(
+                select(model).where(pendente, model.id > ultimo_id).order_by(model.id).limit(tamanho_lote)
+            )
+            registros = result.scalars().all()
+            if not registros:
+                break
+            for registro in registros:
+                setattr(registro, campo_bidx, indexar(getattr(registro, campo)))
+            await db.commit()
+            ultimo_id = registros[-1].id
+            total += len(registros)
+    return total
+
+
+async def preencher_indice_pesquisa(db: AsyncSession, tamanho_lote: int = 500) -> int:
+    """
+    Migração de dados: indexa os nomes dos pacientes e usuários que ainda não têm
+    entradas no índice de pesquisa. É idempotente; devolve o número de registros indexados.
+    """
+    total = 0
+    for model, entidade in ((Paciente, ENTIDADE_PACIENTE), (Usuario, ENTIDADE_USUARIO)):
+        sem_indice = ~exists().where(
+            IndicePesquisa.entidade == entidade, IndicePesquisa.entidade_id == model.id
+        )
+        ultimo_id = ""
+        while True:
+            result = await db.execute(
+                select(model)
+                .where(model.deleted == False, model.id > ultimo_id, sem_indice)
+                .order_by(model.id)
+                .limit(tamanho_lote)
+            )
+            registros = result.scalars().all()
+            if not registros:
+                break
+            for registro in registros:
+                await indexar_nome(db, entidade, registro.id, registro.nome_completo)
+            await db.commit()
+            ultimo_id = registros[-1].id
+            total += len(registros)
+    return total
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import pytz
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.core.config import settings
+from app.core.limitador import pedidos_por_minuto, tokens_por_minuto
+from app.models.auditoria import Auditoria
+from app.models.relatorio import Consulta, Relatorio
+from app.services.backends_llm import ResultadoGeracao, obter_backend
+from app.services.cache_relatorio import chave_cache
+from app.services.geracao import estimar_tokens, montar_mensagens, parametros_geracao
+from app.services.geracao_lote import TAMANHO_LEITURA, carregar_dados_prompt, consultas_sem_relatorio
+from app.services.relatorio import novo_relatorio
+from app.services.uso import acumular_uso
+
+logger = logging.getLogger(__name__)
+
+# Ficheiros de um diretório de lote
+ENTRADA = "entrada.jsonl"
+SAIDA = "saida.jsonl"
+ESTADO = "estado.json"
+
+ENDPOINT = "/v1/chat/completions"
+
+
+def _ler_jsonl(caminho: str) -> Iterator[dict]:
+    with open(caminho, encoding="utf-8") as ficheiro:
+        for linha in ficheiro:
+            if linha.strip():
+                yield json.loads(linha)
+
+
+def ler_estado(diretorio: str) -> dict:
+    caminho = os.path.join(diretorio, ESTADO)
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding="utf-8") as ficheiro:
+        return json.load(ficheiro)
+
+
+def gravar_estado(diretorio: str, estado: dict) -> None:
+    # Escrita atómica: um processo interrompido não deixa o estado a meio
+    temporario = os.path.join(diretorio, ESTADO + ".tmp")
+    with open(temporario, "w", encoding="utf-8") as ficheiro:
+        json.dump(estado, ficheiro, indent=2)
+    os.replace(temporario, os.path.join(diretorio, ESTADO))
+
+
+class BackendLote:
+    """Destino do ficheiro de entrada: submete, consulta o estado e descarrega o resultado."""
+
+    nome = "base"
+
+    async def submeter(self, entrada: str) -> str:
+        raise NotImplementedError
+
+    async def concluido(self, lote_id: str) -> bool:
+        raise NotImplementedError
+
+    async def descarregar(self, lote_id: str, saida: str) -> None:
+        raise NotImplementedError
+
+
+class BackendOpenAI(BackendLote):
+    """Batch API da OpenAI (preço de lote, janela de 24 h)."""
+
+    nome = "openai"
+
+    def __init__(self):
+        self.client = obter_backend("openai").client
+
+    async def submeter(self, entrada: str) -> str:
+        with open(entrada, "rb") as ficheiro:
+            enviado = await self.client.files.create(file=ficheiro, purpose="batch")
+        lote = await self.client.batches.create(
+            input_file_id=enviado.id, endpoint=ENDPOINT, completion_window="24h"
+        )
+        return lote.id
+
+    async def concluido(self, lote_id: str) -> bool:
+        lote = await self.client.batches.retrieve(lote_id)
+        if lote.status in ("failed", "expired", "cancelled"):
+            raise RuntimeError(f"Lote {lote_id} terminou com o estado '{lote.status}'")
+        return lote.status == "completed"
+
+    async def descarregar(self, lote_id: str, saida: str) -> None:
+        lote = await self.client.batches.retrieve(lote_id)
+        conteudo = await self.client.files.content(lote.output_file_id)
+        with open(saida, "wb") as ficheiro:
+            ficheiro.write(conteudo.read())
+
+
+class BackendLocal(BackendLote):
+    """
+    Substituto local da Batch API: executa cada pedido do ficheiro de entrada com o
+    cliente de chat (respeitando os limites por minuto) e escreve o ficheiro de saída
+    no mesmo formato. Útil em desenvolvimento e contra um servidor compatível.
+    """
+
+    nome = "local"
+
+    def __init__(self, concorrencia: int = settings.LOTE_CONCORRENCIA):
+        self.concorrencia = concorrencia
+        self.client = obter_backend("openai").client
+
+    async def submeter(self, entrada: str) -> str:
+        # O "id" do lote é o próprio ficheiro; o trabalho é feito em descarregar()
+        return os.path.abspath(entrada)
+
+    async def concluido(self, lote_id: str) -> bool:
+        return True
+
+    async def descarregar(self, lote_id: str, saida: str) -> None:
+        semaforo = asyncio.Semaphore(self.concorrencia)
+        linhas: List[dict] = []
+
+        async def executar(pedido: dict) -> None:
+            async with semaforo:
+                await pedidos_por_minuto.adquirir()
+                await tokens_por_minuto.adquirir(estimar_tokens(pedido["body"]["messages"], pedido["body"]["max_tokens"]))
+                try:
+                    resposta = await self.client.chat.completions.create(**pedido["body"])
+                    linhas.append({
+                        "custom_id": pedido["custom_id"],
+                        "response": {"status_code": 200, "body": resposta.model_dump()},
+                        "error": None,
+                    })
+                except Exception as exc:
+                    linhas.append({
+                        "custom_id": pedido["custom_id"],
+                        "response": None,
+                        "error": {"message": f"{type(exc).__name__}: {exc}"},
+                    })
+
+        await asyncio.gather(*(executar(pedido) for pedido in _ler_jsonl(lote_id)))
+        with open(saida, "w", encoding="utf-8") as ficheiro:
+            for linha in linhas:
+                ficheiro.write(json.dumps(linha, ensure_ascii=False) + "\n")
+
+
+BACKENDS = {
+    BackendOpenAI.nome: BackendOpenAI,
+    BackendLocal.nome: BackendLocal,
+}
+
+
+async def exportar(db: AsyncSession, diretorio: str, limite: Optional[int] = None) -> int:
+    """
+    Acrescenta ao ficheiro de entrada os pedidos das consultas sem relatório que ainda
+    lá não estão (custom_id = id da consulta). Devolve o número de pedidos novos.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    entrada = os.path.join(diretorio, ENTRADA)
+    if ler_estado(diretorio).get("lote_id"):
+        raise RuntimeError("O ficheiro de entrada deste diretório já foi submetido")
+    exportadas: Set[str] = set()
+    if os.path.exists(entrada):
+        exportadas = {pedido["custom_id"] for pedido in _ler_jsonl(entrada)}
+
+    consulta_ids = [c for c in await consultas_sem_relatorio(db, limite) if c not in exportadas]
+    # Impressão digital dos dados exportados, para os relatórios importados mais tarde
+    chaves: Dict[str, str] = ler_estado(diretorio).get("chaves", {})
+    novos = 0
+    with open(entrada, "a", encoding="utf-8") as ficheiro:
+        for inicio in range(0, len(consulta_ids), TAMANHO_LEITURA):
+            for consulta_id, dados in await carregar_dados_prompt(db, consulta_ids[inicio:inicio + TAMANHO_LEITURA]):
+                chaves[consulta_id] = chave_cache(dados)
+                # O mesmo prompt e os mesmos parâmetros da geração interativa
+                pedido = {
+                    "custom_id": consulta_id,
+                    "method": "POST",
+                    "url": ENDPOINT,
+                    "body": {
+                        "model": obter_backend("openai").modelo,
+                        "messages": montar_mensagens(**dados),
+                        **parametros_geracao(dados["especialidade"]),
+                    },
+                }
+                ficheiro.write(json.dumps(pedido, ensure_ascii=False) + "\n")
+                novos += 1
+            db.expunge_all()
+    gravar_estado(diretorio, {**ler_estado(diretorio), "chaves": chaves})
+    return novos
+
+
+async def submeter(diretorio: str, backend: BackendLote) -> str:
+    estado = ler_estado(diretorio)
+    if estado.get("lote_id"):
+        return estado["lote_id"]  # Já submetido: não voltar a pagar o lote
+    lote_id = await backend.submeter(os.path.join(diretorio, ENTRADA))
+    gravar_estado(diretorio, {**estado, "backend": backend.nome, "lote_id": lote_id})
+    return lote_id
+
+
+async def descarregar(diretorio: str, backend: BackendLote) -> bool:
+    """Descarrega o resultado se o lote terminou. Devolve False se ainda está a correr."""
+    saida = os.path.join(diretorio, SAIDA)
+    if os.path.exists(saida):
+        return True
+    lote_id = ler_estado(diretorio)["lote_id"]
+    if not await backend.concluido(lote_id):
+        return False
+    temporario = saida + ".tmp"
+    await backend.descarregar(lote_id, temporario)
+    os.replace(temporario, saida)
+    return True
+
+
+def _resultado(linha: dict) -> Optional[ResultadoGeracao]:
+    resposta = linha.get("response") or {}
+    if linha.get("error") or resposta.get("status_code") != 200:
+        return None
+    corpo = resposta["body"]
+    uso = corpo.get("usage") or {}
+    return ResultadoGeracao(
+        texto=corpo["choices"][0]["message"]["content"].strip(),
+        modelo=corpo.get("model"),
+        backend="lote",
+        tokens_prompt=uso.get("prompt_tokens"),
+        tokens_resposta=uso.get("completion_tokens"),
+    )
+
+
+async def importar(
+    db: AsyncSession, diretorio: str, usuario_id: Optional[str] = None,
+    tamanho_escrita: int = settings.LOTE_TAMANHO_ESCRITA,
+) -> dict:
+    """
+    Cria os relatórios a partir do ficheiro de saída. Consultas que já têm relatório
+    são ignoradas, por isso a importação pode ser repetida depois de uma interrupção.
+    """
+    resumo = {"importados": 0, "ignorados": 0, "falhados": 0}
+    chaves: Dict[str, str] = ler_estado(diretorio).get("chaves", {})
+    pendentes: List[Tuple[str, ResultadoGeracao]] = []
+    especialidades: Dict[str, str] = {}
+
+    async def escrever() -> None:
+        if not pendentes:
+            return
+        por_especialidade = defaultdict(list)
+        for consulta_id, resultado in pendentes:
+            por_especialidade[especialidades.get(consulta_id)].append(resultado)
+        for consulta_id, resultado in pendentes:
+            db.add(novo_relatorio(consulta_id, resultado, chaves.get(consulta_id)))
+        for especialidade, resultados in por_especialidade.items():
+            await acumular_uso(db, usuario_id, especialidade, resultados)
+        await db.commit()
+        db.expunge_all()
+        pendentes.clear()
+
+    linhas = list(_ler_jsonl(os.path.join(diretorio, SAIDA)))
+    for inicio in range(0, len(linhas), TAMANHO_LEITURA):
+        grupo = linhas[inicio:inicio + TAMANHO_LEITURA]
+        result = await db.execute(
+            select(Relatorio.consulta_id)
+            .where(Relatorio.consulta_id.in_([l["custom_id"] for l in grupo]), Relatorio.deleted == False)
+        )
+        com_relatorio = set(result.scalars().all())
+        result = await db.execute(select(Consulta.id, Consulta.tipo).where(Consulta.id.in_([l["custom_id"] for l in grupo])))
+        especialidades.update(result.all())
+        for linha in grupo:
+            resultado = _resultado(linha)
+            if resultado is None:
+                resumo["falhados"] += 1
+            elif linha["custom_id"] in com_relatorio:
+                resumo["ignorados"] += 1
+            else:
+                pendentes.append((linha["custom_id"], resultado))
+                com_relatorio.add(linha["custom_id"])
+                resumo["importados"] += 1
+                if len(pendentes) >= tamanho_escrita:
+                    await escrever()
+    await escrever()
+
+    if resumo["importados"]:
+        db.add(Auditoria(
+            acao=f"Lote offline: {resumo['importados']} relatórios importados, {resumo['falhados']} falhados.",
+            data_criacao=datetime.now(pytz.utc),
+            usuario_id=usuario_id
+        ))
+        await db.commit()
+    gravar_estado(diretorio, {**ler_estado(diretorio), "importado": resumo})
+    return resumo
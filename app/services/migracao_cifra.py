@@ -0,0 +1,44 @@
+from sqlalchemy import Text, not_, type_coerce, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.core.cifra import PREFIXO, AesGcmEncryptedType
+from app.models.relatorio import Consulta, Paciente, Relatorio, Usuario
+
+
+def _colunas_cifradas(model):
+    return [c for c in model.__table__.columns if isinstance(c.type, AesGcmEncryptedType)]
+
+
+async def migrar_cifra_legada(db: AsyncSession, tamanho_lote: int = 500) -> int:
+    """
+    Migração de dados: volta a cifrar em AES-GCM os valores ainda no formato antigo
+    (StringEncryptedType/AES-CBC). A leitura funciona com os dois formatos, por isso a
+    migração pode correr aos poucos; é idempotente. Devolve o número de valores migrados.
+    """
+    total = 0
+    for model in (Usuario, Paciente, Consulta, Relatorio):
+        for coluna in _colunas_cifradas(model):
+            # Ler o texto cifrado em bruto, sem passar pelo tipo cifrado
+            bruto = type_coerce(coluna, Text)
+            while True:
+                result = await db.execute(
+                    select(model.id, bruto)
+                    .where(bruto.isnot(None), not_(bruto.like(f"{PREFIXO}%")))
+                    .limit(tamanho_lote)
+                )
+                linhas = result.all()
+                if not linhas:
+                    break
+                for id, valor in linhas:
+                    await db.execute(
+                        update(model.__table__)
+                        .where(model.__table__.c.id == id)
+                        .values({
+                            coluna.name: coluna.type.decifrar_legado(valor),
+                            # Manter a data de atualização: o conteúdo não mudou
+                            "data_atualizacao": model.__table__.c.data_atualizacao,
+                        })
+                    )
+                await db.commit()
+                total += len(linhas)
+    return total
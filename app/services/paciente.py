@@ -1,21 +1,41 @@
 from datetime import datetime
 import pytz
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, undefer_group
 from sqlalchemy.future import select
 from typing import List, Optional
-from app.models.relatorio import Paciente, Consulta
-from app.services.CRUDBase import CRUDBase
+from app.models.relatorio import GRUPO_DETALHE, Paciente, Consulta
+from app.services.CRUDBase import CRUDBase, DataTablePage, Projection
+from app.schemas.datatables import DataTableParams
+from app.schemas.listagens import PacienteLinha
 from app.schemas.paciente import PacienteCreate, PacienteUpdate  
+from app.core.blind_index import normalizar_texto, indice_bi_paciente, indice_correio_paciente, indice_telefone_paciente
+from app.services.pesquisa import ENTIDADE_PACIENTE, ids_correspondentes, indexar_nome, pesquisar, remover_indice
+
+# Colunas da lista que podem ser ordenadas em SQL (os campos cifrados não têm ordem útil)
+COLUNAS_ORDENAVEIS = {
+    "data_nascimento": Paciente.data_nascimento,
+    "data_criacao": Paciente.data_criacao,
+}
+
+# Projeção da lista: sem endereço, sexo, correio nem consultas
+LINHA_PACIENTE = Projection(PacienteLinha, {
+    "id": Paciente.id,
+    "nome_completo": Paciente.nome_completo,
+    "data_nascimento": Paciente.data_nascimento,
+    "bi": Paciente.bi,
+    "telefone": Paciente.telefone,
+    "data_criacao": Paciente.data_criacao,
+})
 
 class CRUDPaciente(CRUDBase[Paciente]):
     async def get_by_name(self, db: AsyncSession, nome_completo: str) -> Optional[Paciente]:
-        result = await db.execute(
-            select(Paciente)
-            .where(Paciente.nome_completo == nome_completo, Paciente.deleted == False)
-        )
-        return result.scalars().first()
+        # O nome é cifrado com nonce aleatório: candidatos pelo índice de pesquisa, comparação em claro
+        for paciente in await search_pacientes(db, nome_completo, limit=None):
+            if normalizar_texto(paciente.nome_completo) == normalizar_texto(nome_completo):
+                return paciente
+        return None
 
 crud_paciente = CRUDPaciente(Paciente)
 
@@ -24,22 +44,64 @@ async def get_paciente(db: AsyncSession, paciente_id: str) -> Optional[Paciente]
     result = await db.execute(
         select(Paciente)
         .options(
-            selectinload(Paciente.consultas),  # Carregar as consultas associadas ao paciente
+            undefer_group(GRUPO_DETALHE),  # Endereço (vista de detalhe e edição)
+            selectinload(Paciente.consultas)  # Carregar as consultas associadas ao paciente
+            .undefer_group(GRUPO_DETALHE),  # com diagnóstico e prescrições
         )
         .where(Paciente.id == paciente_id, Paciente.deleted == False)
     )
     return result.scalars().first()
 
 
-async def get_pacientes(db: AsyncSession) -> List[Paciente]:
+async def get_paciente_by_bi(db: AsyncSession, bi: str) -> Optional[Paciente]:
     result = await db.execute(
-        select(Paciente)
-        .options(
-            selectinload(Paciente.consultas),  # Carregar as consultas associadas a cada paciente
-        )
-        .where(Paciente.deleted == False)
+        select(Paciente).where(Paciente.bi_bidx == indice_bi_paciente(bi), Paciente.deleted == False)
+    )
+    return result.scalars().first()
+
+
+async def get_paciente_by_email(db: AsyncSession, correio: str) -> Optional[Paciente]:
+    result = await db.execute(
+        select(Paciente).where(Paciente.correio_bidx == indice_correio_paciente(correio), Paciente.deleted == False)
     )
-    return result.unique().scalars().all()
+    return result.scalars().first()
+
+
+async def get_pacientes(db: AsyncSession) -> List[PacienteLinha]:
+    return await crud_paciente.get_all(db, limit=None, projection=LINHA_PACIENTE)
+
+
+async def has_pacientes(db: AsyncSession) -> bool:
+    return await crud_paciente.exists(db)
+
+
+def _filtros_pesquisa(pesquisa: str) -> list:
+    # Nome parcial pelo índice de trigramas; BI, correio e telefone exatos pelos índices cegos
+    if not pesquisa:
+        return []
+    condicoes = [
+        Paciente.bi_bidx == indice_bi_paciente(pesquisa),
+        Paciente.correio_bidx == indice_correio_paciente(pesquisa),
+    ]
+    indice_telefone = indice_telefone_paciente(pesquisa)
+    if indice_telefone:
+        condicoes.append(Paciente.telefone_bidx == indice_telefone)
+    ids_nome = ids_correspondentes(ENTIDADE_PACIENTE, pesquisa)
+    if ids_nome is not None:
+        condicoes.append(Paciente.id.in_(ids_nome))
+    return [or_(*condicoes)]
+
+
+async def get_pacientes_datatable(db: AsyncSession, params: DataTableParams) -> DataTablePage:
+    return await crud_paciente.get_datatable(
+        db, params, COLUNAS_ORDENAVEIS, filters=_filtros_pesquisa(params.search),
+        projection=LINHA_PACIENTE,
+    )
+
+
+async def search_pacientes(db: AsyncSession, query: str, limit: Optional[int] = 20) -> List[Paciente]:
+    # Candidatos pelo índice de trigramas; só estes são decifrados e confirmados
+    return await pesquisar(db, Paciente, ENTIDADE_PACIENTE, query, limite=limit)
 
 
 async def create_paciente(db: AsyncSession, paciente_data: PacienteCreate) -> Paciente:
@@ -59,6 +121,8 @@ async def create_paciente(db: AsyncSession, paciente_data: PacienteCreate) -> Pa
     
     # Guardar o paciente na base de dados
     db.add(paciente)
+    await db.flush()
+    await indexar_nome(db, ENTIDADE_PACIENTE, paciente.id, paciente.nome_completo)
     await db.commit()
     await db.refresh(paciente)
 
@@ -71,8 +135,11 @@ async def update_paciente(
     paciente = await get_paciente(db, paciente_id)
     if not paciente:
         return None
-    for field, value in paciente_data.dict(exclude_unset=True).items():
+    dados = paciente_data.dict(exclude_unset=True)
+    for field, value in dados.items():
         setattr(paciente, field, value)
+    if dados.get("nome_completo") is not None:
+        await indexar_nome(db, ENTIDADE_PACIENTE, paciente.id, paciente.nome_completo)
 
     await db.commit()
     await db.refresh(paciente)
@@ -81,4 +148,8 @@ async def update_paciente(
 
 
 async def delete_paciente(db: AsyncSession, paciente_id: str) -> Paciente:
-    return await crud_paciente.delete(db, paciente_id)
\ No newline at end of file
+    paciente = await crud_paciente.delete(db, paciente_id)
+    if paciente:
+        await remover_indice(db, ENTIDADE_PACIENTE, paciente.id)
+        await db.commit()
+    return paciente
\ No newline at end of file
@@ -0,0 +1,81 @@
+from typing import Optional
+from sqlalchemy import delete, distinct, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models.pesquisa import IndicePesquisa
+from app.core.blind_index import corresponde_pesquisa, tokens_pesquisa, trigramas_indice, trigramas_pesquisa
+
+ENTIDADE_PACIENTE = "paciente"
+ENTIDADE_USUARIO = "usuario"
+
+# Candidatos decifrados por ida à base quando a pesquisa não tem limite
+LOTE_CANDIDATOS = 100
+
+
+async def indexar_nome(db: AsyncSession, entidade: str, entidade_id: str, nome: str) -> None:
+    """
+    (Re)constrói as entradas do índice de pesquisa de um registro. Não faz commit:
+    as entradas são gravadas na mesma transação que o registro.
+    """
+    await remover_indice(db, entidade, entidade_id)
+    tokens = tokens_pesquisa(trigramas_indice(nome or ""), entidade)
+    if tokens:
+        await db.execute(
+            insert(IndicePesquisa),
+            [{"entidade": entidade, "entidade_id": entidade_id, "token": token} for token in tokens]
+        )
+
+
+async def remover_indice(db: AsyncSession, entidade: str, entidade_id: str) -> None:
+    await db.execute(
+        delete(IndicePesquisa)
+        .where(IndicePesquisa.entidade == entidade, IndicePesquisa.entidade_id == entidade_id)
+    )
+
+
+def ids_correspondentes(entidade: str, pesquisa: str, modelo=None):
+    """
+    Subconsulta com os ids dos registros que contêm todos os trigramas da pesquisa,
+    ou None se a pesquisa não tiver termos utilizáveis. Com `modelo`, só os registros
+    desse modelo que não foram apagados.
+    """
+    tokens = set(tokens_pesquisa(trigramas_pesquisa(pesquisa), entidade))
+    if not tokens:
+        return None
+    stmt = select(IndicePesquisa.entidade_id).where(
+        IndicePesquisa.entidade == entidade, IndicePesquisa.token.in_(tokens)
+    )
+    if modelo is not None:
+        stmt = stmt.join(modelo, modelo.id == IndicePesquisa.entidade_id).where(modelo.deleted == False)
+    return (
+        stmt.group_by(IndicePesquisa.entidade_id)
+        .having(func.count(distinct(IndicePesquisa.token)) == len(tokens))
+    )
+
+
+async def pesquisar(db: AsyncSession, modelo, entidade: str, pesquisa: str, limite: Optional[int] = None) -> list:
+    """
+    Registros não apagados de `modelo` cujo nome contém a pesquisa. Os candidatos do
+    índice de trigramas são lidos por lotes (cursor no id) e confirmados em claro, até
+    haver `limite` confirmados ou acabarem os candidatos: os falsos positivos do índice
+    não escondem resultados.
+    """
+    candidatos = ids_correspondentes(entidade, pesquisa, modelo)
+    if candidatos is None:
+        return []
+    lote = limite * 2 if limite else LOTE_CANDIDATOS
+    encontrados = []
+    ultimo_id = None
+    while True:
+        stmt = candidatos.order_by(IndicePesquisa.entidade_id).limit(lote)
+        if ultimo_id is not None:
+            stmt = stmt.where(IndicePesquisa.entidade_id > ultimo_id)
+        ids = list((await db.execute(stmt)).scalars().all())
+        if not ids:
+            break
+        result = await db.execute(select(modelo).where(modelo.id.in_(ids)).order_by(modelo.id))
+        encontrados.extend(r for r in result.scalars().all() if corresponde_pesquisa(r.nome_completo, pesquisa))
+        if (limite and len(encontrados) >= limite) or len(ids) < lote:
+            break
+        ultimo_id = ids[-1]
+    return encontrados[:limite] if limite else encontrados
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+from app.core import metricas
+from app.core.admissao import admissao
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.resiliencia import CircuitoAberto
+from app.models.relatorio import Usuario
+from app.services import cache_relatorio
+from app.services.backends_llm import rota_disponivel
+from app.services.consulta import get_consulta
+from app.services.geracao import dados_prompt, gerar_relatorio_ia
+from app.services.relatorio import get_relatorio_atual
+from app.services.tarefas import fila_relatorios
+from app.services.uso import acumular_uso, dentro_da_quota
+from app.services.voos import voos
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre verificações enquanto há gerações pedidas por usuários em curso
+INTERVALO_OCUPADO_S = 2.0
+
+estatisticas = {
+    "agendadas": 0,
+    "canceladas": 0,
+    "geradas": 0,
+    "ja_em_cache": 0,
+    "ja_atual": 0,
+    "descartadas": 0,
+    "falhadas": 0,
+}
+
+
+class PreGeracao:
+    """
+    Geração especulativa do relatório quando uma consulta é gravada: o texto fica na
+    cache e o pedido do médico é servido de imediato, sem esperar pelo modelo.
+
+    Cada gravação reinicia a espera da consulta (debounce); uma nova gravação cancela
+    a pré-geração anterior, mesmo a meio. Baixa prioridade: só corre quando a fila e
+    os streamings deste processo estão livres, e no máximo `concorrencia` de cada vez.
+    """
+
+    def __init__(
+        self,
+        atraso: float = settings.PRE_GERACAO_ATRASO_S,
+        concorrencia: int = settings.PRE_GERACAO_CONCORRENCIA,
+        session_factory=async_session,
+    ):
+        self.atraso = atraso
+        self.session_factory = session_factory
+        self._vagas = asyncio.Semaphore(concorrencia)
+        self._agendadas: Dict[str, asyncio.Task] = {}
+
+    def agendar(self, consulta_id: str, usuario_id: str) -> None:
+        self.cancelar(consulta_id)
+        estatisticas["agendadas"] += 1
+        tarefa = asyncio.create_task(self._pre_gerar(consulta_id, usuario_id))
+        self._agendadas[consulta_id] = tarefa
+        tarefa.add_done_callback(lambda t: self._terminada(consulta_id, t))
+
+    def _terminada(self, consulta_id: str, tarefa: asyncio.Task) -> None:
+        if self._agendadas.get(consulta_id) is tarefa:
+            del self._agendadas[consulta_id]
+
+    def em_espera(self) -> int:
+        return len(self._agendadas)
+
+    def cancelar(self, consulta_id: str) -> None:
+        anterior = self._agendadas.pop(consulta_id, None)
+        if anterior and not anterior.done():
+            anterior.cancel()
+            estatisticas["canceladas"] += 1
+
+    async def parar(self) -> None:
+        tarefas = list(self._agendadas.values())
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self._agendadas.clear()
+
+    async def _pre_gerar(self, consulta_id: str, usuario_id: str) -> None:
+        await asyncio.sleep(self.atraso)
+        async with self._vagas:
+            # Cede a vez às gerações pedidas pelos usuários
+            while fila_relatorios.pendentes() or voos or admissao.na_fila():
+                await asyncio.sleep(INTERVALO_OCUPADO_S)
+
+            async with self.session_factory() as db:
+                consulta = await get_consulta(db, consulta_id)
+                usuario = await db.get(Usuario, usuario_id)
+                if not consulta or not consulta.paciente or not consulta.usuario or not usuario:
+                    estatisticas["descartadas"] += 1
+                    return
+                dados = dados_prompt(consulta)
+                if not await dentro_da_quota(db, usuario) or not rota_disponivel(dados["especialidade"]):
+                    estatisticas["descartadas"] += 1
+                    return
+                chave = cache_relatorio.chave_cache(dados)
+                if await get_relatorio_atual(db, consulta_id, chave):
+                    estatisticas["ja_atual"] += 1  # Será reutilizado, nem a cache é precisa
+                    return
+                if await cache_relatorio.obter(db, chave, entregar=False) is not None:
+                    estatisticas["ja_em_cache"] += 1
+                    return
+
+            # Sem sessão aberta durante a chamada ao modelo. Ocupa uma vaga da admissão como
+            # as outras gerações, na vez das pré-gerações (usuário None), sem gastar a do médico
+            try:
+                async with admissao.admitir(None, verificar=False):
+                    inicio = time.perf_counter()
+                    resultado = await gerar_relatorio_ia(**dados)
+            except CircuitoAberto:
+                estatisticas["descartadas"] += 1
+                return
+            except Exception:
+                estatisticas["falhadas"] += 1
+                logger.exception("Falha na pré-geração do relatório da consulta %s", consulta_id)
+                return
+            async with self.session_factory() as db:
+                # O uso fica sem usuário (fora da quota do médico) até alguém receber o texto
+                await cache_relatorio.guardar(
+                    db, chave, resultado, int((time.perf_counter() - inicio) * 1000), pre_gerada=True
+                )
+                await acumular_uso(db, None, dados["especialidade"], [resultado])
+                await db.commit()
+            estatisticas["geradas"] += 1
+
+
+pre_geracao = PreGeracao()
+
+
+def _metricas() -> dict:
+    return {**estatisticas, "em_espera": pre_geracao.em_espera()}
+
+
+metricas.registar("pre_geracao", _metricas)
+
+
+def pre_gerar_relatorio(consulta_id: str, usuario_id: str) -> None:
+    """Chamado depois de gravar a consulta; não faz nada se a pré-geração estiver desligada."""
+    if settings.PRE_GERACAO_ATIVA:
+        pre_geracao.agendar(consulta_id, usuario_id)
@@ -1,36 +1,228 @@
 import openai
+from datetime import datetime
+import pytz
+from sqlalchemy import and_, case, exists, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, undefer_group
 from typing import List, Optional
-from app.models.relatorio import Consulta, Paciente, Relatorio, Usuario
+from app.models.auditoria import Auditoria
+from app.models.relatorio import GRUPO_DETALHE, Consulta, Paciente, Relatorio, Usuario
+from app.services.CRUDBase import CRUDBase, DataTablePage, Projection
+from app.services.backends_llm import ResultadoGeracao
+from app.services.secoes import SECOES, limpar_secao, montar_texto, novas_secoes
+from app.services.uso import acumular_uso
+from app.schemas.datatables import DataTableParams
+from app.schemas.listagens import RelatorioLinha
+from app.core.blind_index import indice_tipo_consulta
+from app.services.pesquisa import ENTIDADE_PACIENTE, ids_correspondentes
 from app.core.config import settings
 
 openai.api_key = settings.OPENAI_API_KEY
 
+crud_relatorio = CRUDBase(Relatorio)
+
+# Estado de um relatório face aos dados atuais da consulta (impressão digital)
+ATUAL = "atual"
+DESATUALIZADO = "desatualizado"
+DESCONHECIDO = "desconhecido"  # Relatório ou consulta anteriores ao registo da impressão digital
+SEM_RELATORIO = "sem_relatorio"
+
+ESTADO_RELATORIO = case(
+    (or_(Relatorio.chave_entrada.is_(None), Consulta.chave_entrada.is_(None)), DESCONHECIDO),
+    (Relatorio.chave_entrada == Consulta.chave_entrada, ATUAL),
+    else_=DESATUALIZADO,
+)
+
+# Estado do relatório mais útil de cada consulta: há um atual, só desatualizados ou nenhum
+_RELATORIOS_CONSULTA = and_(Relatorio.consulta_id == Consulta.id, Relatorio.deleted == False)
+ESTADO_RELATORIO_CONSULTA = case(
+    (~exists().where(_RELATORIOS_CONSULTA), SEM_RELATORIO),
+    (Consulta.chave_entrada.is_(None), DESCONHECIDO),
+    (exists().where(_RELATORIOS_CONSULTA, Relatorio.chave_entrada == Consulta.chave_entrada), ATUAL),
+    else_=DESATUALIZADO,
+)
+
+# Colunas da lista que podem ser ordenadas em SQL (os campos cifrados não têm ordem útil)
+COLUNAS_ORDENAVEIS = {
+    "data_criacao": Relatorio.data_criacao,
+}
+
+# Projeção da lista: sem o conteúdo; tipo, paciente e médico por junção através da consulta
+LINHA_RELATORIO = Projection(
+    RelatorioLinha,
+    {
+        "id": Relatorio.id,
+        "tipo": Consulta.tipo,
+        "paciente_nome": Paciente.nome_completo,
+        "medico_nome": Usuario.nome_completo,
+        "estado": ESTADO_RELATORIO,
+        "data_criacao": Relatorio.data_criacao,
+    },
+    joins=(
+        (Consulta, Relatorio.consulta_id == Consulta.id),
+        (Paciente, Consulta.paciente_id == Paciente.id),
+        (Usuario, Consulta.usuario_id == Usuario.id),
+    ),
+)
+
 
 async def get_relatorio(db: AsyncSession, relatorio_id: str) -> Optional[Relatorio]:
     result = await db.execute(
         select(Relatorio)
         .options(
+            undefer_group(GRUPO_DETALHE),  # Conteúdo do relatório
             selectinload(Relatorio.consulta)  # Carregar a consulta associada ao relatório
         )
         .where(Relatorio.id == relatorio_id, Relatorio.deleted == False)
     )
     return result.scalars().first()
 
-async def get_relatorios(db: AsyncSession) -> List[Relatorio]:
+async def get_relatorio_completo(
+    db: AsyncSession, relatorio_id: str, com_detalhe_consulta: bool = False
+) -> Optional[Relatorio]:
+    # Conteúdo, consulta, paciente e médico para a vista de detalhe
+    consulta = selectinload(Relatorio.consulta)
+    if com_detalhe_consulta:
+        consulta = consulta.undefer_group(GRUPO_DETALHE)  # Diagnóstico e prescrições
     result = await db.execute(
         select(Relatorio)
         .options(
-            selectinload(Relatorio.consulta)  # Carregar a consulta associada ao relatório
-            .selectinload(Consulta.usuario),  # Carregar o usuário (médico) da consulta
-            selectinload(Relatorio.consulta)
-            .selectinload(Consulta.paciente)  # Carregar o paciente da consulta
+            undefer_group(GRUPO_DETALHE),
+            consulta.selectinload(Consulta.paciente),
+            selectinload(Relatorio.consulta).selectinload(Consulta.usuario),
+            selectinload(Relatorio.secoes),
         )
-        .where(Relatorio.deleted == False)
+        .where(Relatorio.id == relatorio_id, Relatorio.deleted == False)
+    )
+    return result.scalars().first()
+
+async def get_relatorios(db: AsyncSession) -> List[RelatorioLinha]:
+    return await crud_relatorio.get_all(db, limit=None, projection=LINHA_RELATORIO)
+
+
+def _filtros_pesquisa(pesquisa: str) -> list:
+    # Tipo exato pelo índice cego; nome do paciente pelo índice de trigramas
+    if not pesquisa:
+        return []
+    condicoes = [Consulta.tipo_bidx == indice_tipo_consulta(pesquisa)]
+    ids_pacientes = ids_correspondentes(ENTIDADE_PACIENTE, pesquisa)
+    if ids_pacientes is not None:
+        condicoes.append(Consulta.paciente_id.in_(ids_pacientes))
+    return [Relatorio.consulta.has(or_(*condicoes))]
+
+
+async def get_relatorios_datatable(db: AsyncSession, params: DataTableParams) -> DataTablePage:
+    return await crud_relatorio.get_datatable(
+        db, params, COLUNAS_ORDENAVEIS, filters=_filtros_pesquisa(params.search),
+        projection=LINHA_RELATORIO,
     )
-    return result.unique().scalars().all()
+
+
+def estado_relatorio(relatorio: Relatorio) -> str:
+    """O mesmo que ESTADO_RELATORIO, para um relatório já carregado com a consulta."""
+    chave_consulta = relatorio.consulta.chave_entrada if relatorio.consulta else None
+    if relatorio.chave_entrada is None or chave_consulta is None:
+        return DESCONHECIDO
+    return ATUAL if relatorio.chave_entrada == chave_consulta else DESATUALIZADO
+
+
+async def get_estado_relatorio_consulta(db: AsyncSession, consulta_id: str) -> str:
+    result = await db.execute(select(ESTADO_RELATORIO_CONSULTA).where(Consulta.id == consulta_id))
+    return result.scalar_one()
+
+
+async def get_relatorio_atual(db: AsyncSession, consulta_id: str, chave_entrada: str) -> Optional[str]:
+    """Id do relatório mais recente gerado exatamente destes dados, se ainda existir."""
+    result = await db.execute(
+        select(Relatorio.id)
+        .where(
+            Relatorio.consulta_id == consulta_id,
+            Relatorio.chave_entrada == chave_entrada,
+            Relatorio.deleted == False,
+        )
+        .order_by(Relatorio.data_criacao.desc())
+        .limit(1)
+    )
+    return result.scalar()
+
+
+async def registar_entradas(db: AsyncSession, consulta_id: str, chave_entrada: Optional[str]) -> None:
+    # A geração usa os dados mais recentes da consulta (nome, idade do paciente, ...)
+    if chave_entrada:
+        await db.execute(update(Consulta).where(Consulta.id == consulta_id).values(chave_entrada=chave_entrada))
+
+
+def novo_relatorio(consulta_id: str, resultado: ResultadoGeracao, chave_entrada: Optional[str] = None) -> Relatorio:
+    # Texto gerado, dados de origem e a contabilidade da chamada (modelo, tokens, latência, backend)
+    return Relatorio(
+        conteudo=resultado.texto,
+        consulta_id=consulta_id,
+        chave_entrada=chave_entrada,
+        modelo=resultado.modelo,
+        backend=resultado.backend,
+        tokens_prompt=resultado.tokens_prompt,
+        tokens_resposta=resultado.tokens_resposta,
+        latencia_ms=resultado.latencia_ms,
+        secoes=novas_secoes(resultado.texto),
+    )
+
+
+async def guardar_relatorio(
+    db: AsyncSession, consulta_id: str, resultado: ResultadoGeracao, usuario_id: str,
+    especialidade: Optional[str], commit: bool = True, chave_entrada: Optional[str] = None,
+) -> Relatorio:
+    # Relatório, resumo de uso e registo de auditoria na mesma transação
+    relatorio = novo_relatorio(consulta_id, resultado, chave_entrada)
+    db.add(relatorio)
+    await registar_entradas(db, consulta_id, chave_entrada)
+    await acumular_uso(db, usuario_id, especialidade, [resultado])
+    await db.flush()
+    db.add(Auditoria(
+        acao=f"Relatorio com data '{relatorio.data_criacao}', foi gerado.",
+        data_criacao=datetime.now(pytz.utc),
+        usuario_id=usuario_id
+    ))
+    if commit:
+        await db.commit()
+    return relatorio
+
+
+async def substituir_secao(
+    db: AsyncSession, relatorio_id: str, chave: str, resultado: ResultadoGeracao, usuario_id: str,
+    especialidade: Optional[str],
+) -> Optional[Relatorio]:
+    """
+    Grava a secção regenerada, volta a montar o texto completo e soma os tokens da
+    chamada ao relatório e ao resumo de uso, com a auditoria, numa só transação.
+    """
+    result = await db.execute(
+        select(Relatorio)
+        .options(undefer_group(GRUPO_DETALHE), selectinload(Relatorio.secoes))
+        .where(Relatorio.id == relatorio_id, Relatorio.deleted == False)
+    )
+    relatorio = result.scalars().first()
+    if not relatorio:
+        return None
+    if not relatorio.secoes:
+        relatorio.secoes = novas_secoes(relatorio.conteudo)  # Relatório anterior às secções
+    secoes = {secao.chave: secao for secao in relatorio.secoes}
+    if chave not in secoes:
+        return None
+
+    secoes[chave].conteudo = limpar_secao(chave, resultado.texto)
+    relatorio.conteudo = montar_texto({c: secao.conteudo for c, secao in secoes.items()})
+    if resultado.tokens_prompt is not None:
+        relatorio.tokens_prompt = (relatorio.tokens_prompt or 0) + resultado.tokens_prompt
+        relatorio.tokens_resposta = (relatorio.tokens_resposta or 0) + (resultado.tokens_resposta or 0)
+    await acumular_uso(db, usuario_id, especialidade, [resultado])
+    db.add(Auditoria(
+        acao=f"Secção '{SECOES[chave]}' do relatório com data '{relatorio.data_criacao}', foi regenerada.",
+        data_criacao=datetime.now(pytz.utc),
+        usuario_id=usuario_id
+    ))
+    await db.commit()
+    return relatorio
 
 
 async def delete_relatorio(db: AsyncSession, relatorio_id: str) -> Relatorio:
@@ -0,0 +1,60 @@
+import re
+from typing import Dict, List, Optional
+from app.core.blind_index import normalizar_texto
+from app.models.relatorio import SecaoRelatorio
+
+# Secções pedidas ao modelo, pela ordem do relatório: chave -> título
+SECOES = {
+    "resumo_clinico": "Resumo Clínico",
+    "historico": "Histórico Médico e Sintomas",
+    "plano_tratamento": "Plano de Tratamento",
+    "recomendacoes": "Recomendações Médicas",
+    "prognostico": "Prognóstico",
+}
+
+# Linha de título: "### Resumo Clínico", "**1. Resumo Clínico**", "2) Prognóstico:" ...
+_TITULO = re.compile(r"^\s*(?:#+\s*)?(?:\*\*)?\s*(?:\d+\s*[.)-]?\s*)?(?P<titulo>[^*:#\n]+?)\s*(?:\*\*)?\s*:?\s*(?:\*\*)?\s*$")
+_POR_TITULO = {normalizar_texto(titulo): chave for chave, titulo in SECOES.items()}
+
+
+def dividir_secoes(texto: str) -> Optional[Dict[str, str]]:
+    """
+    Separa o texto gerado pelas linhas de título das secções. Devolve None se o texto
+    não tiver todas as secções (resposta fora do formato pedido).
+    """
+    secoes: Dict[str, List[str]] = {}
+    atual = None
+    for linha in texto.splitlines():
+        titulo = _TITULO.match(linha)
+        chave = _POR_TITULO.get(normalizar_texto(titulo.group("titulo"))) if titulo else None
+        if chave and chave not in secoes:
+            atual = chave
+            secoes[atual] = []
+        elif atual:
+            secoes[atual].append(linha)
+    if set(secoes) != set(SECOES):
+        return None
+    return {chave: "\n".join(secoes[chave]).strip() for chave in SECOES}
+
+
+def limpar_secao(chave: str, texto: str) -> str:
+    # O modelo às vezes repete a linha de título apesar do pedido
+    linhas = texto.strip().splitlines()
+    titulo = _TITULO.match(linhas[0]) if linhas else None
+    if titulo and _POR_TITULO.get(normalizar_texto(titulo.group("titulo"))) == chave:
+        linhas = linhas[1:]
+    return "\n".join(linhas).strip()
+
+
+def montar_texto(secoes: Dict[str, str]) -> str:
+    return "\n\n".join(f"### {SECOES[chave]}\n\n{secoes[chave]}" for chave in SECOES if chave in secoes)
+
+
+def novas_secoes(texto: str) -> List[SecaoRelatorio]:
+    secoes = dividir_secoes(texto)
+    if secoes is None:
+        return []  # Fica só o texto completo; a regeneração parcial não está disponível
+    return [
+        SecaoRelatorio(chave=chave, ordem=ordem, conteudo=secoes[chave])
+        for ordem, chave in enumerate(SECOES)
+    ]
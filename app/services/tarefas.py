@@ -0,0 +1,408 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+import pytz
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.core.admissao import ControladorAdmissao, admissao
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.resiliencia import CircuitoAberto, PrazoExcedido
+from app.models.tarefa import CANCELADA, CONCLUIDA, EM_EXECUCAO, FALHADA, FILA, PENDENTE, TarefaRelatorio
+from app.services.cache_relatorio import chave_cache, gerar_com_cache
+from app.services.consulta import get_consulta
+from app.services.relatorio import get_relatorio_atual, guardar_relatorio
+from app.services.voos import voos
+from app.services.geracao import GeradorRelatorio, dados_prompt, gerar_relatorio_ia
+
+logger = logging.getLogger(__name__)
+
+
+class DadosIncompletos(Exception):
+    """A consulta, o paciente ou o médico já não existem: repetir não adianta."""
+
+
+# Intervalo entre verificações de tarefas da fila abandonadas por um processo que terminou
+INTERVALO_ABANDONO_S = 60
+
+
+def _limite_abandono() -> datetime:
+    # Uma geração em execução há mais do que todas as tentativas e o prazo do pedido permitem
+    # foi abandonada (processo terminado a meio, por exemplo)
+    prazo = max(settings.LLM_TIMEOUT_S * settings.LLM_TENTATIVAS, settings.RELATORIO_PRAZO_S) + 60
+    return datetime.now(pytz.utc) - timedelta(seconds=prazo)
+
+
+async def reservar_tarefa(
+    db: AsyncSession,
+    consulta_id: str,
+    usuario_id: str,
+    chave: Optional[str],
+    forcar: bool = False,
+    origem: str = FILA,
+) -> Tuple[TarefaRelatorio, bool]:
+    """
+    Single-flight entre processos, pela chave de idempotência (consulta + chave da cache).
+    Devolve (tarefa, nova): a tarefa em curso com os mesmos dados, ou, sem forcar, uma
+    tarefa já concluída com o relatório atual destes dados; senão cria uma nova.
+    """
+    if chave and not forcar:
+        relatorio_id = await get_relatorio_atual(db, consulta_id, chave)
+        if relatorio_id:
+            # Os dados não mudaram desde o último relatório: reutiliza-o sem chamar o modelo
+            agora = datetime.now(pytz.utc)
+            tarefa = TarefaRelatorio(
+                consulta_id=consulta_id,
+                usuario_id=usuario_id,
+                estado=CONCLUIDA,
+                origem=origem,
+                chave_entrada=chave,
+                relatorio_id=relatorio_id,
+                data_inicio=agora,
+                data_conclusao=agora,
+            )
+            db.add(tarefa)
+            await db.commit()
+            await db.refresh(tarefa)
+            return tarefa, False
+
+    for _ in range(3):
+        tarefa = TarefaRelatorio(
+            consulta_id=consulta_id,
+            usuario_id=usuario_id,
+            estado=PENDENTE if origem == FILA else EM_EXECUCAO,
+            data_inicio=None if origem == FILA else datetime.now(pytz.utc),
+            forcar=forcar,
+            origem=origem,
+            chave_entrada=chave,
+            chave_ativa=chave,
+        )
+        db.add(tarefa)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+        else:
+            await db.refresh(tarefa)
+            return tarefa, True
+
+        # Já há uma geração em curso com estes dados: partilhá-la, salvo se foi abandonada
+        result = await db.execute(
+            select(TarefaRelatorio)
+            .where(TarefaRelatorio.consulta_id == consulta_id, TarefaRelatorio.chave_ativa == chave)
+        )
+        ativa = result.scalars().first()
+        if ativa is None:
+            continue  # Terminou entretanto
+        libertada = await db.execute(
+            update(TarefaRelatorio)
+            .where(
+                TarefaRelatorio.id == ativa.id,
+                TarefaRelatorio.estado == EM_EXECUCAO,
+                TarefaRelatorio.data_inicio < _limite_abandono(),
+            )
+            .values(estado=FALHADA, chave_ativa=None, erro="Interrompida", data_conclusao=datetime.now(pytz.utc))
+        )
+        await db.commit()
+        if libertada.rowcount != 1:
+            return ativa, False
+    raise RuntimeError(f"Não foi possível reservar a geração da consulta {consulta_id}")
+
+
+async def concluir_tarefa(db: AsyncSession, tarefa_id: str, relatorio_id: str) -> bool:
+    """
+    Sem commit: vai na transação que grava o relatório. Devolve False se a tarefa já não
+    está em execução (cancelada entretanto); o chamador desfaz então a transação.
+    """
+    result = await db.execute(
+        update(TarefaRelatorio)
+        .where(TarefaRelatorio.id == tarefa_id, TarefaRelatorio.estado == EM_EXECUCAO)
+        .values(
+            estado=CONCLUIDA,
+            relatorio_id=relatorio_id,
+            chave_ativa=None,
+            erro=None,
+            data_conclusao=datetime.now(pytz.utc),
+        )
+    )
+    return result.rowcount == 1
+
+
+async def falhar_tarefa(db: AsyncSession, tarefa_id: str, erro: str) -> None:
+    await db.execute(
+        update(TarefaRelatorio)
+        .where(TarefaRelatorio.id == tarefa_id, TarefaRelatorio.estado.in_([PENDENTE, EM_EXECUCAO]))
+        .values(estado=FALHADA, chave_ativa=None, erro=erro[:500], data_conclusao=datetime.now(pytz.utc))
+    )
+    await db.commit()
+
+
+async def cancelar_tarefa(db: AsyncSession, tarefa_id: str, motivo: str) -> bool:
+    """Marca a tarefa como cancelada se ainda não terminou. Devolve False se já tinha terminado."""
+    result = await db.execute(
+        update(TarefaRelatorio)
+        .where(TarefaRelatorio.id == tarefa_id, TarefaRelatorio.estado.in_([PENDENTE, EM_EXECUCAO]))
+        .values(estado=CANCELADA, chave_ativa=None, erro=motivo, data_conclusao=datetime.now(pytz.utc))
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+class FilaRelatorios:
+    """
+    Pool de workers asyncio que geram os relatórios pedidos em segundo plano.
+
+    A tabela tarefas_relatorio é a fonte de verdade; a asyncio.Queue só transporta os
+    ids. No arranque, as tarefas pendentes e as que ficaram em execução quando o
+    processo parou voltam para a fila.
+
+    :param gerar: Gerador do relatório (os backends configurados ou um LLM falso).
+    :param session_factory: Fábrica de sessões da base de dados.
+    :param workers: Número de gerações em paralelo.
+    :param max_tentativas: Tentativas por tarefa antes de a marcar como falhada.
+    :param admissao: Controlo de admissão das chamadas ao modelo (o do processo por omissão).
+    """
+
+    def __init__(
+        self,
+        gerar: GeradorRelatorio = gerar_relatorio_ia,
+        session_factory=async_session,
+        workers: int = settings.RELATORIO_WORKERS,
+        max_tentativas: int = settings.RELATORIO_MAX_TENTATIVAS,
+        admissao: ControladorAdmissao = admissao,
+    ):
+        self.gerar = gerar
+        self.admissao = admissao
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_tentativas = max_tentativas
+        self._fila: asyncio.Queue = asyncio.Queue()
+        self._tarefas_worker: List[asyncio.Task] = []
+        self._em_curso: Dict[str, asyncio.Task] = {}  # Chamada ao modelo de cada tarefa em execução
+        self._canceladas: Set[str] = set()
+
+    async def iniciar(self) -> None:
+        async with self.session_factory() as db:
+            await self._retomar_abandonadas(db)
+            result = await db.execute(
+                select(TarefaRelatorio.id)
+                .where(TarefaRelatorio.estado == PENDENTE)
+                .order_by(TarefaRelatorio.data_criacao)
+            )
+            for tarefa_id in result.scalars().all():
+                self._fila.put_nowait(tarefa_id)
+        self._tarefas_worker = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tarefas_worker.append(asyncio.create_task(self._vigiar_abandonadas()))
+
+    async def _retomar_abandonadas(self, db: AsyncSession) -> List[str]:
+        """
+        Volta a pôr pendentes as tarefas da fila em execução há mais do que o limite de
+        abandono: o processo que as gerava terminou a meio. As mais recentes podem estar a
+        ser geradas por outro processo e ficam como estão. As de streaming são geradas no
+        pedido e libertadas por reservar_tarefa.
+        """
+        limite = _limite_abandono()
+        abandonada = (
+            TarefaRelatorio.estado == EM_EXECUCAO,
+            TarefaRelatorio.origem == FILA,
+            TarefaRelatorio.data_inicio < limite,
+        )
+        result = await db.execute(select(TarefaRelatorio.id).where(*abandonada))
+        retomadas = []
+        for tarefa_id in result.scalars().all():
+            # Condicional: com vários processos, só um retoma cada tarefa
+            atualizada = await db.execute(
+                update(TarefaRelatorio).where(TarefaRelatorio.id == tarefa_id, *abandonada).values(estado=PENDENTE)
+            )
+            if atualizada.rowcount == 1:
+                retomadas.append(tarefa_id)
+        await db.commit()
+        return retomadas
+
+    async def _vigiar_abandonadas(self) -> None:
+        # As tarefas interrompidas por um reinício recente só passam o limite de abandono depois do arranque
+        while True:
+            await asyncio.sleep(INTERVALO_ABANDONO_S)
+            try:
+                async with self.session_factory() as db:
+                    for tarefa_id in await self._retomar_abandonadas(db):
+                        self._fila.put_nowait(tarefa_id)
+            except Exception:
+                logger.exception("Erro ao retomar tarefas de geração abandonadas")
+
+    async def parar(self) -> None:
+        # As tarefas a meio ficam em execução na tabela e são retomadas quando passarem o limite de abandono
+        for tarefa in self._tarefas_worker:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas_worker, return_exceptions=True)
+        self._tarefas_worker = []
+
+    async def enfileirar(
+        self, db: AsyncSession, consulta_id: str, usuario_id: str, forcar: bool = False, chave: Optional[str] = None
+    ) -> TarefaRelatorio:
+        """
+        Pede a geração. Com a chave da cache dos dados da consulta, pedidos repetidos
+        enquanto a geração decorre recebem a mesma tarefa (e o mesmo relatório).
+
+        Um pedido que não seria servido dentro da espera alvo é recusado (Sobrecarga)
+        antes de reservar a tarefa: nada fica gravado.
+        """
+        self.admissao.verificar(usuario_id, a_frente=self.pendentes())
+        tarefa, nova = await reservar_tarefa(db, consulta_id, usuario_id, chave, forcar)
+        if nova:
+            self._fila.put_nowait(tarefa.id)
+        return tarefa
+
+    def cancelar(self, tarefa_id: str) -> None:
+        """Interrompe a chamada ao modelo da tarefa, se estiver a correr neste processo."""
+        geracao = self._em_curso.get(tarefa_id)
+        if geracao and not geracao.done():
+            self._canceladas.add(tarefa_id)
+            geracao.cancel()
+
+    def pendentes(self) -> int:
+        """Tarefas à espera de um worker neste processo."""
+        return self._fila.qsize()
+
+    async def aguardar(self) -> None:
+        """Espera que a fila esvazie (scripts e testes)."""
+        await self._fila.join()
+
+    async def _worker(self) -> None:
+        while True:
+            tarefa_id = await self._fila.get()
+            try:
+                await self._executar(tarefa_id)
+            except Exception:
+                logger.exception("Erro inesperado na tarefa de geração %s", tarefa_id)
+            finally:
+                self._fila.task_done()
+
+    async def _executar(self, tarefa_id: str) -> None:
+        async with self.session_factory() as db:
+            # Reclamar a tarefa: só um worker passa de pendente para em execução
+            result = await db.execute(
+                update(TarefaRelatorio)
+                .where(TarefaRelatorio.id == tarefa_id, TarefaRelatorio.estado == PENDENTE)
+                .values(
+                    estado=EM_EXECUCAO,
+                    tentativas=TarefaRelatorio.tentativas + 1,
+                    data_inicio=datetime.now(pytz.utc),
+                )
+            )
+            await db.commit()
+            if result.rowcount != 1:
+                return
+
+            tarefa = await db.get(TarefaRelatorio, tarefa_id)
+            try:
+                consulta = await get_consulta(db, tarefa.consulta_id)
+                if not consulta or not consulta.paciente or not consulta.usuario:
+                    raise DadosIncompletos("Consulta, paciente ou médico não encontrado")
+                dados = dados_prompt(consulta)
+            except Exception as exc:
+                await self._falhar(db, tarefa, exc)
+                return
+
+        # A sessão já foi fechada: a ligação volta ao pool enquanto o modelo gera
+        consulta_id, usuario_id, forcar = tarefa.consulta_id, tarefa.usuario_id, tarefa.forcar
+
+        async def gerar_admitido(**dados_geracao):
+            # Aceite à entrada: aqui só espera pela vez (as respostas da cache não a ocupam)
+            async with self.admissao.admitir(usuario_id, verificar=False):
+                return await self.gerar(**dados_geracao)
+
+        geracao = asyncio.create_task(
+            gerar_com_cache(dados, gerar_admitido, forcar=forcar, session_factory=self.session_factory)
+        )
+        self._em_curso[tarefa_id] = geracao
+        try:
+            resultado = await asyncio.wait_for(geracao, settings.RELATORIO_PRAZO_S)
+        except asyncio.CancelledError:
+            if tarefa_id not in self._canceladas:
+                raise  # Paragem do worker: a tarefa é retomada no próximo arranque
+            return  # Cancelada pelo usuário: o estado já foi gravado por cancelar_relatorio
+        except Exception as exc:
+            if geracao.cancelled():
+                exc = PrazoExcedido()  # wait_for cancelou a chamada ao fim do prazo
+            async with self.session_factory() as db:
+                await self._falhar(db, await db.get(TarefaRelatorio, tarefa_id), exc)
+            return
+        finally:
+            self._em_curso.pop(tarefa_id, None)
+            self._canceladas.discard(tarefa_id)
+
+        # Transação curta: relatório, uso, auditoria e estado da tarefa juntos
+        async with self.session_factory() as db:
+            relatorio = await guardar_relatorio(
+                db, consulta_id, resultado, usuario_id, dados["especialidade"], commit=False,
+                chave_entrada=chave_cache(dados),
+            )
+            if not await concluir_tarefa(db, tarefa_id, relatorio.id):
+                # Cancelada noutro processo durante a geração: nada fica gravado
+                await db.rollback()
+                return
+            await db.commit()
+
+    async def _falhar(self, db: AsyncSession, tarefa: TarefaRelatorio, exc: Exception) -> None:
+        if tarefa.estado != EM_EXECUCAO:
+            return  # Cancelada entretanto
+        if isinstance(exc, CircuitoAberto):
+            # O serviço está em baixo: a tarefa não chegou a ser tentada, não gasta tentativa
+            tarefa.tentativas -= 1
+            tarefa.estado = PENDENTE
+            tarefa.erro = str(exc)
+            await db.commit()
+            asyncio.get_running_loop().call_later(exc.espera, self._fila.put_nowait, tarefa.id)
+            return
+        tarefa.erro = f"{type(exc).__name__}: {exc}"[:500]
+        if isinstance(exc, (DadosIncompletos, PrazoExcedido)) or tarefa.tentativas >= self.max_tentativas:
+            tarefa.estado = FALHADA
+            tarefa.chave_ativa = None
+            tarefa.data_conclusao = datetime.now(pytz.utc)
+            await db.commit()
+            return
+        tarefa.estado = PENDENTE
+        await db.commit()
+        # Nova tentativa com espera crescente (2 s, 4 s, ...)
+        espera = 2 ** tarefa.tentativas
+        asyncio.get_running_loop().call_later(espera, self._fila.put_nowait, tarefa.id)
+
+
+fila_relatorios = FilaRelatorios()
+
+
+async def enfileirar_relatorio(
+    db: AsyncSession, consulta_id: str, usuario_id: str, forcar: bool = False, chave: Optional[str] = None
+) -> TarefaRelatorio:
+    return await fila_relatorios.enfileirar(db, consulta_id, usuario_id, forcar=forcar, chave=chave)
+
+
+async def cancelar_relatorio(db: AsyncSession, tarefa_id: str, motivo: str = "Cancelada pelo usuário") -> bool:
+    """
+    Cancela um pedido de geração: grava o estado (vale para todos os processos) e
+    interrompe a chamada ao modelo se corre neste processo, na fila ou em streaming.
+    """
+    cancelada = await cancelar_tarefa(db, tarefa_id, motivo)
+    if cancelada:
+        fila_relatorios.cancelar(tarefa_id)
+        if tarefa_id in voos:
+            voos[tarefa_id].cancelar()
+    return cancelada
+
+
+async def get_tarefa(db: AsyncSession, tarefa_id: str) -> Optional[TarefaRelatorio]:
+    result = await db.execute(select(TarefaRelatorio).where(TarefaRelatorio.id == tarefa_id))
+    return result.scalars().first()
+
+
+async def posicao_na_fila(db: AsyncSession, tarefa: TarefaRelatorio) -> int:
+    """Número de tarefas pendentes pedidas antes desta (0 = é a próxima)."""
+    result = await db.execute(
+        select(func.count(TarefaRelatorio.id))
+        .where(TarefaRelatorio.estado == PENDENTE, TarefaRelatorio.data_criacao < tarefa.data_criacao)
+    )
+    return result.scalar_one()
@@ -0,0 +1,86 @@
+import re
+from functools import lru_cache
+from typing import Dict, Optional
+from app.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # Opcional: sem ele usa-se a estimativa por caracteres
+    tiktoken = None
+
+# Estimativa quando não há tokenizador (texto em português ≈ 4 caracteres por token)
+CARACTERES_POR_TOKEN = 4
+MARCA_CORTE = " […]"
+
+_FRASES = re.compile(r"(?<=[.!?;])\s+")
+_ESPACOS = re.compile(r"[ \t]+")
+
+
+@lru_cache(maxsize=1)
+def _codificador():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(settings.TOKENIZADOR)
+    except Exception:
+        # Codificação desconhecida ou ficheiro BPE inacessível (sem rede): usa a estimativa
+        return None
+
+
+def contar_tokens(texto: Optional[str]) -> int:
+    if not texto:
+        return 0
+    codificador = _codificador()
+    if codificador is None:
+        return -(-len(texto) // CARACTERES_POR_TOKEN)
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+def compactar(texto: str) -> str:
+    """Remove espaços repetidos, linhas vazias e frases repetidas (texto colado várias vezes)."""
+    vistas = set()
+    linhas = []
+    for linha in texto.splitlines():
+        frases = []
+        for frase in _FRASES.split(_ESPACOS.sub(" ", linha).strip()):
+            if frase and frase.lower() not in vistas:
+                vistas.add(frase.lower())
+                frases.append(frase)
+        if frases:
+            linhas.append(" ".join(frases))
+    return "\n".join(linhas)
+
+
+def truncar(texto: str, max_tokens: int) -> str:
+    codificador = _codificador()
+    if codificador is None:
+        return texto[:max_tokens * CARACTERES_POR_TOKEN].rsplit(" ", 1)[0] + MARCA_CORTE
+    return codificador.decode(codificador.encode(texto, disallowed_special=())[:max_tokens]) + MARCA_CORTE
+
+
+def ajustar(texto: Optional[str], max_tokens: int) -> Optional[str]:
+    """Devolve o texto intacto se couber; senão compactado e, se ainda não couber, cortado."""
+    if not texto or contar_tokens(texto) <= max_tokens:
+        return texto
+    texto = compactar(texto)
+    if contar_tokens(texto) <= max_tokens:
+        return texto
+    return truncar(texto, max_tokens)
+
+
+def repartir_orcamento(campos: Dict[str, Optional[str]], orcamento: int) -> Dict[str, Optional[str]]:
+    """
+    Ajusta vários campos de texto livre a um orçamento comum de tokens: os campos curtos
+    ficam inteiros e o que sobra é dividido pelos longos.
+    """
+    tamanhos = {nome: contar_tokens(texto) for nome, texto in campos.items()}
+    if sum(tamanhos.values()) <= orcamento:
+        return dict(campos)
+    ajustados = {}
+    disponivel = orcamento
+    por_tamanho = sorted(campos, key=tamanhos.get)
+    for i, nome in enumerate(por_tamanho):
+        quota = disponivel // (len(por_tamanho) - i)
+        ajustados[nome] = ajustar(campos[nome], quota)
+        disponivel = max(0, disponivel - contar_tokens(ajustados[nome]))
+    return ajustados
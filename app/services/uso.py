@@ -0,0 +1,164 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+import pytz
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.core.blind_index import indice_tipo_consulta
+from app.core.config import settings
+from app.models.relatorio import Usuario
+from app.models.uso import UsoDiario
+from app.services.backends_llm import ResultadoGeracao
+
+MENSAGEM_QUOTA = "Atingiu a quota diária de geração de relatórios. Tente novamente amanhã."
+
+# Usuários mostrados no gráfico de uso por usuário
+TOP_USUARIOS = 10
+
+
+def _hoje():
+    return datetime.now(pytz.utc).date()
+
+
+async def acumular_uso(
+    db: AsyncSession, usuario_id: Optional[str], especialidade: Optional[str], resultados: Iterable[ResultadoGeracao]
+) -> None:
+    """
+    Soma as gerações ao resumo do dia, na transação do chamador (a mesma que grava os
+    relatórios). UPDATE primeiro; a linha só é criada na primeira geração do dia.
+
+    Um texto pré-gerado entregue pela primeira vez traz o custo da pré-geração: os
+    tokens passam do uso sem usuário (do dia da pré-geração) para quem o recebeu.
+    """
+    totais = {"geracoes": 0, "geracoes_cache": 0, "tokens_prompt": 0, "tokens_resposta": 0, "latencia_ms": 0}
+    transferidos: Dict[date, Dict[str, int]] = {}
+    for resultado in resultados:
+        if resultado.backend == "cache":
+            totais["geracoes_cache"] += 1
+            if resultado.pre_gerado_em is not None:
+                a_tirar = transferidos.setdefault(resultado.pre_gerado_em, {"tokens_prompt": 0, "tokens_resposta": 0})
+                for nome, valor in (("tokens_prompt", resultado.tokens_prompt), ("tokens_resposta", resultado.tokens_resposta)):
+                    totais[nome] += valor or 0
+                    a_tirar[nome] -= valor or 0
+            continue
+        totais["geracoes"] += 1
+        totais["tokens_prompt"] += resultado.tokens_prompt or 0
+        totais["tokens_resposta"] += resultado.tokens_resposta or 0
+        totais["latencia_ms"] += resultado.latencia_ms or 0
+    if not totais["geracoes"] and not totais["geracoes_cache"]:
+        return
+
+    await _somar(db, _hoje(), usuario_id, especialidade, totais)
+    for dia, tokens in transferidos.items():
+        await _somar(db, dia, None, especialidade, tokens)
+
+
+async def _somar(
+    db: AsyncSession, dia: date, usuario_id: Optional[str], especialidade: Optional[str], totais: Dict[str, int]
+) -> None:
+    bidx = indice_tipo_consulta(especialidade) or ""
+    somar = (
+        update(UsoDiario)
+        .where(UsoDiario.dia == dia, UsoDiario.usuario_id == usuario_id, UsoDiario.especialidade_bidx == bidx)
+        .values(**{nome: getattr(UsoDiario, nome) + valor for nome, valor in totais.items()})
+    )
+    result = await db.execute(somar)
+    if result.rowcount:
+        return
+    try:
+        async with db.begin_nested():
+            db.add(UsoDiario(
+                dia=dia, usuario_id=usuario_id, especialidade=especialidade, especialidade_bidx=bidx, **totais
+            ))
+    except IntegrityError:
+        # Outro processo criou a linha do dia entretanto
+        await db.execute(somar)
+
+
+async def tokens_hoje(db: AsyncSession, usuario_id: str) -> int:
+    result = await db.execute(
+        select(func.coalesce(func.sum(UsoDiario.tokens_prompt + UsoDiario.tokens_resposta), 0))
+        .where(UsoDiario.dia == _hoje(), UsoDiario.usuario_id == usuario_id)
+    )
+    return int(result.scalar_one())
+
+
+def quota_de(usuario: Usuario) -> Optional[int]:
+    """Quota diária de tokens do usuário, ou None se não tem limite."""
+    quota = usuario.quota_tokens_diaria
+    if quota is None:
+        quota = settings.QUOTA_TOKENS_DIARIA
+    return quota or None
+
+
+async def dentro_da_quota(db: AsyncSession, usuario: Usuario) -> bool:
+    quota = quota_de(usuario)
+    return quota is None or await tokens_hoje(db, usuario.id) < quota
+
+
+async def resumo_uso(db: AsyncSession, dias: int = 30) -> dict:
+    """Séries para o painel: por dia, pelos usuários que mais gastam e por especialidade."""
+    desde = _hoje() - timedelta(days=dias - 1)
+    tokens = UsoDiario.tokens_prompt + UsoDiario.tokens_resposta
+
+    por_dia = await db.execute(
+        select(
+            UsoDiario.dia,
+            func.sum(UsoDiario.tokens_prompt),
+            func.sum(UsoDiario.tokens_resposta),
+            func.sum(UsoDiario.geracoes),
+            func.sum(UsoDiario.geracoes_cache),
+            func.sum(UsoDiario.latencia_ms),
+        )
+        .where(UsoDiario.dia >= desde)
+        .group_by(UsoDiario.dia)
+        .order_by(UsoDiario.dia)
+    )
+    linhas_dia = {linha[0]: linha[1:] for linha in por_dia.all()}
+    dias_serie = [desde + timedelta(days=i) for i in range(dias)]
+
+    def serie(indice):
+        return [int(linhas_dia[dia][indice] or 0) if dia in linhas_dia else 0 for dia in dias_serie]
+
+    geracoes = serie(2)
+    latencia = serie(4)
+
+    por_usuario = await db.execute(
+        select(UsoDiario.usuario_id, func.sum(tokens), func.sum(UsoDiario.geracoes))
+        .where(UsoDiario.dia >= desde)
+        .group_by(UsoDiario.usuario_id)
+        .order_by(func.sum(tokens).desc())
+        .limit(TOP_USUARIOS)
+    )
+    linhas_usuario = por_usuario.all()
+    ids = [linha[0] for linha in linhas_usuario if linha[0]]
+    nomes = {}
+    if ids:
+        result = await db.execute(select(Usuario.id, Usuario.nome_completo).where(Usuario.id.in_(ids)))
+        nomes = dict(result.all())
+
+    # A especialidade está cifrada: agrupa-se pelo índice cego e mostra-se um dos valores
+    por_especialidade = await db.execute(
+        select(func.max(UsoDiario.especialidade), func.sum(tokens), func.sum(UsoDiario.geracoes))
+        .where(UsoDiario.dia >= desde)
+        .group_by(UsoDiario.especialidade_bidx)
+        .order_by(func.sum(tokens).desc())
+    )
+
+    return {
+        "dias": [dia.isoformat() for dia in dias_serie],
+        "tokens_prompt": serie(0),
+        "tokens_resposta": serie(1),
+        "geracoes": geracoes,
+        "geracoes_cache": serie(3),
+        "latencia_media_ms": [l // g if g else None for l, g in zip(latencia, geracoes)],
+        "usuarios": [
+            {"nome": nomes.get(usuario_id, "(sem usuário)"), "tokens": int(total or 0), "geracoes": int(n or 0)}
+            for usuario_id, total, n in linhas_usuario
+        ],
+        "especialidades": [
+            {"nome": nome or "(sem especialidade)", "tokens": int(total or 0), "geracoes": int(n or 0)}
+            for nome, total, n in por_especialidade.all()
+        ],
+    }
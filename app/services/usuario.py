@@ -6,7 +6,24 @@ from sqlalchemy.future import select
 from app.models.auditoria import Auditoria
 from app.models.relatorio import Usuario
 from app.schemas.usuario import UsuarioCreate, UsuarioUpdate
-from typing import List
+from app.services.CRUDBase import CRUDBase, Page, Projection
+from app.schemas.listagens import UsuarioLinha
+from app.core.config import settings
+from app.core.blind_index import indice_correio_usuario
+from app.services.pesquisa import ENTIDADE_USUARIO, indexar_nome, pesquisar, remover_indice
+from typing import List, Optional
+
+crud_usuario = CRUDBase(Usuario)
+
+# Projeção da lista: sem senha nem auditorias
+LINHA_USUARIO = Projection(UsuarioLinha, {
+    "id": Usuario.id,
+    "nome_completo": Usuario.nome_completo,
+    "correio": Usuario.correio,
+    "telefone": Usuario.telefone,
+    "especialidade": Usuario.especialidade,
+    "data_criacao": Usuario.data_criacao,
+})
 
 
 async def get_user(db: AsyncSession, usuario_id: str) -> Usuario:    
@@ -15,7 +32,10 @@ async def get_user(db: AsyncSession, usuario_id: str) -> Usuario:
     return usuario
 
 async def get_user_by_email(db: AsyncSession, correio: str) -> Usuario:
-    result = await db.execute(select(Usuario).where(Usuario.correio == correio, Usuario.deleted == False))
+    # Pesquisa pelo índice cego: uma leitura indexada, sem decifrar e sem distinguir maiúsculas
+    result = await db.execute(
+        select(Usuario).where(Usuario.correio_bidx == indice_correio_usuario(correio), Usuario.deleted == False)
+    )
     usuario = result.scalars().first()        
     return usuario
 
@@ -31,6 +51,11 @@ async def get_users(db: AsyncSession) -> List[Usuario]:
     usuarios = result.unique().scalars().all()    
     return usuarios 
 
+async def get_users_page(
+    db: AsyncSession, cursor: Optional[str] = None, direction: str = "next", limit: int = settings.PAGE_SIZE
+) -> Page:
+    return await crud_usuario.get_page(db, cursor=cursor, direction=direction, limit=limit, projection=LINHA_USUARIO)
+
 async def get_users_by_role(db: AsyncSession) -> List[Usuario]:
     query = (
     select(Usuario)
@@ -47,6 +72,8 @@ async def create_user(db: AsyncSession, usuario: UsuarioCreate) -> Usuario:
     user_data = usuario.dict(exclude_unset=True)
     db_usuario = Usuario(**user_data)      
     db.add(db_usuario)
+    await db.flush()
+    await indexar_nome(db, ENTIDADE_USUARIO, db_usuario.id, db_usuario.nome_completo)
     await db.commit()
     await db.refresh(db_usuario)
     
@@ -61,12 +88,20 @@ async def create_user(db: AsyncSession, usuario: UsuarioCreate) -> Usuario:
     
     return db_usuario
 
+# Campos que o formulário de edição pode deixar em branco para voltar ao valor geral
+CAMPOS_ANULAVEIS = {"quota_tokens_diaria"}
+
+
 async def update_user(db: AsyncSession, usuario_id: str, usuario_data: UsuarioUpdate):
     usuario = await get_user(db, usuario_id)
     if usuario:
-        for field, value in usuario_data.dict(exclude_unset=True).items():
-            if value is not None:  # Atualiza apenas campos com valores não nulos
+        dados = usuario_data.dict(exclude_unset=True)
+        for field, value in dados.items():
+            # Atualiza apenas campos com valores não nulos; nos anuláveis, None enviado limpa o valor
+            if value is not None or field in CAMPOS_ANULAVEIS:
                 setattr(usuario, field, value)       
+        if dados.get("nome_completo") is not None:
+            await indexar_nome(db, ENTIDADE_USUARIO, usuario.id, usuario.nome_completo)
         await db.commit() 
         await db.refresh(usuario) 
         
@@ -86,6 +121,7 @@ async def delete_user(db: AsyncSession, usuario_id: str) -> bool:
     if not db_usuario:
         return False  
     db_usuario.deleted = True  
+    await remover_indice(db, ENTIDADE_USUARIO, db_usuario.id)
     await db.commit()
     
     db_log = Auditoria(
@@ -100,11 +136,6 @@ async def delete_user(db: AsyncSession, usuario_id: str) -> bool:
     return True 
 
 
-async def search_users(db: AsyncSession, query: str) -> List[Usuario]:
-    result = await db.execute(select(Usuario).where(Usuario.deleted == True))
-    all_usuarios = result.scalars().all()    
-    filtered_usuarios = [
-        usuario for usuario in all_usuarios 
-        if query.lower() in Usuario.nome.lower()        
-    ]
-    return filtered_usuarios
\ No newline at end of file
+async def search_users(db: AsyncSession, query: str, limit: Optional[int] = 20) -> List[Usuario]:
+    # Candidatos pelo índice de trigramas; só estes são decifrados e confirmados
+    return await pesquisar(db, Usuario, ENTIDADE_USUARIO, query, limite=limit)
\ No newline at end of file
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+from app.core import metricas
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+estatisticas = {"lancadas": 0, "abandonadas": 0, "canceladas": 0}
+
+
+class Voo:
+    """
+    Uma geração em streaming partilhada por todos os pedidos iguais deste processo
+    (single-flight): guarda os eventos já emitidos, para quem chega a meio, e acorda
+    quem está à espera de novos.
+
+    Conta quem a está a seguir: se todos desligarem e ninguém voltar dentro de `graca`
+    segundos, a geração é cancelada (o modelo deixa de gerar tokens que ninguém lê).
+    """
+
+    def __init__(self, graca: float = settings.STREAM_GRACA_S):
+        self.eventos: List[str] = []
+        self.terminado = False
+        self.seguidores = 0
+        self.graca = graca
+        self._mudou = asyncio.Condition()
+        self.tarefa: Optional[asyncio.Task] = None
+
+    async def publicar(self, evento: str) -> None:
+        async with self._mudou:
+            self.eventos.append(evento)
+            self._mudou.notify_all()
+
+    async def terminar(self) -> None:
+        async with self._mudou:
+            self.terminado = True
+            self._mudou.notify_all()
+
+    def cancelar(self) -> None:
+        if self.tarefa and not self.tarefa.done():
+            self.tarefa.cancel()
+
+    def vigiar_abandono(self) -> None:
+        asyncio.get_running_loop().call_later(self.graca, self._cancelar_se_abandonado)
+
+    def _cancelar_se_abandonado(self) -> None:
+        if self.seguidores == 0 and not self.terminado:
+            estatisticas["abandonadas"] += 1
+            self.cancelar()
+
+    async def seguir(self) -> AsyncIterator[str]:
+        """Todos os eventos desde o início e depois os novos, até a geração terminar."""
+        self.seguidores += 1
+        visto = 0
+        try:
+            while True:
+                async with self._mudou:
+                    await self._mudou.wait_for(lambda: visto < len(self.eventos) or self.terminado)
+                    novos = self.eventos[visto:]
+                    terminado = self.terminado
+                visto += len(novos)
+                for evento in novos:
+                    yield evento
+                if terminado:
+                    return
+        finally:
+            # Cliente desligado (separador fechado): o servidor cancela esta iteração
+            self.seguidores -= 1
+            if self.seguidores == 0 and not self.terminado:
+                self.vigiar_abandono()
+
+
+# Gerações em curso neste processo, por id da tarefa
+voos: Dict[str, Voo] = {}
+
+
+def lancar(chave: str, produtor: AsyncIterator[str], ao_cancelar: Optional[str] = None) -> Voo:
+    """
+    Corre o produtor numa tarefa própria: a geração continua se o pedido que a iniciou
+    desligar mas outros a seguem. Se for cancelada, quem ainda a segue recebe o evento
+    `ao_cancelar`.
+    """
+    voo = Voo()
+    voos[chave] = voo
+    estatisticas["lancadas"] += 1
+
+    async def correr() -> None:
+        try:
+            async for evento in produtor:
+                await voo.publicar(evento)
+        except asyncio.CancelledError:
+            estatisticas["canceladas"] += 1
+            if ao_cancelar:
+                await voo.publicar(ao_cancelar)
+            raise
+        except Exception:
+            logger.exception("Geração partilhada %s interrompida", chave)
+        finally:
+            voos.pop(chave, None)
+            await voo.terminar()
+
+    voo.tarefa = asyncio.create_task(correr())
+    voo.vigiar_abandono()  # Cobre o cliente que desliga antes de a resposta começar
+    return voo
+
+
+metricas.registar("streams", lambda: {**estatisticas, "em_curso": len(voos)})
@@ -9,4 +9,61 @@
         searching: true,
         ordering: true
     });
-})();
\ No newline at end of file
+})();
+
+// Inicia um DataTable com processamento no servidor (paginação, ordenação e pesquisa em SQL).
+// O servidor devolve cursores para a página seguinte/anterior; quando o utilizador
+// navega para a página vizinha, o cursor é reenviado e a consulta dispensa o OFFSET.
+function iniciarTabelaServidor(seletor, url, opcoes) {
+    'use strict';
+
+    let cursores = {};
+    let ultimoPedido = null;
+
+    function chave(d, start) {
+        return [start, d.length, d.search.value, JSON.stringify(d.order)].join('|');
+    }
+
+    return $(seletor).DataTable(Object.assign({
+        serverSide: true,
+        processing: true,
+        searchDelay: 400,
+        order: [],
+        ajax: {
+            url: url,
+            data: function(d) {
+                ultimoPedido = d;
+                const cursor = cursores[chave(d, d.start)];
+                if (cursor) {
+                    d.cursor = cursor.cursor;
+                    d.direction = cursor.direction;
+                }
+            },
+            dataSrc: function(json) {
+                const d = ultimoPedido;
+                cursores = {};
+                if (json.next_cursor) {
+                    cursores[chave(d, d.start + d.length)] = {cursor: json.next_cursor, direction: 'next'};
+                }
+                if (json.prev_cursor) {
+                    cursores[chave(d, d.start - d.length)] = {cursor: json.prev_cursor, direction: 'prev'};
+                }
+                return json.data;
+            }
+        }
+    }, opcoes));
+}
+
+// Etiqueta do estado de um relatório face aos dados atuais da consulta
+function etiquetaEstadoRelatorio(estado) {
+    'use strict';
+
+    const etiquetas = {
+        atual: ['bg-success', 'Atual'],
+        desatualizado: ['bg-warning text-dark', 'Desatualizado'],
+        desconhecido: ['bg-secondary', 'Desconhecido'],
+        sem_relatorio: ['bg-light text-dark', 'Sem relatório'],
+    };
+    const [classe, texto] = etiquetas[estado] || etiquetas.desconhecido;
+    return `<span class="badge ${classe}">${texto}</span>`;
+}
@@ -0,0 +1,71 @@
+"""
+Controlo de admissão com um LLM falso, sem base de dados:
+
+- Justiça: um usuário pede muitos relatórios de uma vez e outros pedem um cada; mede a
+  espera dos pedidos isolados (a rotação entre usuários não os põe atrás da rajada).
+- Sobrecarga: chegam mais pedidos do que o serviço aguenta; mede quantos são recusados
+  à entrada e confirma que a espera dos aceites fica perto do alvo.
+
+Uso: python -m benchmarks.bench_admissao [latencia_s]
+"""
+import asyncio
+import sys
+import time
+from app.core.admissao import ControladorAdmissao, Sobrecarga
+
+CONCORRENCIA = 4
+
+
+async def _pedido(controlador: ControladorAdmissao, usuario_id: str, latencia: float, verificar: bool = True):
+    chegada = time.perf_counter()
+    async with controlador.admitir(usuario_id, verificar=verificar):
+        espera = time.perf_counter() - chegada
+        await asyncio.sleep(latencia)
+    return espera
+
+
+async def _justica(latencia: float):
+    controlador = ControladorAdmissao(
+        concorrencia=CONCORRENCIA, max_fila=100, max_por_usuario=100, espera_alvo=3600, servico_inicial=latencia
+    )
+    rajada = [asyncio.create_task(_pedido(controlador, "pesado", latencia)) for _ in range(40)]
+    await asyncio.sleep(0)
+    isolados = [asyncio.create_task(_pedido(controlador, f"u{i}", latencia)) for i in range(4)]
+    esperas = await asyncio.gather(*isolados)
+    await asyncio.gather(*rajada)
+    return max(esperas)
+
+
+async def _sobrecarga(latencia: float, pedidos: int, alvo: float):
+    controlador = ControladorAdmissao(
+        concorrencia=CONCORRENCIA, max_fila=pedidos, max_por_usuario=pedidos, espera_alvo=alvo, servico_inicial=latencia
+    )
+    recusados = 0
+    aceites = []
+    for i in range(pedidos):
+        try:
+            controlador.verificar(f"u{i}")
+            aceites.append(asyncio.create_task(_pedido(controlador, f"u{i}", latencia, verificar=False)))
+        except Sobrecarga:
+            recusados += 1
+        await asyncio.sleep(latencia / 20)  # Chegadas a um ritmo 5x acima da capacidade
+    esperas = sorted(await asyncio.gather(*aceites))
+    return recusados, esperas[int(len(esperas) * 0.95) - 1], controlador.metricas()
+
+
+async def main(latencia: float = 0.2):
+    sem_rotacao = 40 / CONCORRENCIA * latencia
+    espera = await _justica(latencia)
+    print(f"Justiça: espera máxima dos pedidos isolados {espera:.2f} s (atrás da rajada: {sem_rotacao:.2f} s)")
+    assert espera < sem_rotacao / 2
+
+    alvo = latencia * 3
+    recusados, p95, metricas = await _sobrecarga(latencia, 200, alvo)
+    print(f"Sobrecarga: {recusados}/200 recusados à entrada, p95 da espera dos aceites {p95:.2f} s (alvo {alvo:.2f} s)")
+    print(f"  {metricas}")
+    assert recusados > 0 and p95 <= alvo * 1.5
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:2]
+    asyncio.run(main(float(argumentos[0]) if argumentos else 0.2))
@@ -0,0 +1,116 @@
+"""
+Cancelamento de gerações que ninguém vai ler, com um LLM falso:
+
+- Fila: metade das tarefas é cancelada pouco depois de começar; mede o tempo de modelo
+  gasto e confirma que as canceladas não deixam relatório.
+- Streaming: o único cliente desliga a meio; mede quantos fragmentos o modelo ainda
+  produz depois disso (só os do período de graça).
+
+Usa uma base SQLite num ficheiro temporário (aiosqlite) com os modelos da aplicação.
+
+Uso: python -m benchmarks.bench_cancelamento [n_tarefas] [latencia_s]
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base
+from app.models.relatorio import Consulta, Relatorio
+from app.models.tarefa import CANCELADA, CONCLUIDA, TarefaRelatorio
+from app.services.backends_llm import ResultadoGeracao
+from app.services.tarefas import FilaRelatorios, cancelar_tarefa
+from app.services.voos import lancar
+from benchmarks.bench_fila import motor_sqlite
+from tests.conftest import popular, sem_admissao
+
+INTERVALO_FRAGMENTO_S = 0.01
+GRACA_S = 0.2
+
+
+def llm_contado(latencia: float, gasto: list):
+    # Soma ao gasto o tempo de modelo realmente consumido, mesmo quando é cancelado
+    async def gerar(**dados) -> ResultadoGeracao:
+        inicio = time.perf_counter()
+        try:
+            await asyncio.sleep(latencia)
+        finally:
+            gasto.append(time.perf_counter() - inicio)
+        return ResultadoGeracao(texto=f"Relatório de {dados['especialidade']}.", modelo="falso", backend="falso")
+    return gerar
+
+
+async def _fila(n: int, latencia: float):
+    engine = motor_sqlite("bench_cancelamento")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    fabrica = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with fabrica() as sessao:
+        await popular(sessao, n)
+        consultas = (await sessao.execute(select(Consulta.id, Consulta.usuario_id))).all()
+
+    gasto = []
+    fila = FilaRelatorios(
+        gerar=llm_contado(latencia, gasto), session_factory=fabrica, workers=n, admissao=sem_admissao(n)
+    )
+    await fila.iniciar()
+    async with fabrica() as sessao:
+        tarefas = [await fila.enfileirar(sessao, c, u, forcar=True) for c, u in consultas]
+    await asyncio.sleep(latencia / 10)
+    async with fabrica() as sessao:
+        for tarefa in tarefas[::2]:
+            await cancelar_tarefa(sessao, tarefa.id, "Cancelada")
+            fila.cancelar(tarefa.id)
+    await fila.aguardar()
+    await fila.parar()
+
+    async with fabrica() as sessao:
+        estados = dict((await sessao.execute(select(TarefaRelatorio.id, TarefaRelatorio.estado))).all())
+        relatorios = (await sessao.execute(select(Relatorio.id))).all()
+    await engine.dispose()
+    canceladas = sum(1 for e in estados.values() if e == CANCELADA)
+    concluidas = sum(1 for e in estados.values() if e == CONCLUIDA)
+    assert canceladas == len(tarefas[::2]) and len(relatorios) == concluidas
+    return sum(gasto), canceladas, concluidas
+
+
+async def _streaming(fragmentos: int, lidos: int):
+    produzidos = []
+
+    async def produtor():
+        for i in range(fragmentos):
+            await asyncio.sleep(INTERVALO_FRAGMENTO_S)
+            produzidos.append(time.perf_counter())
+            yield f"t{i} "
+
+    voo = lancar("bench", produtor())
+    voo.graca = GRACA_S
+    eventos = voo.seguir()
+    async for _ in eventos:
+        lidos -= 1
+        if lidos == 0:
+            break
+    await eventos.aclose()  # O servidor fecha o gerador quando o cliente desliga
+    desligou = time.perf_counter()
+    await asyncio.gather(voo.tarefa, return_exceptions=True)
+    return len(produzidos), sum(1 for t in produzidos if t > desligou)
+
+
+async def main(n: int = 20, latencia: float = 1.0):
+    gasto, canceladas, concluidas = await _fila(n, latencia)
+    sem_cancelamento = n * latencia
+    print(f"Fila: {n} tarefas de {latencia:.2f} s, {canceladas} canceladas, {concluidas} concluídas")
+    print(f"  tempo de modelo gasto {gasto:.2f} s (sem cancelamento: {sem_cancelamento:.2f} s)")
+    assert gasto < sem_cancelamento * 0.75
+
+    fragmentos = 500
+    produzidos, depois = await _streaming(fragmentos, lidos=50)
+    print(f"Streaming: {produzidos}/{fragmentos} fragmentos produzidos, {depois} depois de o cliente desligar")
+    assert depois <= GRACA_S / INTERVALO_FRAGMENTO_S * 2
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:3]
+    asyncio.run(main(int(argumentos[0]) if argumentos else 20,
+                     float(argumentos[1]) if len(argumentos) > 1 else 1.0))
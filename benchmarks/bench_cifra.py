@@ -0,0 +1,60 @@
+"""
+Benchmark da decifragem: StringEncryptedType (AES-CBC, chave derivada por valor)
+contra AesGcmEncryptedType (AES-GCM, chave em cache), em linhas/segundo.
+
+Uso: python -m benchmarks.bench_cifra [n_valores]
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import String, Text
+from sqlalchemy_utils import StringEncryptedType
+from app.core.cifra import AesGcmEncryptedType
+
+CHAVE = "chave-de-benchmark"
+CAMPOS_POR_LINHA = 6  # Um Paciente tem 6 campos cifrados
+
+
+def _amostra(n):
+    # Mistura de campos curtos (nome, BI, telefone) e longos (endereço, diagnóstico)
+    curtos = [f"Paciente Número {i} da Silva" for i in range(n)]
+    longos = [("Rua das Acácias, bloco %d. " % i) * 20 for i in range(n)]
+    return [v for par in zip(curtos, longos) for v in par]
+
+
+def _medir(funcao, valores):
+    inicio = time.perf_counter()
+    resultado = funcao(valores)
+    duracao = time.perf_counter() - inicio
+    assert len(resultado) == len(valores)
+    return len(valores) / CAMPOS_POR_LINHA / duracao
+
+
+def main(n: int = 50_000):
+    valores = _amostra(n // 2)
+
+    legado = StringEncryptedType(Text, CHAVE)
+    legado_cifrados = [legado.process_bind_param(v, None) for v in valores]
+
+    novo = AesGcmEncryptedType(String(200), CHAVE)
+    novo_cifrados = [novo.process_bind_param(v, None) for v in valores]
+
+    resultados = {
+        "StringEncryptedType (por valor)": _medir(
+            lambda vs: [legado.process_result_value(v, None) for v in vs], legado_cifrados),
+        "AesGcmEncryptedType (por valor)": _medir(
+            lambda vs: [novo.process_result_value(v, None) for v in vs], novo_cifrados),
+        "AesGcmEncryptedType (lote)": _medir(novo.decifrar_lote, novo_cifrados),
+        "AesGcmEncryptedType (lote, fora do event loop)": _medir(
+            lambda vs: asyncio.run(novo.decifrar_lote_async(vs)), novo_cifrados),
+        "Leitura de valores antigos pelo novo tipo": _medir(novo.decifrar_lote, legado_cifrados),
+    }
+
+    print(f"{len(valores)} valores, {CAMPOS_POR_LINHA} campos cifrados por linha")
+    base = resultados["StringEncryptedType (por valor)"]
+    for nome, linhas_por_segundo in resultados.items():
+        print(f"{nome:<50} {linhas_por_segundo:>12,.0f} linhas/s  ({linhas_por_segundo / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,78 @@
+"""
+Fila de geração com um LLM falso (latência fixa): tempo até esvaziar a fila conforme
+o número de workers. Usa uma base SQLite num ficheiro temporário (aiosqlite) com os
+modelos da aplicação.
+
+Uso: python -m benchmarks.bench_fila [n_tarefas] [latencia_s]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base
+from app.models.relatorio import Consulta
+from app.models.tarefa import CONCLUIDA, TarefaRelatorio
+from app.services.backends_llm import ResultadoGeracao
+from app.services.tarefas import FilaRelatorios
+from tests.conftest import popular, sem_admissao
+
+
+def llm_falso(latencia: float):
+    async def gerar(**dados) -> ResultadoGeracao:
+        await asyncio.sleep(latencia)
+        texto = f"Relatório de {dados['especialidade']} para {dados['paciente_nome']}."
+        return ResultadoGeracao(texto=texto, modelo="falso", backend="falso")
+    return gerar
+
+
+def motor_sqlite(nome: str):
+    # Ficheiro temporário com um pool de ligações: em memória (sqlite+aiosqlite://) todas as
+    # sessões partilham uma só ligação e as transações dos workers misturam-se
+    caminho = os.path.join(tempfile.mkdtemp(), f"{nome}.db")
+    return create_async_engine(f"sqlite+aiosqlite:///{caminho}", connect_args={"timeout": 30})
+
+
+async def _cenario(n: int, latencia: float, workers: int) -> float:
+    engine = motor_sqlite("bench_fila")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    fabrica = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with fabrica() as sessao:
+        await popular(sessao, n)
+        consultas = (await sessao.execute(select(Consulta.id, Consulta.usuario_id))).all()
+
+    fila = FilaRelatorios(
+        gerar=llm_falso(latencia), session_factory=fabrica, workers=workers, admissao=sem_admissao(workers)
+    )
+    await fila.iniciar()
+    inicio = time.perf_counter()
+    async with fabrica() as sessao:
+        for consulta_id, usuario_id in consultas:
+            await fila.enfileirar(sessao, consulta_id, usuario_id)
+    await fila.aguardar()
+    duracao = time.perf_counter() - inicio
+    await fila.parar()
+
+    async with fabrica() as sessao:
+        concluidas = (await sessao.execute(
+            select(TarefaRelatorio.id).where(TarefaRelatorio.estado == CONCLUIDA))).all()
+    assert len(concluidas) == n, f"{len(concluidas)}/{n} tarefas concluídas"
+    await engine.dispose()
+    return duracao
+
+
+async def main(n: int = 100, latencia: float = 0.5):
+    print(f"{n} tarefas, LLM falso com {latencia:.2f} s por relatório")
+    for workers in (1, 4, 16):
+        duracao = await _cenario(n, latencia, workers)
+        print(f"{workers:>3} workers  {duracao:>8.2f} s  {n / duracao:>8.1f} relatórios/s")
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:3]
+    asyncio.run(main(int(argumentos[0]) if argumentos else 100,
+                     float(argumentos[1]) if len(argumentos) > 1 else 0.5))
@@ -0,0 +1,69 @@
+"""
+Benchmark das listas: objetos ORM com relações (selectinload) contra a projeção em
+NamedTuple (LINHA_CONSULTA), em tempo por página e memória alocada (tracemalloc).
+
+Usa uma base SQLite em memória (aiosqlite) com os modelos da aplicação.
+
+Uso: python -m benchmarks.bench_listagens [n_consultas] [tamanho_pagina]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base
+from app.services.consulta import LINHA_CONSULTA, crud_consulta
+from tests.conftest import popular
+
+REPETICOES = 20
+
+
+async def _medir(fabrica, carregar):
+    tempos, picos = [], []
+    for _ in range(REPETICOES):
+        async with fabrica() as sessao:
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            linhas = await carregar(sessao)
+            tempos.append(time.perf_counter() - inicio)
+            picos.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            # Leitura dos campos mostrados na lista, como no endpoint /datatable
+            for linha in linhas:
+                _ = (linha.id, linha.tipo, linha.data_criacao)
+    tempos.sort()
+    return tempos[len(tempos) // 2], max(picos)
+
+
+async def main(n: int = 5_000, tamanho: int = 100):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    fabrica = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with fabrica() as sessao:
+        await popular(sessao, n)
+
+    cenarios = {
+        "ORM + selectinload(paciente, usuario)": lambda s: crud_consulta.get_page(
+            s, limit=tamanho, load_relationships=["paciente", "usuario"]),
+        "Projeção ConsultaLinha (junções)": lambda s: crud_consulta.get_page(
+            s, limit=tamanho, projection=LINHA_CONSULTA),
+    }
+
+    print(f"{n} consultas, páginas de {tamanho}, mediana de {REPETICOES} leituras")
+    base = None
+    for nome, carregar in cenarios.items():
+        mediana, pico = await _medir(fabrica, lambda s: _itens(carregar(s)))
+        base = base or mediana
+        print(f"{nome:<40} {mediana * 1000:>8.2f} ms  {pico / 1024:>9.1f} KiB  ({base / mediana:.1f}x)")
+    await engine.dispose()
+
+
+async def _itens(pagina):
+    return (await pagina).items
+
+
+if __name__ == "__main__":
+    argumentos = [int(a) for a in sys.argv[1:3]]
+    asyncio.run(main(*argumentos))
@@ -0,0 +1,94 @@
+"""
+Uso do pool de ligações durante a geração: muitas tarefas em paralelo com um LLM
+falso lento e um pool pequeno. As ligações só são usadas nas transações curtas antes
+e depois da chamada ao modelo, por isso o número de ligações em uso deve manter-se
+baixo e estável, sem chegar à capacidade do pool, seja qual for o número de workers.
+
+Usa uma base SQLite num ficheiro temporário (aiosqlite) com um pool de tamanho fixo.
+
+Uso: python -m benchmarks.bench_pool [n_tarefas] [latencia_s]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.database import Base
+from app.models.relatorio import Consulta
+from app.models.tarefa import CONCLUIDA, TarefaRelatorio
+from app.services.tarefas import FilaRelatorios
+from benchmarks.bench_fila import llm_falso
+from tests.conftest import popular, sem_admissao
+
+TAMANHO_POOL = 4
+INTERVALO_AMOSTRA_S = 0.01
+
+
+async def _amostrar(engine, amostras: list, parar: asyncio.Event) -> None:
+    while not parar.is_set():
+        amostras.append(engine.pool.checkedout())
+        await asyncio.sleep(INTERVALO_AMOSTRA_S)
+
+
+async def _cenario(n: int, latencia: float, workers: int):
+    caminho = os.path.join(tempfile.mkdtemp(), "bench_pool.db")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{caminho}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=TAMANHO_POOL,
+        max_overflow=0,
+        pool_timeout=5,  # Uma ligação presa durante a chamada ao modelo esgotaria o pool
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    fabrica = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with fabrica() as sessao:
+        await popular(sessao, n)
+        consultas = (await sessao.execute(select(Consulta.id, Consulta.usuario_id))).all()
+
+    fila = FilaRelatorios(
+        gerar=llm_falso(latencia), session_factory=fabrica, workers=workers, admissao=sem_admissao(workers)
+    )
+    await fila.iniciar()
+    async with fabrica() as sessao:
+        for consulta_id, usuario_id in consultas:
+            await fila.enfileirar(sessao, consulta_id, usuario_id, forcar=True)
+
+    amostras, parar = [], asyncio.Event()
+    amostrador = asyncio.create_task(_amostrar(engine, amostras, parar))
+    inicio = time.perf_counter()
+    await fila.aguardar()
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    await amostrador
+    await fila.parar()
+
+    async with fabrica() as sessao:
+        concluidas = (await sessao.execute(
+            select(TarefaRelatorio.id).where(TarefaRelatorio.estado == CONCLUIDA))).all()
+    assert len(concluidas) == n, f"{len(concluidas)}/{n} tarefas concluídas"
+    await engine.dispose()
+    return duracao, amostras
+
+
+async def main(n: int = 64, latencia: float = 1.0):
+    print(f"{n} tarefas, LLM falso com {latencia:.2f} s, pool de {TAMANHO_POOL} ligações sem overflow")
+    print("workers   duração   ligações em uso (média / máx.)")
+    for workers in (4, 16, 64):
+        duracao, amostras = await _cenario(n, latencia, workers)
+        media, maximo = statistics.mean(amostras), max(amostras)
+        print(f"{workers:>7}  {duracao:>7.2f} s  {media:>10.2f} / {maximo}")
+        # Com 64 workers e 4 ligações, só um uso curto das ligações permite concluir
+        assert maximo <= TAMANHO_POOL
+        assert duracao < 2 * latencia * n / min(workers, n) + 5, "pool esgotado durante a geração"
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:3]
+    asyncio.run(main(int(argumentos[0]) if argumentos else 64,
+                     float(argumentos[1]) if len(argumentos) > 1 else 1.0))
@@ -0,0 +1,140 @@
+"""
+Carga no caminho de geração de relatórios com concorrência crescente: latência
+p50/p95/p99 (total e até ao primeiro token), débito e saturação do pool da base de dados.
+
+Corre contra a aplicação já em execução, apontada ao servidor LLM falso:
+
+    python -m benchmarks.servidor_llm_falso --porta 8100 &
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=falsa uvicorn app.main:app --port 8000 &
+    python -m benchmarks.bench_relatorio --niveis 1,4,16,64 --pedidos 64
+
+Usa consultas existentes (base de desenvolvimento) e grava os relatórios gerados.
+O pool é amostrado em /core/metricas, cujo pedido também usa uma ligação.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Optional
+import httpx
+
+INTERVALO_AMOSTRA_S = 0.2
+INTERVALO_ESTADO_S = 0.2
+
+
+def _percentis(valores: List[float]) -> str:
+    if len(valores) < 2:
+        return "     -        -        -"
+    q = statistics.quantiles(valores, n=100, method="inclusive")
+    return f"{q[49]:>6.2f}s  {q[94]:>6.2f}s  {q[98]:>6.2f}s"
+
+
+async def _entrar(cliente: httpx.AsyncClient, correio: str, senha: str) -> None:
+    resposta = await cliente.post("/auth/login", data={"correio": correio, "senha": senha})
+    if "access_token" not in resposta.cookies:
+        raise SystemExit("Autenticação falhou")
+    cliente.cookies.set("access_token", resposta.cookies["access_token"])
+
+
+async def _consultas(cliente: httpx.AsyncClient, n: int) -> List[str]:
+    resposta = await cliente.get("/consultas/datatable", params={"draw": 1, "start": 0, "length": min(n, 100)})
+    ids = [linha["id"] for linha in resposta.json()["data"]]
+    if not ids:
+        raise SystemExit("Sem consultas na base de dados")
+    return ids
+
+
+async def _pedido_stream(cliente: httpx.AsyncClient, consulta_id: str):
+    inicio = time.perf_counter()
+    primeiro: Optional[float] = None
+    async with cliente.stream("GET", f"/relatorios/gerar-relatorio/{consulta_id}/stream",
+                              params={"forcar": "true"}) as resposta:
+        async for linha in resposta.aiter_lines():
+            if linha == "event: token" and primeiro is None:
+                primeiro = time.perf_counter() - inicio
+            elif linha == "event: fim":
+                return primeiro, time.perf_counter() - inicio
+            elif linha == "event: erro":
+                break
+    raise RuntimeError("geração falhou")
+
+
+async def _pedido_fila(cliente: httpx.AsyncClient, consulta_id: str):
+    inicio = time.perf_counter()
+    resposta = await cliente.post(f"/relatorios/gerar-relatorio/{consulta_id}", params={"forcar": "true"})
+    if resposta.status_code != 202:
+        raise RuntimeError(f"HTTP {resposta.status_code}")
+    url = resposta.json()["url"]
+    while True:
+        tarefa = (await cliente.get(url)).json()
+        if tarefa["status"] == "concluida":
+            return None, time.perf_counter() - inicio
+        if tarefa["status"] == "falhada":
+            raise RuntimeError(tarefa["erro"])
+        await asyncio.sleep(INTERVALO_ESTADO_S)
+
+
+async def _amostrar_pool(cliente: httpx.AsyncClient, amostras: list, parar: asyncio.Event) -> None:
+    while not parar.is_set():
+        try:
+            amostras.append((await cliente.get("/core/metricas")).json()["pool"])
+        except (httpx.HTTPError, KeyError):
+            pass
+        await asyncio.sleep(INTERVALO_AMOSTRA_S)
+
+
+async def _nivel(cliente, consultas, concorrencia: int, pedidos: int, pedido):
+    semaforo = asyncio.Semaphore(concorrencia)
+    totais, primeiros, erros = [], [], 0
+
+    async def um(i: int):
+        nonlocal erros
+        async with semaforo:
+            try:
+                primeiro, total = await pedido(cliente, consultas[i % len(consultas)])
+            except (RuntimeError, httpx.HTTPError):
+                erros += 1
+                return
+        totais.append(total)
+        if primeiro is not None:
+            primeiros.append(primeiro)
+
+    amostras, parar = [], asyncio.Event()
+    amostrador = asyncio.create_task(_amostrar_pool(cliente, amostras, parar))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(um(i) for i in range(pedidos)))
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    await amostrador
+
+    max_uso = max((a["em_uso"] for a in amostras), default=0)
+    capacidade = amostras[0]["capacidade"] if amostras else 0
+    saturado = sum(a["saturado"] for a in amostras) / len(amostras) if amostras else 0
+    print(f"{concorrencia:>5}  {_percentis(totais)}  {_percentis(primeiros)}  "
+          f"{len(totais) / duracao:>7.2f}/s  {erros:>5}  {max_uso:>3}/{capacidade:<3} {saturado:>6.0%}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark da geração de relatórios")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--correio", default="admin@bot.com")
+    parser.add_argument("--senha", default="admin")
+    parser.add_argument("--niveis", default="1,4,16,64", help="Concorrências a testar")
+    parser.add_argument("--pedidos", type=int, default=64, help="Pedidos por nível")
+    parser.add_argument("--caminho", choices=["stream", "fila"], default="stream")
+    args = parser.parse_args()
+
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=300, limits=limites) as cliente:
+        await _entrar(cliente, args.correio, args.senha)
+        consultas = await _consultas(cliente, args.pedidos)
+        pedido = _pedido_stream if args.caminho == "stream" else _pedido_fila
+
+        print(f"Caminho '{args.caminho}', {args.pedidos} pedidos por nível, {len(consultas)} consultas")
+        print("conc.   total p50     p95      p99    1.º token p50  p95      p99    débito    erros  pool   saturado")
+        for concorrencia in (int(n) for n in args.niveis.split(",")):
+            await _nivel(cliente, consultas, concorrencia, args.pedidos, pedido)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Encaminhamento por latência com dois backends falsos (principal e alternativo):
+
+- A meio do teste o principal fica lento; mede a fração de pedidos que passa para o
+  alternativo e a latência média, com e sem o desvio pelas estatísticas recentes.
+- O principal começa a falhar; confirma que nenhum pedido falha (recurso ao alternativo).
+
+Uso: python -m benchmarks.bench_rotas [pedidos]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("LLM_BACKEND_PADRAO", "openai>local")
+os.environ.setdefault("LLM_ROTA_LATENCIA_MAX_S", "0.05")
+os.environ.setdefault("LLM_TENTATIVAS", "1")
+
+from app.services import backends_llm  # noqa: E402
+from app.services.backends_llm import ROTA_PADRAO, BackendGeracao, ResultadoGeracao, gerar_na_rota  # noqa: E402
+
+LATENCIA_NORMAL_S = 0.01
+LATENCIA_LENTA_S = 0.2
+
+
+class BackendFalso(BackendGeracao):
+    def __init__(self, nome: str):
+        super().__init__(nome, "falso", concorrencia=64)
+        self.latencia = LATENCIA_NORMAL_S
+        self.avariado = False
+
+    def _retentavel(self, exc: Exception) -> bool:
+        return True
+
+    async def _gerar(self, mensagens: list, **parametros) -> ResultadoGeracao:
+        await asyncio.sleep(self.latencia)
+        if self.avariado:
+            raise ConnectionError("avariado")
+        return ResultadoGeracao(texto="ok", modelo=self.modelo, backend=self.tipo)
+
+
+def _instalar(sondagem: float):
+    backends_llm._backends.clear()
+    backends_llm._estatisticas_rotas.clear()
+    backends_llm.settings.LLM_ROTA_SONDAGEM = sondagem
+    primario, alternativo = BackendFalso("openai"), BackendFalso("local")
+    backends_llm._backends.update({"openai": primario, "local": alternativo})
+    return primario, alternativo
+
+
+async def _lento(pedidos: int, sondagem: float):
+    primario, _ = _instalar(sondagem)
+    inicio = time.perf_counter()
+    for i in range(pedidos):
+        if i == pedidos // 4:
+            primario.latencia = LATENCIA_LENTA_S
+        await gerar_na_rota(None, [])
+    media = (time.perf_counter() - inicio) / pedidos
+    estatisticas = backends_llm._estatisticas_rotas[ROTA_PADRAO]
+    return estatisticas["servidos_alternativo"] / pedidos, media
+
+
+async def _avariado(pedidos: int):
+    primario, _ = _instalar(0.05)
+    primario.avariado = True
+    falhas = 0
+    for _ in range(pedidos):
+        try:
+            await gerar_na_rota(None, [])
+        except Exception:
+            falhas += 1
+    return falhas, backends_llm._estatisticas_rotas[ROTA_PADRAO]
+
+
+async def main(pedidos: int = 200):
+    # Sondagem 1.0: todos os pedidos vão primeiro ao principal (sem desvio)
+    _, media_sem = await _lento(pedidos, sondagem=1.0)
+    fracao, media_com = await _lento(pedidos, sondagem=0.05)
+    print(f"Principal lento: {fracao:.0%} dos pedidos no alternativo")
+    print(f"  latência média com desvio {media_com * 1000:.0f} ms, sem desvio {media_sem * 1000:.0f} ms")
+    assert media_com < media_sem / 2
+
+    falhas, estatisticas = await _avariado(pedidos)
+    print(f"Principal avariado: {falhas}/{pedidos} pedidos falhados, {estatisticas}")
+    assert falhas == 0
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:2]
+    asyncio.run(main(int(argumentos[0]) if argumentos else 200))
@@ -0,0 +1,133 @@
+"""
+Servidor falso compatível com POST /v1/chat/completions (normal e em streaming), para
+medir o caminho dos relatórios sem custos nem a variância da OpenAI.
+
+A latência segue uma distribuição log-normal (mediana e sigma) mais o tempo de emitir
+os tokens a um ritmo fixo; uma fração dos pedidos pode falhar com 500 ou 429.
+
+Uso:
+    python -m benchmarks.servidor_llm_falso --porta 8100 --mediana 1.5 --sigma 0.6 --taxa-erro 0.02
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=falsa uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FRASE = ("O paciente apresenta evolução clínica favorável, sem intercorrências relevantes, "
+         "mantendo a terapêutica prescrita e o acompanhamento em consulta. ").split()
+
+
+@dataclass
+class Configuracao:
+    mediana: float = 1.0            # Segundos até ao primeiro token (mediana)
+    sigma: float = 0.5              # Dispersão log-normal do primeiro token
+    tokens: int = 400               # Tokens por resposta
+    tokens_por_segundo: float = 80  # Ritmo de emissão
+    taxa_erro: float = 0.0          # Fração de respostas 500
+    taxa_429: float = 0.0           # Fração de respostas 429 (limite de pedidos)
+
+
+configuracao = Configuracao()
+app = FastAPI(title="Servidor LLM falso")
+
+
+def _latencia_inicial() -> float:
+    return random.lognormvariate(0, configuracao.sigma) * configuracao.mediana
+
+
+def _erro():
+    sorteio = random.random()
+    if sorteio < configuracao.taxa_429:
+        return JSONResponse({"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, status_code=429)
+    if sorteio < configuracao.taxa_429 + configuracao.taxa_erro:
+        return JSONResponse({"error": {"message": "Erro injetado", "type": "server_error"}}, status_code=500)
+    return None
+
+
+def _palavras(n: int):
+    return [FRASE[i % len(FRASE)] + " " for i in range(n)]
+
+
+def _uso(corpo: dict, n: int) -> dict:
+    prompt = sum(len(m.get("content", "")) for m in corpo.get("messages", [])) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": n, "total_tokens": prompt + n}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    corpo = await request.json()
+    n = min(configuracao.tokens, corpo.get("max_tokens") or configuracao.tokens)
+    identificador = f"chatcmpl-falso-{random.getrandbits(48):x}"
+    criado = int(time.time())
+    modelo = corpo.get("model", "falso")
+
+    erro = _erro()
+    if erro:
+        await asyncio.sleep(_latencia_inicial() / 4)
+        return erro
+
+    if not corpo.get("stream"):
+        await asyncio.sleep(_latencia_inicial() + n / configuracao.tokens_por_segundo)
+        return {
+            "id": identificador,
+            "object": "chat.completion",
+            "created": criado,
+            "model": modelo,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(_palavras(n))},
+                "finish_reason": "stop",
+            }],
+            "usage": _uso(corpo, n),
+        }
+
+    async def eventos():
+        await asyncio.sleep(_latencia_inicial())
+        for palavra in _palavras(n):
+            fragmento = {
+                "id": identificador,
+                "object": "chat.completion.chunk",
+                "created": criado,
+                "model": modelo,
+                "choices": [{"index": 0, "delta": {"content": palavra}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(fragmento)}\n\n"
+            await asyncio.sleep(1 / configuracao.tokens_por_segundo)
+        fim = {
+            "id": identificador,
+            "object": "chat.completion.chunk",
+            "created": criado,
+            "model": modelo,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": _uso(corpo, n),
+        }
+        yield f"data: {json.dumps(fim)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--porta", type=int, default=8100)
+    parser.add_argument("--mediana", type=float, default=configuracao.mediana)
+    parser.add_argument("--sigma", type=float, default=configuracao.sigma)
+    parser.add_argument("--tokens", type=int, default=configuracao.tokens)
+    parser.add_argument("--tokens-por-segundo", type=float, default=configuracao.tokens_por_segundo)
+    parser.add_argument("--taxa-erro", type=float, default=configuracao.taxa_erro)
+    parser.add_argument("--taxa-429", type=float, default=configuracao.taxa_429)
+    args = parser.parse_args()
+    for campo in vars(configuracao):
+        setattr(configuracao, campo, getattr(args, campo))
+    uvicorn.run(app, host="127.0.0.1", port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+# A configuração exige estas variáveis; os testes usam SQLite e um LLM falso
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("DB_SECRET_KEY", "chave-de-teste")
+os.environ.setdefault("JWT_SECRET_KEY", "chave-de-teste")
+os.environ.setdefault("OPENAI_API_KEY", "chave-de-teste")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.admissao import ControladorAdmissao  # noqa: E402
+from app.models.relatorio import Consulta, Paciente, Usuario  # noqa: E402
+
+
+async def popular(sessao, n: int, pacientes: Optional[int] = None) -> None:
+    """
+    Um médico, `pacientes` pacientes (por omissão um por cada cinco consultas) e `n`
+    consultas repartidas por eles. Usado pelos testes e pelos benchmarks.
+    """
+    agora = datetime.utcnow()
+    medico = Usuario(nome_completo="Dra. Benchmark", correio="medica@exemplo.ao", senha="x",
+                     telefone="923000000", especialidade="Cardiologia", role="Funcionario",
+                     data_criacao=agora, data_atualizacao=agora)
+    sessao.add(medico)
+    registos = [
+        Paciente(nome_completo=f"Paciente {i} da Silva", data_nascimento=date(1980, 1, 1), bi=f"{i:09d}LA0{i % 10}",
+                 sexo="F", correio=f"p{i}@exemplo.ao", telefone=f"92{i:07d}",
+                 endereco="Rua das Acácias, bloco 7. " * 20, data_criacao=agora, data_atualizacao=agora)
+        for i in range(pacientes or max(n // 5, 1))
+    ]
+    sessao.add_all(registos)
+    await sessao.flush()
+    sessao.add_all([
+        Consulta(paciente_id=registos[i % len(registos)].id, usuario_id=medico.id, tipo="Cardiologia",
+                 diagnostico="Hipertensão arterial controlada. " * 30, prescricoes="Losartan 50mg. " * 20,
+                 data_criacao=agora - timedelta(seconds=i), data_atualizacao=agora)
+        for i in range(n)
+    ])
+    await sessao.commit()
+
+
+def sem_admissao(workers: int) -> ControladorAdmissao:
+    """Controlo de admissão que nunca recusa: só os workers limitam a concorrência da fila."""
+    return ControladorAdmissao(
+        concorrencia=workers, max_fila=10 ** 6, max_por_usuario=10 ** 6, espera_alvo=float("inf")
+    )
@@ -0,0 +1,84 @@
+"""
+A fila de geração não pode prender ligações do pool enquanto o modelo gera. Com mais
+workers do que ligações (pool fixo, sem overflow), o LLM falso só responde quando todos
+os workers estão a gerar ao mesmo tempo: nesse instante nenhuma ligação pode estar em
+uso, e uma sessão aberta durante a chamada esgotaria o pool antes de lá chegarem todos.
+"""
+import asyncio
+import os
+import tempfile
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.database import Base
+from app.models.relatorio import Consulta
+from app.models.tarefa import CONCLUIDA, TarefaRelatorio
+from app.services.backends_llm import ResultadoGeracao
+from app.services.tarefas import FilaRelatorios
+from conftest import popular, sem_admissao
+
+TAMANHO_POOL = 4
+RONDAS = 3
+ESPERA_MAX_S = 5
+
+
+@pytest_asyncio.fixture
+async def engine():
+    caminho = os.path.join(tempfile.mkdtemp(), "test_pool.db")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{caminho}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=TAMANHO_POOL,
+        max_overflow=0,
+        pool_timeout=ESPERA_MAX_S,
+        connect_args={"timeout": 30},
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [TAMANHO_POOL, 4 * TAMANHO_POOL])
+async def test_geracao_nao_prende_ligacoes(engine, workers):
+    session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    n = RONDAS * workers
+    async with session_factory() as sessao:
+        # Um paciente por consulta: prompts diferentes, sem respostas da cache
+        await popular(sessao, n, pacientes=n)
+        consultas = (await sessao.execute(select(Consulta.id, Consulta.usuario_id))).all()
+
+    todos_a_gerar = asyncio.Barrier(workers)
+    enfileiradas = asyncio.Event()
+    em_uso = []
+
+    async def gerar(**dados) -> ResultadoGeracao:
+        async with asyncio.timeout(ESPERA_MAX_S):
+            await todos_a_gerar.wait()
+        await enfileiradas.wait()
+        em_uso.append(engine.pool.checkedout())  # Todos os workers a meio da chamada ao modelo
+        await asyncio.sleep(0.01)
+        return ResultadoGeracao(texto=f"Relatório de {dados['paciente_nome']}.", modelo="falso", backend="falso")
+
+    fila = FilaRelatorios(
+        gerar=gerar, session_factory=session_factory, workers=workers, admissao=sem_admissao(workers)
+    )
+    await fila.iniciar()
+    try:
+        async with session_factory() as sessao:
+            for consulta_id, usuario_id in consultas:
+                await fila.enfileirar(sessao, consulta_id, usuario_id, forcar=True)
+        enfileiradas.set()
+        await asyncio.wait_for(fila.aguardar(), 30)
+    finally:
+        await fila.parar()
+
+    async with session_factory() as sessao:
+        concluidas = (await sessao.execute(
+            select(TarefaRelatorio.id).where(TarefaRelatorio.estado == CONCLUIDA))).all()
+    assert len(concluidas) == n
+    assert em_uso == [0] * n